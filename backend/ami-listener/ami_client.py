@@ -0,0 +1,232 @@
+import re
+import time
+import asyncio
+from typing import Callable
+
+# Нужны только события записи разговоров; MixMonitor* относятся к классу call, UserEvent — к user
+INTERESTING_EVENTS = ('MixMonitorStart', 'MixMonitorStop', 'UserEvent')
+EVENT_MASK = 'call,user'
+CONNECT_TIMEOUT_SECONDS = 10
+RECONNECT_MIN_DELAY_SECONDS = 1
+RECONNECT_MAX_DELAY_SECONDS = 30
+# Если Asterisk молчит дольше, проверяем соединение Ping; нет ответа за такой же срок — переподключаемся
+PING_INTERVAL_SECONDS = 30
+READ_CHUNK_SIZE = 64 * 1024
+FRAME_END = b'\r\n\r\n'
+EVENT_PREFIX = b'Event: '
+RESPONSE_PREFIX = b'Response: '
+
+
+class AMIError(Exception):
+    """Asterisk отклонил вход или закрыл соединение"""
+
+
+def parse_frame(frame: bytes) -> dict:
+    """Разбирает сообщение AMI «Ключ: значение» в словарь"""
+    message = {}
+    for line in frame.decode('utf-8', errors='ignore').split('\r\n'):
+        if ':' in line:
+            key, value = line.split(':', 1)
+            message[key.strip()] = value.strip()
+    return message
+
+
+class FrameParser:
+    """
+    Инкрементальный разбор потока AMI поверх bytearray.
+    Куски из сокета дописываются в буфер, границы сообщений ищутся только в новых байтах,
+    прочитанная часть удаляется один раз на кусок. В словарь разбираются лишь ответы
+    на действия и события из event_types; остальные события только подсчитываются.
+    """
+
+    def __init__(self, event_types=INTERESTING_EVENTS):
+        self.event_types = {name.encode() for name in event_types}
+        self.buffer = bytearray()
+        self.scanned = 0
+        self.events_seen = 0
+
+    def feed(self, data: bytes) -> list:
+        """Добавляет кусок потока; возвращает разобранные сообщения, завершённые этим куском"""
+        buffer = self.buffer
+        buffer += data
+        messages = []
+        start = 0
+        # Разделитель мог начаться в конце предыдущего куска
+        search_from = max(self.scanned - len(FRAME_END) + 1, 0)
+        while True:
+            end = buffer.find(FRAME_END, search_from)
+            if end < 0:
+                break
+            if buffer.startswith(EVENT_PREFIX, start):
+                self.events_seen += 1
+                name_end = buffer.find(b'\r\n', start, end)
+                name = bytes(buffer[start + len(EVENT_PREFIX):end if name_end < 0 else name_end]).strip()
+                if name in self.event_types:
+                    messages.append(parse_frame(bytes(buffer[start:end])))
+            elif buffer.startswith(RESPONSE_PREFIX, start):
+                messages.append(parse_frame(bytes(buffer[start:end])))
+            start = end + len(FRAME_END)
+            search_from = start
+        if start:
+            del buffer[:start]
+        self.scanned = len(buffer)
+        return messages
+
+
+def extract_mapping(event: dict) -> tuple | None:
+    """(linkedid, имя файла записи, канал) из события MixMonitor/UserEvent или None"""
+    if event.get('Event') not in INTERESTING_EVENTS:
+        return None
+    linkedid = event.get('Linkedid')
+    # Имя файла приходит в разных полях в зависимости от события
+    filename = event.get('MixMonitorFilename') or event.get('Filename') or event.get('File') or ''
+    if not linkedid or not filename:
+        return None
+
+    # Только имя файла без пути, без повторного расширения
+    filename = filename.split('/')[-1]
+    filename = re.sub(r'\.(wav|WAV|gsm|GSM)$', '', filename)
+    if not filename.endswith(('.wav', '.mp3', '.gsm')):
+        filename += '.wav'
+    return linkedid, filename, event.get('Channel', '')
+
+
+class AMIListener:
+    """
+    Долгоживущий клиент Asterisk AMI на asyncio.
+    Держит одно авторизованное соединение, просит Asterisk присылать только события
+    классов EVENT_MASK (и, если разрешено, только INTERESTING_EVENTS через Filter),
+    при обрыве переподключается с экспоненциальной задержкой.
+    Найденные связки linkedid → файл передаются в on_mapping; состояние — в metrics.
+    """
+
+    def __init__(self, host: str, port: int, user: str, secret: str,
+                 on_mapping: Callable[[str, str, str], None]):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.secret = secret
+        self.on_mapping = on_mapping
+        self.metrics = {
+            'connected': False,
+            'connected_since': None,
+            'connects': 0,
+            'reconnects': 0,
+            'events_received': 0,
+            'events_matched': 0,
+            'last_event_at': None,
+            'last_error': None,
+        }
+
+    @staticmethod
+    def _remaining(deadline: float | None) -> float | None:
+        return None if deadline is None else deadline - time.monotonic()
+
+    async def _send(self, writer, action: str, **fields) -> None:
+        lines = [f'Action: {action}'] + [f'{key}: {value}' for key, value in fields.items()]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8'))
+        await writer.drain()
+
+    async def _connect(self):
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), CONNECT_TIMEOUT_SECONDS
+        )
+        try:
+            # Приветствие «Asterisk Call Manager/x.y» — одна строка
+            await asyncio.wait_for(reader.readline(), CONNECT_TIMEOUT_SECONDS)
+            await self._send(writer, 'Login', Username=self.user, Secret=self.secret, Events=EVENT_MASK)
+            response = parse_frame(await asyncio.wait_for(reader.readuntil(FRAME_END), CONNECT_TIMEOUT_SECONDS))
+            if response.get('Response') != 'Success':
+                raise AMIError(f"AMI login failed: {response.get('Message', response)}")
+            # Фильтр на стороне Asterisk; без права на Filter остаётся отбор по классам событий
+            for event_name in INTERESTING_EVENTS:
+                await self._send(writer, 'Filter', Operation='Add', Filter=f'Event: {event_name}')
+        except Exception:
+            writer.close()
+            raise
+        return reader, writer
+
+    def _handle(self, message: dict) -> None:
+        if 'Event' not in message:
+            if message.get('Response') == 'Error':
+                print(f"[AMI] {message.get('Message', 'Ошибка')}")
+            return
+        mapping = extract_mapping(message)
+        if mapping:
+            self.metrics['events_matched'] += 1
+            self.on_mapping(*mapping)
+
+    async def _listen(self, reader, writer, deadline: float | None) -> None:
+        parser = FrameParser()
+        ping_sent = False
+        while True:
+            remaining = self._remaining(deadline)
+            if remaining is not None and remaining <= 0:
+                return
+            wait = PING_INTERVAL_SECONDS if remaining is None else min(PING_INTERVAL_SECONDS, remaining)
+            try:
+                data = await asyncio.wait_for(reader.read(READ_CHUNK_SIZE), wait)
+            except asyncio.TimeoutError:
+                if self._remaining(deadline) is not None and self._remaining(deadline) <= 0:
+                    return
+                if ping_sent:
+                    raise AMIError(f'Нет ответа на Ping {PING_INTERVAL_SECONDS} с')
+                await self._send(writer, 'Ping')
+                ping_sent = True
+                continue
+            if not data:
+                raise AMIError('Asterisk закрыл соединение')
+            ping_sent = False
+            events_before = parser.events_seen
+            messages = parser.feed(data)
+            if parser.events_seen > events_before:
+                self.metrics['events_received'] += parser.events_seen - events_before
+                self.metrics['last_event_at'] = time.time()
+            for message in messages:
+                self._handle(message)
+
+    async def run(self, deadline: float | None = None) -> dict:
+        """
+        Слушает AMI до deadline (time.monotonic()) или бесконечно, если deadline не задан.
+        Ошибки соединения не прерывают работу: клиент ждёт и переподключается.
+        """
+        delay = RECONNECT_MIN_DELAY_SECONDS
+        while True:
+            remaining = self._remaining(deadline)
+            if remaining is not None and remaining <= 0:
+                break
+            writer = None
+            try:
+                reader, writer = await self._connect()
+                if self.metrics['connects']:
+                    self.metrics['reconnects'] += 1
+                self.metrics['connects'] += 1
+                self.metrics['connected'] = True
+                self.metrics['connected_since'] = time.time()
+                delay = RECONNECT_MIN_DELAY_SECONDS
+                await self._listen(reader, writer, deadline)
+                await self._send(writer, 'Logoff')
+            except (OSError, EOFError, asyncio.TimeoutError, asyncio.IncompleteReadError,
+                    asyncio.LimitOverrunError, AMIError) as e:
+                self.metrics['last_error'] = f'{type(e).__name__}: {e}'
+                print(f"[AMI] Соединение потеряно ({self.metrics['last_error']}), повтор через {delay} с")
+                remaining = self._remaining(deadline)
+                await asyncio.sleep(delay if remaining is None else max(min(delay, remaining), 0))
+                delay = min(delay * 2, RECONNECT_MAX_DELAY_SECONDS)
+            finally:
+                self.metrics['connected'] = False
+                self.metrics['connected_since'] = None
+                if writer is not None:
+                    writer.close()
+        return self.health()
+
+    def health(self) -> dict:
+        """Снимок метрик: подключён ли клиент, сколько событий, когда было последнее"""
+        now = time.time()
+        connected_since = self.metrics['connected_since']
+        last_event_at = self.metrics['last_event_at']
+        return {
+            **self.metrics,
+            'uptime_seconds': round(now - connected_since) if connected_since else 0,
+            'seconds_since_last_event': round(now - last_event_at) if last_event_at else None,
+        }
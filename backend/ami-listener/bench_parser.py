@@ -0,0 +1,88 @@
+import sys
+import time
+import random
+from ami_client import FrameParser, parse_frame, extract_mapping
+
+CHUNK_SIZE = 4096
+# Доля событий записи в потоке АТС без фильтра: основная масса — Newexten, VarSet, Newstate и т.п.
+SYNTHETIC_EVENTS = 50000
+MIXMONITOR_SHARE = 0.01
+
+
+def synthetic_stream(count: int = SYNTHETIC_EVENTS, seed: int = 1) -> bytes:
+    """Поток AMI, похожий на запись с АТС: разные события, редкие MixMonitorStart"""
+    rng = random.Random(seed)
+    frames = [b'Response: Success\r\nMessage: Authentication accepted\r\n\r\n']
+    for i in range(count):
+        linkedid = f'1768317461.{i}'
+        channel = f'SIP/{100 + i % 50}-0000{i:04x}'
+        if rng.random() < MIXMONITOR_SHARE:
+            frames.append(
+                f'Event: MixMonitorStart\r\nPrivilege: call,all\r\nChannel: {channel}\r\n'
+                f'Linkedid: {linkedid}\r\nUniqueid: {linkedid}\r\n'
+                f'MixMonitorFilename: /var/spool/asterisk/monitor/SIP-{100 + i % 50}-{i:08x}.wav\r\n\r\n'.encode()
+            )
+            continue
+        name = rng.choice(['Newexten', 'VarSet', 'Newstate', 'Hangup', 'DialBegin', 'BridgeEnter', 'RTCPSent'])
+        fields = ''.join(f'Variable{n}: {"x" * rng.randint(5, 40)}\r\n' for n in range(rng.randint(6, 18)))
+        frames.append(
+            f'Event: {name}\r\nPrivilege: dialplan,all\r\nChannel: {channel}\r\n'
+            f'Linkedid: {linkedid}\r\n{fields}\r\n'.encode()
+        )
+    return b''.join(frames)
+
+
+def legacy_parse(stream: bytes) -> int:
+    """Прежний разбор: decode каждого куска, str-буфер, split и словарь для каждого события"""
+    mappings = 0
+    buffer = ''
+    for offset in range(0, len(stream), CHUNK_SIZE):
+        buffer += stream[offset:offset + CHUNK_SIZE].decode('utf-8', errors='ignore')
+        while '\r\n\r\n' in buffer:
+            event_text, buffer = buffer.split('\r\n\r\n', 1)
+            event = {}
+            for line in event_text.split('\r\n'):
+                if ':' in line:
+                    key, value = line.split(':', 1)
+                    event[key.strip()] = value.strip()
+            if extract_mapping(event):
+                mappings += 1
+    return mappings
+
+
+def incremental_parse(stream: bytes, chunk_size: int = CHUNK_SIZE) -> int:
+    parser = FrameParser()
+    mappings = 0
+    for offset in range(0, len(stream), chunk_size):
+        for message in parser.feed(stream[offset:offset + chunk_size]):
+            if extract_mapping(message):
+                mappings += 1
+    return mappings
+
+
+def main() -> None:
+    """
+    Микробенчмарк разбора потока AMI: python bench_parser.py [файл с записанным потоком]
+    Записать поток можно, например, так: nc АТС 5038 < login.txt > ami.raw
+    Без файла используется синтетический поток из SYNTHETIC_EVENTS событий.
+    """
+    stream = open(sys.argv[1], 'rb').read() if len(sys.argv) > 1 else synthetic_stream()
+    print(f'Поток: {len(stream) / 1024 / 1024:.1f} МБ, кусками по {CHUNK_SIZE} байт')
+
+    results = {}
+    for name, parse in (('legacy', legacy_parse), ('incremental', incremental_parse)):
+        started = time.perf_counter()
+        mappings = parse(stream)
+        elapsed = time.perf_counter() - started
+        results[name] = elapsed
+        print(f'{name:12} {elapsed * 1000:8.1f} мс, {len(stream) / elapsed / 1024 / 1024:7.1f} МБ/с, связок {mappings}')
+    print(f"Ускорение: {results['legacy'] / results['incremental']:.1f}x")
+
+    # Проверка: разбиение потока на куски не должно влиять на результат
+    parsed = [parse_frame(frame) for frame in stream.split(b'\r\n\r\n') if frame]
+    expected = sum(1 for message in parsed if extract_mapping(message))
+    assert incremental_parse(stream, 7) == expected == legacy_parse(stream)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+import os
+import socket
+import asyncio
+from ami_client import AMIListener
+from mapping_store import MappingStore, run_listener
+
+
+def main() -> None:
+    """
+    Постоянный слушатель AMI вне облачной функции: python daemon.py
+    Переменные окружения те же, что у функции: DATABASE_URL, AMI_HOST, AMI_PORT, AMI_USERNAME, AMI_SECRET.
+    Соединение держится всё время работы процесса, при обрыве восстанавливается с задержкой.
+    """
+    store = MappingStore(
+        os.environ.get('DATABASE_URL') or os.environ['DATABASE_DSN'],
+        f'daemon:{socket.gethostname()}'
+    )
+    listener = AMIListener(
+        os.environ['AMI_HOST'],
+        int(os.environ.get('AMI_PORT', '5038')),
+        os.environ['AMI_USERNAME'],
+        os.environ['AMI_SECRET'],
+        store.save
+    )
+    try:
+        asyncio.run(run_listener(listener, store))
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
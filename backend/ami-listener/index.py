@@ -1,9 +1,11 @@
 import json
 import os
+import time
 import socket
-import psycopg2
-import re
-from datetime import datetime
+import asyncio
+from db import get_connection, release_connection
+from ami_client import AMIListener
+from mapping_store import MappingStore, load_health, run_listener
 
 def handler(event: dict, context) -> dict:
     """Слушатель AMI событий для сохранения маппинга linkedid → оригинальное имя файла
@@ -12,8 +14,10 @@ def handler(event: dict, context) -> dict:
     связку linkedid и оригинального имени файла записи в БД.
     
     Параметры:
-    - action=listen: Запуск прослушивания AMI (по умолчанию, ограничен таймаутом Cloud Function)
+    - action=listen: Запуск прослушивания AMI (по умолчанию, ограничен таймаутом Cloud Function);
+      соединение держится весь timeout и восстанавливается при обрыве
     - action=test: Тестовое подключение к AMI
+    - action=health: Состояние слушателей (запуски функции и постоянный процесс daemon.py)
     - timeout=60: Время прослушивания в секундах (макс 120 для Cloud Functions)
     """
     
@@ -105,139 +109,26 @@ def handler(event: dict, context) -> dict:
                 })
             }
     
-    # Основной режим: прослушивание событий
-    saved_count = 0
-    errors = []
-    events_received = 0
-    
-    try:
-        # Подключаемся к БД
-        conn = psycopg2.connect(db_dsn)
-        cursor = conn.cursor()
-        
-        # Подключаемся к AMI
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(listen_timeout)
-        sock.connect((ami_host, ami_port))
-        
-        # Читаем приветствие
-        greeting = sock.recv(1024).decode('utf-8')
-        
-        # Логин
-        login_cmd = (
-            f"Action: Login\r\n"
-            f"Username: {ami_user}\r\n"
-            f"Secret: {ami_secret}\r\n"
-            f"\r\n"
-        )
-        sock.sendall(login_cmd.encode('utf-8'))
-        
-        # Читаем ответ на логин
-        login_response = sock.recv(4096).decode('utf-8')
-        
-        if 'Success' not in login_response:
-            return {
-                'statusCode': 500,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
-                    'success': False,
-                    'error': 'AMI login failed',
-                    'response': login_response
-                })
-            }
-        
-        # Буфер для накопления данных
-        buffer = ""
-        
-        # Слушаем события
-        while True:
-            try:
-                data = sock.recv(4096).decode('utf-8', errors='ignore')
-                if not data:
-                    break
-                
-                buffer += data
-                
-                # Обрабатываем события (разделены двойным переводом строки)
-                while '\r\n\r\n' in buffer:
-                    event_text, buffer = buffer.split('\r\n\r\n', 1)
-                    events_received += 1
-                    
-                    # Парсим событие
-                    event = {}
-                    for line in event_text.split('\r\n'):
-                        if ':' in line:
-                            key, value = line.split(':', 1)
-                            event[key.strip()] = value.strip()
-                    
-                    # Ищем события MixMonitor (начало записи)
-                    # или UserEvent с информацией о файле записи
-                    if event.get('Event') in ['MixMonitorStart', 'MixMonitorStop', 'UserEvent']:
-                        linkedid = event.get('Linkedid')
-                        
-                        # Извлекаем имя файла из разных полей
-                        filename = (
-                            event.get('MixMonitorFilename') or 
-                            event.get('Filename') or 
-                            event.get('File') or
-                            ''
-                        )
-                        
-                        # Если есть linkedid и filename
-                        if linkedid and filename:
-                            # Извлекаем только имя файла без пути
-                            if '/' in filename:
-                                filename = filename.split('/')[-1]
-                            
-                            # Убираем расширение если есть дубликаты
-                            filename = re.sub(r'\.(wav|WAV|gsm|GSM)$', '', filename)
-                            
-                            # Добавляем расширение .wav если нет
-                            if not filename.endswith(('.wav', '.mp3', '.gsm')):
-                                filename += '.wav'
-                            
-                            try:
-                                # Сохраняем в БД (игнорируем дубликаты)
-                                cursor.execute('''
-                                    INSERT INTO call_recordings_mapping 
-                                    (linkedid, original_filename, channel, call_start)
-                                    VALUES (%s, %s, %s, NOW())
-                                    ON CONFLICT (linkedid) DO NOTHING
-                                ''', (linkedid, filename, event.get('Channel', '')))
-                                conn.commit()
-                                
-                                if cursor.rowcount > 0:
-                                    saved_count += 1
-                                    
-                            except Exception as e:
-                                errors.append(f'DB error for {linkedid}: {str(e)}')
-                                conn.rollback()
-                
-            except socket.timeout:
-                # Таймаут - это нормально, завершаем прослушивание
-                break
-            except Exception as e:
-                errors.append(f'Socket error: {str(e)}')
-                break
-        
-        # Закрываем соединения
-        sock.close()
-        cursor.close()
-        conn.close()
-        
+    if action == 'health':
+        conn = get_connection(db_dsn)
+        try:
+            listeners = load_health(conn)
+        finally:
+            release_connection(conn)
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({
-                'success': True,
-                'saved': saved_count,
-                'events_received': events_received,
-                'listen_duration': listen_timeout,
-                'errors': errors,
-                'message': f'Saved {saved_count} mappings from {events_received} events'
-            })
+            'body': json.dumps({'success': True, 'listeners': listeners}, ensure_ascii=False)
         }
-        
+    
+    # Основной режим: прослушивание событий в течение timeout секунд.
+    # Запуски по расписанию должны перекрываться (например, каждые 60 с с timeout=70):
+    # новый запуск подключается до того, как отключится предыдущий, дубли отсекает ON CONFLICT
+    store = MappingStore(db_dsn, 'slices')
+    listener = AMIListener(ami_host, ami_port, ami_user, ami_secret, store.save)
+    
+    try:
+        health = asyncio.run(run_listener(listener, store, time.monotonic() + listen_timeout))
     except Exception as e:
         return {
             'statusCode': 500,
@@ -245,8 +136,28 @@ def handler(event: dict, context) -> dict:
             'body': json.dumps({
                 'success': False,
                 'error': str(e),
-                'saved': saved_count,
-                'events_received': events_received,
-                'errors': errors
+                'saved': store.saved,
+                'events_received': listener.metrics['events_received'],
+                'errors': store.errors
             })
-        }
\ No newline at end of file
+        }
+    finally:
+        store.close()
+    
+    errors = list(store.errors)
+    if health['last_error']:
+        errors.append(f"AMI: {health['last_error']}")
+    
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps({
+            'success': True,
+            'saved': store.saved,
+            'events_received': health['events_received'],
+            'listen_duration': listen_timeout,
+            'errors': errors,
+            'health': health,
+            'message': f"Saved {store.saved} mappings from {health['events_received']} events"
+        }, ensure_ascii=False)
+    }
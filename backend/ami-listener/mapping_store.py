@@ -0,0 +1,229 @@
+import time
+import asyncio
+import psycopg2
+from psycopg2.extras import execute_values
+from db import get_connection, release_connection
+
+HEARTBEAT_INTERVAL_SECONDS = 15
+MAX_REPORTED_ERRORS = 20
+# Связки копятся в памяти и пишутся одной транзакцией: по 50 штук или раз в 2 секунды
+MAPPING_BATCH_SIZE = 50
+MAPPING_FLUSH_SECONDS = 2
+# Пока БД недоступна, держим не больше стольких связок
+MAX_PENDING_MAPPINGS = 5000
+
+
+class MappingStore:
+    """
+    Сохраняет связки linkedid → файл в call_recordings_mapping и пульс слушателя в ami_listener_health.
+    Соединение с БД берётся из пула и при обрыве заменяется, поэтому подходит и для постоянного процесса.
+    Связки пишутся пачками (MAPPING_BATCH_SIZE / MAPPING_FLUSH_SECONDS); при обрыве БД пачка
+    остаётся в памяти до следующей попытки.
+    """
+
+    def __init__(self, dsn: str, listener_id: str):
+        self.dsn = dsn
+        self.listener_id = listener_id
+        self.conn = None
+        self.saved = 0
+        self.errors = []
+        self.pending = {}
+        self.pending_since = None
+
+    def _error(self, message: str) -> None:
+        print(f'[AMI] {message}')
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(message)
+
+    def _cursor(self):
+        if self.conn is None:
+            self.conn = get_connection(self.dsn)
+        return self.conn.cursor()
+
+    def _failed(self, error: psycopg2.Error) -> None:
+        """Обрыв соединения — соединение заменяется; иначе откатывается транзакция"""
+        if isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+            release_connection(self.conn)
+            self.conn = None
+        else:
+            self.conn.rollback()
+
+    def _execute(self, query: str, args: tuple) -> tuple:
+        """Выполняет запрос и фиксирует транзакцию; возвращает (rowcount, первая строка)"""
+        try:
+            cur = self._cursor()
+            cur.execute(query, args)
+            row = cur.fetchone() if cur.description else None
+            rowcount = cur.rowcount
+            self.conn.commit()
+            cur.close()
+            return rowcount, row
+        except psycopg2.Error as e:
+            self._failed(e)
+            raise
+
+    def save(self, linkedid: str, filename: str, channel: str) -> None:
+        """Ставит связку в очередь; первая связка для linkedid побеждает, как и ON CONFLICT DO NOTHING"""
+        if linkedid in self.pending:
+            return
+        if len(self.pending) >= MAX_PENDING_MAPPINGS:
+            self._error(f'Очередь связок переполнена, {linkedid} не сохранён')
+            return
+        self.pending[linkedid] = (linkedid, filename, channel)
+        if self.pending_since is None:
+            self.pending_since = time.monotonic()
+        if len(self.pending) >= MAPPING_BATCH_SIZE:
+            self.flush()
+
+    def flush_if_due(self) -> None:
+        if self.pending_since is not None and time.monotonic() - self.pending_since >= MAPPING_FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self) -> None:
+        """Пишет накопленные связки одним INSERT ... ON CONFLICT DO NOTHING"""
+        if not self.pending:
+            return
+        rows = list(self.pending.values())
+        try:
+            cur = self._cursor()
+            inserted = execute_values(
+                cur,
+                '''
+                INSERT INTO call_recordings_mapping (linkedid, original_filename, channel, call_start)
+                VALUES %s
+                ON CONFLICT (linkedid) DO NOTHING
+                RETURNING linkedid
+                ''',
+                rows,
+                template='(%s, %s, %s, NOW())',
+                page_size=MAPPING_BATCH_SIZE,
+                fetch=True
+            )
+            self.conn.commit()
+            cur.close()
+        except psycopg2.Error as e:
+            self._failed(e)
+            if isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+                # Повторим со следующей пачкой
+                self._error(f'DB unavailable, {len(rows)} mappings kept for retry: {e}')
+                self.pending_since = time.monotonic()
+                return
+            # Пачку отклонила одна из строк (например, слишком длинное имя файла) — пишем по одной
+            self._error(f'DB error for batch of {len(rows)} mappings, saving one by one: {e}')
+            self._flush_rows_one_by_one(rows)
+            return
+        else:
+            self.saved += len(inserted)
+        self.pending = {}
+        self.pending_since = None
+
+    def _flush_rows_one_by_one(self, rows: list) -> None:
+        """Пишет связки по одной: теряются только строки, которые БД отклоняет"""
+        for position, row in enumerate(rows):
+            try:
+                rowcount, _ = self._execute(
+                    '''
+                    INSERT INTO call_recordings_mapping (linkedid, original_filename, channel, call_start)
+                    VALUES (%s, %s, %s, NOW())
+                    ON CONFLICT (linkedid) DO NOTHING
+                    ''',
+                    row
+                )
+                self.saved += max(rowcount, 0)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                # Соединение потеряно: несохранённые связки остаются в очереди
+                self._error(f'DB unavailable, {len(rows) - position} mappings kept for retry: {e}')
+                self.pending = {item[0]: item for item in rows[position:]}
+                self.pending_since = time.monotonic()
+                return
+            except psycopg2.Error as e:
+                self._error(f'DB error for mapping {row[0]}: {e}')
+        self.pending = {}
+        self.pending_since = None
+
+    def start(self) -> int:
+        """
+        Отмечает начало работы слушателя. Возвращает, сколько секунд AMI никто не слушал:
+        время с последнего пульса за вычетом интервала пульса (перекрывающиеся запуски дают 0).
+        """
+        _, row = self._execute(
+            '''
+            INSERT INTO ami_listener_health AS h (listener_id, started_at, last_heartbeat_at)
+            VALUES (%s, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+            ON CONFLICT (listener_id) DO UPDATE SET
+                started_at = CURRENT_TIMESTAMP,
+                last_heartbeat_at = CURRENT_TIMESTAMP,
+                last_gap_seconds = GREATEST(EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - h.last_heartbeat_at)::int - %s, 0),
+                gap_seconds_total = h.gap_seconds_total
+                    + GREATEST(EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - h.last_heartbeat_at)::int - %s, 0)
+            RETURNING last_gap_seconds
+            ''',
+            (self.listener_id, HEARTBEAT_INTERVAL_SECONDS, HEARTBEAT_INTERVAL_SECONDS)
+        )
+        gap = row[0] if row else 0
+        if gap:
+            print(f'[AMI] Перед запуском AMI не слушали {gap} с')
+        return gap
+
+    def heartbeat(self, health: dict) -> None:
+        try:
+            self._execute(
+                '''
+                UPDATE ami_listener_health SET
+                    connected = %s, last_heartbeat_at = CURRENT_TIMESTAMP,
+                    last_event_at = to_timestamp(%s)::timestamp,
+                    events_received = %s, events_matched = %s, mappings_saved = %s,
+                    reconnects = %s, last_error = %s
+                WHERE listener_id = %s
+                ''',
+                (health['connected'], health['last_event_at'], health['events_received'], health['events_matched'],
+                 self.saved, health['reconnects'], health['last_error'], self.listener_id)
+            )
+        except psycopg2.Error as e:
+            self._error(f'Health update failed: {e}')
+
+    def close(self) -> None:
+        self.flush()
+        release_connection(self.conn)
+        self.conn = None
+
+
+def load_health(conn) -> list:
+    """Состояние всех слушателей для action=health"""
+    cur = conn.cursor()
+    cur.execute(
+        '''
+        SELECT listener_id, connected, started_at, last_heartbeat_at, last_event_at,
+               events_received, events_matched, mappings_saved, reconnects, last_error,
+               last_gap_seconds, gap_seconds_total,
+               EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - last_heartbeat_at)::int AS heartbeat_age_seconds
+        FROM ami_listener_health
+        ORDER BY last_heartbeat_at DESC
+        '''
+    )
+    columns = [column[0] for column in cur.description]
+    rows = [dict(zip(columns, row)) for row in cur.fetchall()]
+    cur.close()
+    for row in rows:
+        for key in ('started_at', 'last_heartbeat_at', 'last_event_at'):
+            if row[key]:
+                row[key] = row[key].isoformat()
+    return rows
+
+
+async def run_listener(listener, store: MappingStore, deadline: float | None = None) -> dict:
+    """
+    Запускает слушатель; пока он работает, сбрасывает накопленные связки по MAPPING_FLUSH_SECONDS
+    и каждые HEARTBEAT_INTERVAL_SECONDS записывает пульс
+    """
+    store.start()
+    task = asyncio.create_task(listener.run(deadline))
+    next_heartbeat = time.monotonic() + HEARTBEAT_INTERVAL_SECONDS
+    while not task.done():
+        await asyncio.wait({task}, timeout=MAPPING_FLUSH_SECONDS)
+        store.flush_if_due()
+        if task.done() or time.monotonic() >= next_heartbeat:
+            store.flush()
+            store.heartbeat(listener.health())
+            next_heartbeat = time.monotonic() + HEARTBEAT_INTERVAL_SECONDS
+    return task.result()
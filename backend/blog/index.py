@@ -1,10 +1,7 @@
 import json
-import os
-import psycopg2
 from typing import Dict, Any, Optional
-
-def get_db_connection():
-    return psycopg2.connect(os.environ['DATABASE_URL'])
+from db import get_connection, release_connection
+from catalog_cache import get_catalog_versions, bump_catalog_version, make_etag, is_not_modified, cache_headers, not_modified_response
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -34,13 +31,17 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     }
     
     try:
-        conn = get_db_connection()
+        conn = get_connection()
         cursor = conn.cursor()
         
         if method == 'GET':
             params = event.get('queryStringParameters') or {}
             post_id = params.get('id')
             
+            etag = make_etag(f"blog:{post_id or 'list'}", get_catalog_versions(cursor, ['blog']))
+            if is_not_modified(event, etag):
+                return not_modified_response(etag)
+            
             if post_id:
                 cursor.execute('''
                     SELECT id, title, excerpt, category, icon, image, date, read_time, 
@@ -75,7 +76,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 
                 return {
                     'statusCode': 200,
-                    'headers': headers,
+                    'headers': {**headers, **cache_headers(etag)},
                     'body': json.dumps({'post': post}),
                     'isBase64Encoded': False
                 }
@@ -102,7 +103,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 
                 return {
                     'statusCode': 200,
-                    'headers': headers,
+                    'headers': {**headers, **cache_headers(etag)},
                     'body': json.dumps({'posts': posts}),
                     'isBase64Encoded': False
                 }
@@ -129,6 +130,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             ))
             
             post_id = cursor.fetchone()[0]
+            bump_catalog_version(cursor, 'blog')
             conn.commit()
             
             return {
@@ -178,6 +180,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 post_id
             ))
             
+            bump_catalog_version(cursor, 'blog')
             conn.commit()
             
             return {
@@ -200,6 +203,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 }
             
             cursor.execute('DELETE FROM blog_posts WHERE id = %s', (post_id,))
+            bump_catalog_version(cursor, 'blog')
             conn.commit()
             
             return {
@@ -227,4 +231,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if 'cursor' in locals():
             cursor.close()
         if 'conn' in locals():
-            conn.close()
+            release_connection(conn)
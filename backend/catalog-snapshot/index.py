@@ -0,0 +1,197 @@
+import json
+import os
+import gzip
+import base64
+import threading
+from typing import Dict, Any
+from db import get_connection, release_connection
+from catalog_cache import get_catalog_versions, make_etag, is_not_modified, cache_headers, not_modified_response
+
+SNAPSHOT_NAME = 'spa-boot'
+SNAPSHOT_SCOPES = ['brands', 'services', 'models', 'prices', 'settings']
+
+# Последний собранный снимок в памяти тёплого контейнера
+_snapshot: dict = {}
+_lock = threading.Lock()
+
+# Весь документ собирается одним запросом: PostgreSQL сам строит JSON
+SNAPSHOT_QUERY = """
+    WITH model_tags_agg AS (
+        SELECT cmt.model_id,
+               json_agg(json_build_object('id', mt.id, 'name', mt.name, 'color', mt.color) ORDER BY mt.name) AS tags
+        FROM car_model_tags cmt
+        JOIN model_tags mt ON cmt.tag_id = mt.id
+        GROUP BY cmt.model_id
+    ),
+    service_min_prices AS (
+        SELECT DISTINCT ON (s.id) s.id, s.title, s.description, s.icon, s.duration,
+               MIN(sp.base_price) AS min_price, sp.currency
+        FROM services s
+        JOIN service_prices sp ON s.id = sp.service_id
+        WHERE s.is_active = true
+        GROUP BY s.id, s.title, s.description, s.icon, s.duration, sp.currency
+        ORDER BY s.id
+    )
+    SELECT json_build_object(
+        'brands', COALESCE((
+            SELECT json_agg(json_build_object(
+                'id', b.id, 'name', b.name, 'slug', b.slug,
+                'logo', b.logo_url, 'description', b.description
+            ) ORDER BY b.name)
+            FROM brands b
+        ), '[]'::json),
+        'services', COALESCE((
+            SELECT json_agg(json_build_object(
+                'id', sv.id, 'title', sv.title, 'description', sv.description,
+                'icon', sv.icon, 'duration', sv.duration,
+                'price', 'от ' || replace(to_char(trunc(sv.min_price), 'FM999,999,999,990'), ',', ' ') || ' ' || sv.currency
+            ) ORDER BY sv.id)
+            FROM service_min_prices sv
+        ), '[]'::json),
+        'models', COALESCE((
+            SELECT json_agg(json_build_object(
+                'id', m.id, 'brand_id', m.brand_id, 'brand_name', b.name, 'name', m.name,
+                'year_from', m.year_from, 'year_to', m.year_to,
+                'tags', COALESCE(t.tags, '[]'::json)
+            ) ORDER BY b.name, m.name)
+            FROM car_models m
+            JOIN brands b ON m.brand_id = b.id
+            LEFT JOIN model_tags_agg t ON t.model_id = m.id
+        ), '[]'::json),
+        'tags', COALESCE((
+            SELECT json_agg(json_build_object('id', mt.id, 'name', mt.name, 'color', mt.color) ORDER BY mt.name)
+            FROM model_tags mt
+        ), '[]'::json),
+        'prices', COALESCE((
+            SELECT json_agg(json_build_object(
+                'id', sp.id, 'service_id', sp.service_id, 'brand_id', sp.brand_id,
+                'model_id', sp.model_id, 'base_price', sp.base_price, 'currency', sp.currency
+            ) ORDER BY sp.id)
+            FROM service_prices sp
+        ), '[]'::json),
+        'settings', json_build_object(
+            'maintenanceMode', COALESCE((
+                SELECT setting_value FROM site_settings WHERE setting_key = 'maintenance_mode'
+            ), 'false') = 'true',
+            'maintenanceEndTime', COALESCE((
+                SELECT setting_value FROM site_settings WHERE setting_key = 'maintenance_end_time'
+            ), '')
+        )
+    )::text
+"""
+
+
+def _load_snapshot(conn, etag: str) -> bytes:
+    """Берёт сжатый снимок из catalog_snapshots или пересобирает его, если версии каталога изменились"""
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT payload_gzip FROM catalog_snapshots WHERE name = %s AND etag = %s",
+        (SNAPSHOT_NAME, etag)
+    )
+    row = cur.fetchone()
+    if row:
+        cur.close()
+        return bytes(row[0])
+
+    cur.execute(SNAPSHOT_QUERY)
+    payload = cur.fetchone()[0].encode('utf-8')
+    payload_gzip = gzip.compress(payload, compresslevel=6)
+
+    cur.execute(
+        """
+        INSERT INTO catalog_snapshots (name, etag, payload_gzip, payload_size, built_at)
+        VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (name)
+        DO UPDATE SET etag = EXCLUDED.etag, payload_gzip = EXCLUDED.payload_gzip,
+                      payload_size = EXCLUDED.payload_size, built_at = CURRENT_TIMESTAMP
+        """,
+        (SNAPSHOT_NAME, etag, payload_gzip, len(payload))
+    )
+    conn.commit()
+    cur.close()
+    print(f"[SNAPSHOT] Снимок пересобран: {len(payload)} байт, gzip {len(payload_gzip)} байт")
+    return payload_gzip
+
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Отдаёт одним документом бренды, услуги, модели с тегами, цены и настройки для первой загрузки SPA
+    Args: event - HTTP запрос (поддерживает If-None-Match и Accept-Encoding: gzip), context - контекст выполнения
+    Returns: HTTP response со снимком каталога (сжатым, если клиент принимает gzip)
+    '''
+    method: str = event.get('httpMethod', 'GET')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': ''
+        }
+
+    if method != 'GET':
+        return {
+            'statusCode': 405,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Method not allowed'})
+        }
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'DATABASE_URL not configured'})
+        }
+
+    conn = get_connection(dsn)
+    try:
+        cur = conn.cursor()
+        etag = make_etag(SNAPSHOT_NAME, get_catalog_versions(cur, SNAPSHOT_SCOPES))
+        cur.close()
+
+        if is_not_modified(event, etag):
+            return not_modified_response(etag)
+
+        with _lock:
+            cached = _snapshot.get('payload_gzip') if _snapshot.get('etag') == etag else None
+        if cached is None:
+            cached = _load_snapshot(conn, etag)
+            with _lock:
+                _snapshot.update({'etag': etag, 'payload_gzip': cached})
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)})
+        }
+    finally:
+        release_connection(conn)
+
+    headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*',
+        'Vary': 'Accept-Encoding',
+        **cache_headers(etag)
+    }
+    request_headers = event.get('headers') or {}
+    accept_encoding = next((v for k, v in request_headers.items() if k.lower() == 'accept-encoding'), '') or ''
+
+    if 'gzip' in accept_encoding.lower():
+        return {
+            'statusCode': 200,
+            'headers': {**headers, 'Content-Encoding': 'gzip'},
+            'body': base64.b64encode(cached).decode('ascii'),
+            'isBase64Encoded': True
+        }
+
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': gzip.decompress(cached).decode('utf-8'),
+        'isBase64Encoded': False
+    }
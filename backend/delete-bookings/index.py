@@ -1,7 +1,7 @@
 import json
 import os
-import psycopg2
 from datetime import datetime
+from db import get_connection, release_connection
 
 def handler(event: dict, context) -> dict:
     '''Удаление заявок из базы данных по заданному периоду дат'''
@@ -82,7 +82,7 @@ def handler(event: dict, context) -> dict:
                 'body': json.dumps({'error': 'Ошибка конфигурации базы данных'})
             }
         
-        conn = psycopg2.connect(database_url)
+        conn = get_connection(database_url)
         cursor = conn.cursor()
         
         # Удаление заявок
@@ -96,7 +96,7 @@ def handler(event: dict, context) -> dict:
         
         conn.commit()
         cursor.close()
-        conn.close()
+        release_connection(conn)
         
         return {
             'statusCode': 200,
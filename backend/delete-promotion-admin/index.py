@@ -1,7 +1,8 @@
 import json
 import os
-import psycopg2
 from typing import Dict, Any
+from db import get_connection, release_connection
+from catalog_cache import bump_catalog_version
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -41,14 +42,15 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn = get_connection(os.environ['DATABASE_URL'])
     cursor = conn.cursor()
     
     cursor.execute('DELETE FROM promotions WHERE id = %s', (promotion_id,))
     
+    bump_catalog_version(cursor, 'promotions')
     conn.commit()
     cursor.close()
-    conn.close()
+    release_connection(conn)
     
     return {
         'statusCode': 200,
@@ -1,6 +1,7 @@
 import json
 import os
-import psycopg2
+from db import get_connection, release_connection
+from catalog_cache import bump_catalog_version
 
 def handler(event: dict, context) -> dict:
     '''API для удаления отзыва'''
@@ -45,14 +46,15 @@ def handler(event: dict, context) -> dict:
             }
         
         dsn = os.environ.get('DATABASE_URL')
-        conn = psycopg2.connect(dsn)
+        conn = get_connection(dsn)
         cur = conn.cursor()
         
         cur.execute("DELETE FROM reviews WHERE id = %s", (review_id,))
+        bump_catalog_version(cur, 'reviews')
         conn.commit()
         
         cur.close()
-        conn.close()
+        release_connection(conn)
         
         return {
             'statusCode': 200,
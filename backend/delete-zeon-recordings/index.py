@@ -1,7 +1,7 @@
 import json
 import os
-import psycopg2
 import paramiko
+from db import get_connection, release_connection
 
 def handler(event: dict, context) -> dict:
     '''Удаление записей звонков из БД и SFTP за определенный период
@@ -83,7 +83,7 @@ def handler(event: dict, context) -> dict:
                 })
             }
         
-        conn = psycopg2.connect(db_dsn)
+        conn = get_connection(db_dsn)
         cursor = conn.cursor()
         
         # Получаем записи для удаления
@@ -134,7 +134,7 @@ def handler(event: dict, context) -> dict:
         
         conn.commit()
         cursor.close()
-        conn.close()
+        release_connection(conn)
         
         result = {
             'success': True,
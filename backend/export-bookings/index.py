@@ -1,11 +1,11 @@
 import json
 import os
-import psycopg2
 from datetime import datetime
 from io import BytesIO
 import openpyxl
 from openpyxl.styles import Font, PatternFill, Alignment
 import base64
+from db import get_connection, release_connection
 
 def handler(event: dict, context) -> dict:
     '''Экспорт заявок в Excel файл с возможностью фильтрации по датам и статусу'''
@@ -52,7 +52,7 @@ def handler(event: dict, context) -> dict:
                 'body': json.dumps({'error': 'Ошибка конфигурации базы данных'})
             }
         
-        conn = psycopg2.connect(database_url)
+        conn = get_connection(database_url)
         cursor = conn.cursor()
         
         # Формируем запрос с фильтрами
@@ -75,7 +75,7 @@ def handler(event: dict, context) -> dict:
         columns = [desc[0] for desc in cursor.description]
         
         cursor.close()
-        conn.close()
+        release_connection(conn)
         
         # Создание Excel файла
         wb = openpyxl.Workbook()
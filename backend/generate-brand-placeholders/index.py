@@ -1,9 +1,10 @@
 import json
 import os
 from typing import Dict, Any
-import psycopg2
 from psycopg2.extras import RealDictCursor
 import boto3
+from db import get_connection, release_connection
+from catalog_cache import bump_catalog_version
 
 def generate_svg_placeholder(letter: str, brand_name: str) -> str:
     '''Генерация SVG заглушки с первой буквой бренда'''
@@ -59,7 +60,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY'],
     )
     
-    conn = psycopg2.connect(dsn)
+    conn = get_connection(dsn)
     cur = conn.cursor(cursor_factory=RealDictCursor)
     
     cur.execute("SELECT id, name, logo_url FROM brands WHERE logo_url IS NULL OR logo_url = ''")
@@ -98,9 +99,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         except Exception as e:
             errors.append(f'{brand_name}: {str(e)}')
     
+    bump_catalog_version(cur, 'brands')
     conn.commit()
     cur.close()
-    conn.close()
+    release_connection(conn)
     
     return {
         'statusCode': 200,
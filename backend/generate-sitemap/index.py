@@ -1,7 +1,7 @@
 import json
 import os
-import psycopg2
 from datetime import datetime
+from db import get_connection, release_connection
 
 def handler(event: dict, context) -> dict:
     '''Генерация sitemap.xml для всех страниц сайта'''
@@ -32,7 +32,7 @@ def handler(event: dict, context) -> dict:
         if not dsn:
             raise Exception('DATABASE_URL not configured')
         
-        conn = psycopg2.connect(dsn)
+        conn = get_connection(dsn)
         cur = conn.cursor()
         
         # Определяем схему
@@ -157,7 +157,7 @@ def handler(event: dict, context) -> dict:
   </url>''')
         
         cur.close()
-        conn.close()
+        release_connection(conn)
         
         # Формирование XML
         sitemap_xml = f'''<?xml version="1.0" encoding="UTF-8"?>
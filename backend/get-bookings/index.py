@@ -2,8 +2,8 @@ import json
 import os
 from typing import Dict, Any
 from datetime import datetime
-import psycopg2
 from psycopg2.extras import RealDictCursor
+from db import get_connection, release_connection
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -46,7 +46,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if not dsn:
             raise Exception('DATABASE_URL not configured')
         
-        conn = psycopg2.connect(dsn)
+        conn = get_connection(dsn)
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
         # Build query
@@ -95,7 +95,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             bookings.append(booking)
         
         cur.close()
-        conn.close()
+        release_connection(conn)
         
         return {
             'statusCode': 200,
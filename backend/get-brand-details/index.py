@@ -1,56 +1,11 @@
 import json
 import os
-import psycopg2
 from typing import Dict, Any
+from db import get_connection, release_connection
+from catalog_cache import read_through
 
-def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
-    '''
-    Business: Получает детальную информацию о бренде и его услугах с ценами
-    Args: event - HTTP запрос с параметром slug бренда, context - контекст выполнения
-    Returns: HTTP response с данными бренда и услугами
-    '''
-    method: str = event.get('httpMethod', 'GET')
-    
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
-        }
-    
-    if method != 'GET':
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Method not allowed'})
-        }
-    
-    params = event.get('queryStringParameters', {}) or {}
-    slug = params.get('slug', '')
-    
-    if not slug:
-        return {
-            'statusCode': 400,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Slug parameter is required'})
-        }
-    
-    dsn = os.environ.get('DATABASE_URL')
-    if not dsn:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'DATABASE_URL not configured'})
-        }
-    
-    conn = psycopg2.connect(dsn)
-    cur = conn.cursor()
-    
+
+def _load_brand_details(cur, slug: str) -> dict | None:
     cur.execute("""
         SELECT id, name, slug, logo_url, description
         FROM brands
@@ -58,15 +13,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """, (slug,))
     
     brand_row = cur.fetchone()
-    
     if not brand_row:
-        cur.close()
-        conn.close()
-        return {
-            'statusCode': 404,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Brand not found'})
-        }
+        return None
     
     brand = {
         'id': brand_row[0],
@@ -84,9 +32,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         ORDER BY s.id
     """, (brand['id'],))
     
-    services_rows = cur.fetchall()
     services = []
-    for row in services_rows:
+    for row in cur.fetchall():
         services.append({
             'id': row[0],
             'title': row[1],
@@ -103,9 +50,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         ORDER BY name
     """, (brand['id'],))
     
-    models_rows = cur.fetchall()
     models = []
-    for row in models_rows:
+    for row in cur.fetchall():
         year_range = ''
         if row[2] and row[3]:
             year_range = f"{row[2]}-{row[3]}"
@@ -120,15 +66,80 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'year_range': year_range
         })
     
+    return {
+        'brand': brand,
+        'services': services,
+        'models': models
+    }
+
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Получает детальную информацию о бренде и его услугах с ценами
+    Args: event - HTTP запрос с параметром slug бренда, context - контекст выполнения
+    Returns: HTTP response с данными бренда и услугами
+    '''
+    method: str = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': ''
+        }
+    
+    if method != 'GET':
+        return {
+            'statusCode': 405,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Method not allowed'})
+        }
+    
+    params = event.get('queryStringParameters', {}) or {}
+    slug = params.get('slug', '')
+    
+    if not slug:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Slug parameter is required'})
+        }
+    
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'DATABASE_URL not configured'})
+        }
+    
+    conn = get_connection(dsn)
+    cur = conn.cursor()
+    
+    details = read_through(
+        cur,
+        f'brand-details:{slug}',
+        ['brands', 'services', 'prices', 'models'],
+        lambda c: _load_brand_details(c, slug)
+    )
+    
     cur.close()
-    conn.close()
+    release_connection(conn)
+    
+    if not details:
+        return {
+            'statusCode': 404,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Brand not found'})
+        }
     
     return {
         'statusCode': 200,
         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({
-            'brand': brand,
-            'services': services,
-            'models': models
-        })
+        'body': json.dumps(details)
     }
\ No newline at end of file
@@ -1,7 +1,28 @@
 import json
 import os
-import psycopg2
 from typing import Dict, Any
+from db import get_connection, release_connection
+from catalog_cache import read_through, get_catalog_versions, make_etag, is_not_modified, cache_headers, not_modified_response
+
+
+def _load_brands(cur) -> list:
+    cur.execute("""
+        SELECT id, name, slug, logo_url, description
+        FROM brands
+        ORDER BY name
+    """)
+    
+    brands = []
+    for row in cur.fetchall():
+        brands.append({
+            'id': row[0],
+            'name': row[1],
+            'slug': row[2],
+            'logo': row[3],
+            'description': row[4]
+        })
+    return brands
+
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -38,31 +59,23 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'DATABASE_URL not configured'})
         }
     
-    conn = psycopg2.connect(dsn)
+    conn = get_connection(dsn)
     cur = conn.cursor()
     
-    cur.execute("""
-        SELECT id, name, slug, logo_url, description
-        FROM brands
-        ORDER BY name
-    """)
+    stamp = get_catalog_versions(cur, ['brands'])
+    etag = make_etag('brands', stamp)
+    if is_not_modified(event, etag):
+        cur.close()
+        release_connection(conn)
+        return not_modified_response(etag)
     
-    rows = cur.fetchall()
-    brands = []
-    for row in rows:
-        brands.append({
-            'id': row[0],
-            'name': row[1],
-            'slug': row[2],
-            'logo': row[3],
-            'description': row[4]
-        })
+    brands = read_through(cur, 'brands', ['brands'], _load_brands, stamp)
     
     cur.close()
-    conn.close()
+    release_connection(conn)
     
     return {
         'statusCode': 200,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **cache_headers(etag)},
         'body': json.dumps({'brands': brands})
     }
@@ -1,7 +1,7 @@
 import json
 import os
-import psycopg2
 from typing import Dict, Any
+from db import get_connection, release_connection
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -30,7 +30,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn = get_connection(os.environ['DATABASE_URL'])
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -60,7 +60,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         })
     
     cursor.close()
-    conn.close()
+    release_connection(conn)
     
     return {
         'statusCode': 200,
@@ -1,7 +1,8 @@
 import json
 import os
-import psycopg2
 from typing import Dict, Any
+from db import get_connection, release_connection
+from catalog_cache import get_catalog_versions, make_etag, is_not_modified, cache_headers, not_modified_response
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -30,9 +31,15 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn = get_connection(os.environ['DATABASE_URL'])
     cursor = conn.cursor()
     
+    etag = make_etag('promotions', get_catalog_versions(cursor, ['promotions']))
+    if is_not_modified(event, etag):
+        cursor.close()
+        release_connection(conn)
+        return not_modified_response(etag)
+    
     cursor.execute('''
         SELECT id, title, description, discount, old_price, new_price, 
                valid_until, icon, details
@@ -58,11 +65,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         })
     
     cursor.close()
-    conn.close()
+    release_connection(conn)
     
     return {
         'statusCode': 200,
-        'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+        'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json', **cache_headers(etag)},
         'body': json.dumps({'promotions': promotions}),
         'isBase64Encoded': False
     }
@@ -1,6 +1,7 @@
 import json
 import os
-import psycopg2
+from db import get_connection, release_connection
+from catalog_cache import get_catalog_versions, make_etag, is_not_modified, cache_headers, not_modified_response
 
 def handler(event: dict, context) -> dict:
     '''API для получения списка отзывов'''
@@ -26,9 +27,15 @@ def handler(event: dict, context) -> dict:
     
     try:
         dsn = os.environ.get('DATABASE_URL')
-        conn = psycopg2.connect(dsn)
+        conn = get_connection(dsn)
         cur = conn.cursor()
         
+        etag = make_etag('reviews', get_catalog_versions(cur, ['reviews']))
+        if is_not_modified(event, etag):
+            cur.close()
+            release_connection(conn)
+            return not_modified_response(etag)
+        
         cur.execute("""
             SELECT id, customer_name, rating, review_text, service_name, 
                    review_date, source, is_visible, created_at
@@ -53,13 +60,14 @@ def handler(event: dict, context) -> dict:
             })
         
         cur.close()
-        conn.close()
+        release_connection(conn)
         
         return {
             'statusCode': 200,
             'headers': {
                 'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
+                'Access-Control-Allow-Origin': '*',
+                **cache_headers(etag)
             },
             'body': json.dumps({'reviews': reviews}, default=str)
         }
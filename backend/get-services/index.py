@@ -1,7 +1,33 @@
 import json
 import os
-import psycopg2
 from typing import Dict, Any
+from db import get_connection, release_connection
+from catalog_cache import read_through, get_catalog_versions, make_etag, is_not_modified, cache_headers, not_modified_response
+
+
+def _load_services(cur) -> list:
+    cur.execute("""
+        SELECT DISTINCT ON (s.id) s.id, s.title, s.description, s.icon, s.duration, 
+               MIN(sp.base_price) as min_price, sp.currency
+        FROM services s
+        JOIN service_prices sp ON s.id = sp.service_id
+        WHERE s.is_active = true
+        GROUP BY s.id, s.title, s.description, s.icon, s.duration, sp.currency
+        ORDER BY s.id
+    """)
+    
+    services = []
+    for row in cur.fetchall():
+        services.append({
+            'id': row[0],
+            'title': row[1],
+            'description': row[2],
+            'icon': row[3],
+            'duration': row[4],
+            'price': f"от {int(row[5]):,} {row[6]}".replace(',', ' ')
+        })
+    return services
+
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -38,36 +64,24 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'DATABASE_URL not configured'})
         }
     
-    conn = psycopg2.connect(dsn)
+    conn = get_connection(dsn)
     cur = conn.cursor()
     
-    cur.execute("""
-        SELECT DISTINCT ON (s.id) s.id, s.title, s.description, s.icon, s.duration, 
-               MIN(sp.base_price) as min_price, sp.currency
-        FROM services s
-        JOIN service_prices sp ON s.id = sp.service_id
-        WHERE s.is_active = true
-        GROUP BY s.id, s.title, s.description, s.icon, s.duration, sp.currency
-        ORDER BY s.id
-    """)
+    scopes = ['services', 'prices']
+    stamp = get_catalog_versions(cur, scopes)
+    etag = make_etag('services', stamp)
+    if is_not_modified(event, etag):
+        cur.close()
+        release_connection(conn)
+        return not_modified_response(etag)
     
-    rows = cur.fetchall()
-    services = []
-    for row in rows:
-        services.append({
-            'id': row[0],
-            'title': row[1],
-            'description': row[2],
-            'icon': row[3],
-            'duration': row[4],
-            'price': f"от {int(row[5]):,} {row[6]}".replace(',', ' ')
-        })
+    services = read_through(cur, 'services', scopes, _load_services, stamp)
     
     cur.close()
-    conn.close()
+    release_connection(conn)
     
     return {
         'statusCode': 200,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **cache_headers(etag)},
         'body': json.dumps({'services': services})
     }
\ No newline at end of file
@@ -0,0 +1,103 @@
+import time
+import hashlib
+import threading
+from typing import Any, Callable
+
+# Кэш живёт в памяти тёплого контейнера; версия из catalog_versions
+# сверяется на каждом запросе, TTL страхует от правок мимо функций
+CACHE_TTL_SECONDS = 300
+MAX_CACHE_ENTRIES = 256
+
+# Браузер и CDN хранят ответ, но перепроверяют его по ETag на каждом запросе:
+# правки в админке видны сразу, а неизменившиеся данные приходят как 304
+PUBLIC_CACHE_CONTROL = 'public, max-age=0, must-revalidate'
+
+_cache: dict = {}
+_lock = threading.Lock()
+
+
+def get_catalog_versions(cur, scopes: list) -> tuple:
+    """Возвращает текущие версии областей каталога в порядке scopes"""
+    cur.execute(
+        "SELECT scope, version FROM catalog_versions WHERE scope = ANY(%s)",
+        (list(scopes),)
+    )
+    versions = {}
+    for row in cur.fetchall():
+        if isinstance(row, dict):
+            versions[row['scope']] = row['version']
+        else:
+            versions[row[0]] = row[1]
+    return tuple(versions.get(scope, 0) for scope in scopes)
+
+
+def bump_catalog_version(cur, *scopes: str) -> None:
+    """
+    Увеличивает версию областей каталога.
+    Вызывать в той же транзакции, что и изменение данных, до commit().
+    """
+    cur.execute(
+        """
+        INSERT INTO catalog_versions (scope, version, updated_at)
+        SELECT unnest(%s::text[]), 1, CURRENT_TIMESTAMP
+        ON CONFLICT (scope)
+        DO UPDATE SET version = catalog_versions.version + 1, updated_at = CURRENT_TIMESTAMP
+        """,
+        (list(scopes),)
+    )
+
+
+def make_etag(key: str, stamp: tuple) -> str:
+    """Сильный ETag ответа: ключ варианта ответа + версии областей каталога"""
+    digest = hashlib.sha1(f'{key}:{stamp}'.encode('utf-8')).hexdigest()[:24]
+    return f'"{digest}"'
+
+
+def is_not_modified(event: dict, etag: str) -> bool:
+    """Проверяет If-None-Match запроса (имена заголовков без учёта регистра)"""
+    headers = event.get('headers') or {}
+    value = next((v for k, v in headers.items() if k.lower() == 'if-none-match'), '') or ''
+    tags = [tag.strip().removeprefix('W/') for tag in value.split(',') if tag.strip()]
+    return '*' in tags or etag in tags
+
+
+def cache_headers(etag: str, cache_control: str = PUBLIC_CACHE_CONTROL) -> dict:
+    return {
+        'ETag': etag,
+        'Cache-Control': cache_control,
+        'Access-Control-Expose-Headers': 'ETag'
+    }
+
+
+def not_modified_response(etag: str, cache_control: str = PUBLIC_CACHE_CONTROL) -> dict:
+    return {
+        'statusCode': 304,
+        'headers': {'Access-Control-Allow-Origin': '*', **cache_headers(etag, cache_control)},
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+
+def read_through(cur, key: str, scopes: list, loader: Callable[[Any], Any], stamp: tuple | None = None) -> Any:
+    """
+    Отдаёт данные из кэша, если версии scopes не менялись и не истёк TTL,
+    иначе вызывает loader(cur) и сохраняет результат.
+    Уже прочитанные версии можно передать в stamp, чтобы не запрашивать их повторно.
+    """
+    if stamp is None:
+        stamp = get_catalog_versions(cur, scopes)
+    now = time.monotonic()
+
+    with _lock:
+        entry = _cache.get(key)
+    if entry and entry['stamp'] == stamp and now - entry['cached_at'] < CACHE_TTL_SECONDS:
+        return entry['value']
+
+    value = loader(cur)
+
+    with _lock:
+        _cache.pop(key, None)
+        if len(_cache) >= MAX_CACHE_ENTRIES:
+            _cache.pop(next(iter(_cache)))
+        _cache[key] = {'stamp': stamp, 'cached_at': now, 'value': value}
+    return value
@@ -0,0 +1,112 @@
+import os
+import time
+import threading
+import psycopg2
+import psycopg2.extensions
+
+# Соединения живут на уровне модуля и переживают вызовы в тёплом контейнере
+MAX_IDLE_CONNECTIONS = 4
+HEALTHCHECK_AFTER_SECONDS = 30
+MAX_CONNECTION_AGE_SECONDS = 600
+
+_idle: list = []
+_lock = threading.Lock()
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """Соединение psycopg2 с метками времени для пула"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool_dsn = None
+        self.created_at = time.monotonic()
+        self.released_at = self.created_at
+
+
+def _discard(conn) -> None:
+    try:
+        if not conn.closed:
+            conn.close()
+    except Exception:
+        pass
+
+
+def _is_alive(conn) -> bool:
+    """Проверяет соединение лёгким запросом (после простоя сервер мог его закрыть)"""
+    if conn.closed:
+        return False
+    try:
+        cur = conn.cursor()
+        cur.execute('SELECT 1')
+        cur.close()
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def get_connection(dsn: str | None = None):
+    """
+    Выдаёт соединение с БД из пула тёплого контейнера (по умолчанию DATABASE_URL).
+    Соединения, простоявшие дольше HEALTHCHECK_AFTER_SECONDS, проверяются SELECT 1
+    и при обрыве прозрачно заменяются новыми.
+    Вернуть соединение нужно через release_connection().
+    """
+    dsn = dsn or os.environ['DATABASE_URL']
+
+    while True:
+        with _lock:
+            idx = next((i for i, c in enumerate(_idle) if c.pool_dsn == dsn), None)
+            conn = _idle.pop(idx) if idx is not None else None
+        if conn is None:
+            break
+
+        now = time.monotonic()
+        if now - conn.created_at > MAX_CONNECTION_AGE_SECONDS:
+            _discard(conn)
+            continue
+        if now - conn.released_at > HEALTHCHECK_AFTER_SECONDS and not _is_alive(conn):
+            print('[DB] Соединение из пула устарело, переподключаемся')
+            _discard(conn)
+            continue
+        if conn.closed:
+            continue
+        return conn
+
+    conn = psycopg2.connect(
+        dsn,
+        connection_factory=PooledConnection,
+        keepalives=1,
+        keepalives_idle=30,
+        keepalives_interval=10,
+        keepalives_count=3
+    )
+    conn.pool_dsn = dsn
+    return conn
+
+
+def release_connection(conn) -> None:
+    """Откатывает незавершённую транзакцию и возвращает соединение в пул вместо закрытия"""
+    if conn is None or conn.closed:
+        return
+
+    try:
+        conn.rollback()
+        if conn.autocommit:
+            conn.autocommit = False
+    except psycopg2.Error:
+        _discard(conn)
+        return
+
+    if not isinstance(conn, PooledConnection):
+        _discard(conn)
+        return
+
+    conn.released_at = time.monotonic()
+    with _lock:
+        if conn in _idle:
+            return
+        if len(_idle) < MAX_IDLE_CONNECTIONS:
+            _idle.append(conn)
+            return
+    _discard(conn)
@@ -1,6 +1,21 @@
 import json
 import os
-import psycopg2
+from db import get_connection, release_connection
+from catalog_cache import read_through
+
+
+def _load_settings(cur) -> dict:
+    cur.execute("""
+        SELECT setting_key, setting_value 
+        FROM site_settings 
+        WHERE setting_key IN ('maintenance_mode', 'maintenance_end_time')
+    """)
+    
+    settings = {}
+    for row in cur.fetchall():
+        settings[row[0]] = row[1]
+    return settings
+
 
 def handler(event: dict, context) -> dict:
     '''Получение настроек сайта (режим обслуживания и др.)'''
@@ -30,18 +45,10 @@ def handler(event: dict, context) -> dict:
     conn = None
     try:
         dsn = os.environ.get('DATABASE_URL')
-        conn = psycopg2.connect(dsn)
+        conn = get_connection(dsn)
         cur = conn.cursor()
         
-        cur.execute("""
-            SELECT setting_key, setting_value 
-            FROM site_settings 
-            WHERE setting_key IN ('maintenance_mode', 'maintenance_end_time')
-        """)
-        
-        settings = {}
-        for row in cur.fetchall():
-            settings[row[0]] = row[1]
+        settings = read_through(cur, 'settings', ['settings'], _load_settings)
         
         cur.close()
         
@@ -68,4 +75,4 @@ def handler(event: dict, context) -> dict:
         }
     finally:
         if conn:
-            conn.close()
+            release_connection(conn)
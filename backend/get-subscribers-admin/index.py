@@ -1,7 +1,7 @@
 import json
 import os
-import psycopg2
 from typing import Dict, Any
+from db import get_connection, release_connection
 
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
@@ -23,7 +23,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
 
     method = event.get('httpMethod', 'GET')
     schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn = get_connection(os.environ['DATABASE_URL'])
     cursor = conn.cursor()
 
     if method == 'POST':
@@ -49,7 +49,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
 
         conn.commit()
         cursor.close()
-        conn.close()
+        release_connection(conn)
 
         return {
             'statusCode': 200,
@@ -62,7 +62,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     )
     rows = cursor.fetchall()
     cursor.close()
-    conn.close()
+    release_connection(conn)
 
     subscribers = [
         {
@@ -1,7 +1,7 @@
 import json
 import os
-import psycopg2
 from psycopg2.extras import RealDictCursor
+from db import get_connection, release_connection
 
 def handler(event: dict, context) -> dict:
     '''Получение логов синхронизации ZEON → FTP
@@ -38,7 +38,7 @@ def handler(event: dict, context) -> dict:
         }
     
     try:
-        conn = psycopg2.connect(db_dsn)
+        conn = get_connection(db_dsn)
         cursor = conn.cursor(cursor_factory=RealDictCursor)
         
         query_params = event.get('queryStringParameters', {}) or {}
@@ -129,7 +129,7 @@ def handler(event: dict, context) -> dict:
             stats['first_sync'] = stats['first_sync'].isoformat()
         
         cursor.close()
-        conn.close()
+        release_connection(conn)
         
         return {
             'statusCode': 200,
@@ -2,10 +2,11 @@ import json
 import os
 import re
 from typing import Dict, Any, List
-import psycopg2
 from psycopg2.extras import RealDictCursor
 import urllib.request
 import boto3
+from db import get_connection, release_connection
+from catalog_cache import bump_catalog_version
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''Автоматическая загрузка логотипов брендов из Car Logos Dataset (GitHub)'''
@@ -56,7 +57,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': f'Ошибка загрузки датасета: {str(e)}'})
         }
     
-    conn = psycopg2.connect(dsn)
+    conn = get_connection(dsn)
     cur = conn.cursor(cursor_factory=RealDictCursor)
     
     cur.execute("SELECT id, name FROM brands")
@@ -126,9 +127,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             skipped_count += 1
             errors.append(f'{brand_name}: {str(e)}')
     
+    bump_catalog_version(cur, 'brands')
     conn.commit()
     cur.close()
-    conn.close()
+    release_connection(conn)
     
     return {
         'statusCode': 200,
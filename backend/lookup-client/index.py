@@ -1,17 +1,230 @@
 import json
 import os
 import re
-import requests
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
 from requests.auth import HTTPBasicAuth
 from typing import Dict, Any
+from db import get_connection, release_connection
+from kontragent_index import is_index_ready, find_kontragent_key, remember_kontragent_phone, sync_kontragent_phones
+from reference_cache import get_reference
+from odata_1c import NULL_GUID, get_client, basic_getter, build_query, first_entity, eq, and_, guid, string
+
+SYNC_TIME_BUDGET_SECONDS = 20
+LOOKUP_DEADLINE_SECONDS = 8
+MAX_PARALLEL_REQUESTS = 8
+# Поиск номера в 1С при промахе индекса: сколько телефонов просматриваем и сколько ждём 1С
+PHONE_SCAN_MAX_ROWS = 2000
+PHONE_SCAN_SECONDS = 5
 
 
 def normalize_phone(phone: str) -> str:
     return re.sub(r'\D', '', phone or '')
 
 
+def _remaining(deadline: float) -> float:
+    return max(deadline - time.monotonic(), 0)
+
+
+def _get_json(odata_url: str, auth, path: str, timeout: float, deadline: float) -> dict | None:
+    """
+    GET к 1С через общий клиент тёплого контейнера с таймаутом не дольше остатка общего дедлайна;
+    None при ошибке, просрочке или открытом предохранителе
+    """
+    remaining = _remaining(deadline)
+    if remaining <= 0:
+        return None
+    try:
+        resp = get_client(odata_url, auth.username, auth.password).get(path, timeout=min(timeout, remaining))
+        return resp.json() if resp.ok else None
+    except Exception:
+        return None
+
+
+def _valid_key(key: str | None) -> bool:
+    return bool(key) and key != NULL_GUID
+
+
+def _load_client(odata_url: str, auth, kontragent_key: str, deadline: float) -> dict:
+    """ФИО и email контрагента"""
+    k = _get_json(odata_url, auth, build_query(f"Catalog_Контрагенты({guid(kontragent_key)})"), 10, deadline)
+    if not k:
+        return {}
+    last = (k.get('Фамилия') or '').strip()
+    first = (k.get('Имя') or '').strip()
+    middle = (k.get('Отчество') or '').strip()
+    client_data = {
+        'name': ' '.join(filter(None, [last, first, middle])) or k.get('Description', ''),
+        'email': ''
+    }
+    for ci in k.get('КонтактнаяИнформация', []):
+        if ci.get('Тип') == 'АдресЭлектроннойПочты':
+            client_data['email'] = ci.get('Представление', '')
+            break
+    return client_data
+
+
+def _load_reference_item(odata_url: str, auth, catalog: str, entity: str, key: str, deadline: float) -> dict | None:
+    """Марка или модель из кэша справочников 1С; если элемента там ещё нет — запрос к 1С"""
+    dsn = os.environ.get('DATABASE_URL')
+    if dsn:
+        try:
+            item = get_reference(dsn, catalog, odata_url, auth)['by_key'].get(key)
+            if item:
+                return item
+        except Exception as e:
+            print(f"[1C] Ошибка кэша справочников: {e}")
+    return _get_json(odata_url, auth, build_query(f"{entity}({guid(key)})"), 8, deadline)
+
+
+def _load_order_car(odata_url: str, auth, svod_key: str, deadline: float) -> tuple:
+    """СводныйРемонтныйЗаказ → Автомобиль_Key → карточка автомобиля; (auto_key, карточка) или (None, None)"""
+    svod = _get_json(
+        odata_url, auth,
+        build_query(f"Document_СводныйРемонтныйЗаказ({guid(svod_key)})", select=['Автомобиль_Key']),
+        10, deadline
+    )
+    auto_key = (svod or {}).get('Автомобиль_Key', '')
+    if not _valid_key(auto_key):
+        return None, None
+    return auto_key, _get_json(odata_url, auth, build_query(f"Catalog_Автомобили({guid(auto_key)})"), 10, deadline)
+
+
+def _find_car(executor, odata_url: str, auth, kontragent_key: str, deadline: float) -> tuple:
+    """
+    Ищет автомобиль через цепочку:
+    ЗаказНаряд (по контрагенту) → СводныйРемонтныйЗаказ_Key → Document_СводныйРемонтныйЗаказ → Автомобиль_Key.
+    Сводные заказы всех найденных заказ-нарядов запрашиваются одновременно, автомобиль берётся
+    из самого свежего заказа, марка и модель — тоже параллельно.
+    Возвращает (данные автомобиля, успели ли пройти цепочку до дедлайна).
+    """
+    orders = _get_json(
+        odata_url, auth,
+        build_query(
+            'Document_ЗаказНаряд',
+            filter=and_(eq('Контрагент_Key', guid(kontragent_key)), eq('Posted', 'true')),
+            select=['Ref_Key', 'Date', 'СводныйРемонтныйЗаказ_Key'],
+            orderby='Date desc',
+            top=10
+        ),
+        12, deadline
+    )
+    if orders is None:
+        return {}, _remaining(deadline) > 0
+
+    svod_keys = []
+    for doc in orders.get('value', []):
+        svod_key = doc.get('СводныйРемонтныйЗаказ_Key', '')
+        if _valid_key(svod_key) and svod_key not in svod_keys:
+            svod_keys.append(svod_key)
+    order_futures = [executor.submit(_load_order_car, odata_url, auth, key, deadline) for key in svod_keys]
+
+    auto_key, a = None, None
+    for future in order_futures:
+        try:
+            auto_key, a = future.result(timeout=_remaining(deadline))
+        except FuturesTimeout:
+            return {}, False
+        if a:
+            break
+    if not a:
+        return {}, _remaining(deadline) > 0
+
+    result = {
+        'avtomobil_key': auto_key,
+        'car_full_name': (a.get('НаименованиеПолное') or a.get('Description') or '').strip(),
+        'vin': (a.get('VIN') or a.get('НомерКузова') or '').strip(),
+        'plate_number': (a.get('НомерГаражный') or a.get('ГосНомер') or '').strip(),
+        'god_vypuska': str(a.get('ГодВыпуска') or '')[:4]
+    }
+    lookups = {}
+    if _valid_key(a.get('Марка_Key')):
+        lookups['car_brand'] = executor.submit(
+            _load_reference_item, odata_url, auth, 'car_brands', 'Catalog_МаркиАвтомобилей', a['Марка_Key'], deadline
+        )
+    if _valid_key(a.get('Модель_Key')):
+        lookups['car_model'] = executor.submit(
+            _load_reference_item, odata_url, auth, 'car_models', 'Catalog_МоделиАвтомобилей', a['Модель_Key'], deadline
+        )
+    complete = True
+    for field, future in lookups.items():
+        try:
+            item = future.result(timeout=_remaining(deadline))
+        except FuturesTimeout:
+            complete = False
+            continue
+        if item:
+            result[field] = (item.get('Description') or '').strip()
+        elif _remaining(deadline) <= 0:
+            complete = False
+    return result, complete
+
+
+def _scan_contacts(odata_url: str, auth, tail: str) -> str | None:
+    """
+    Поиск номера в телефонах контрагентов 1С, пока его нет в индексе: не больше PHONE_SCAN_MAX_ROWS строк
+    и PHONE_SCAN_SECONDS; полный просмотр справочника — работа синхронизации индекса
+    """
+    try:
+        item = first_entity(
+            basic_getter(odata_url, auth, timeout=15, deadline=time.monotonic() + PHONE_SCAN_SECONDS),
+            'Catalog_Контрагенты_КонтактнаяИнформация',
+            filter=eq('Тип', string('Телефон')), select=['Ref_Key', 'Тип', 'Представление'],
+            client_filter=lambda item: item.get('Тип') == 'Телефон'
+            and normalize_phone(item.get('Представление', '') or '')[-10:] == tail,
+            max_scan=PHONE_SCAN_MAX_ROWS
+        )
+    except TimeoutError as e:
+        print(f"[1C] lookup-client: {e}")
+        return None
+    return item.get('Ref_Key') if item else None
+
+
+def _is_admin(event: Dict[str, Any]) -> bool:
+    """Запрос с паролем администратора в X-Authorization (как в update-settings)"""
+    headers = event.get('headers') or {}
+    auth_header = headers.get('X-Authorization') or headers.get('x-authorization') or ''
+    admin_password = os.environ.get('ADMIN_PASSWORD', '')
+    return bool(admin_password) and auth_header.replace('Bearer ', '') == admin_password
+
+
+def _sync_index(odata_url: str, auth, params: dict) -> Dict[str, Any]:
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'success': False, 'error': 'DATABASE_URL not configured'})
+        }
+    try:
+        time_budget = min(float(params.get('budget') or SYNC_TIME_BUDGET_SECONDS), 240)
+    except ValueError:
+        time_budget = SYNC_TIME_BUDGET_SECONDS
+
+    conn = get_connection(dsn)
+    try:
+        stats = sync_kontragent_phones(conn, odata_url, auth, time_budget)
+    except Exception as e:
+        print(f"[1C] Ошибка синхронизации индекса телефонов: {e}")
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'success': False, 'error': str(e)}, ensure_ascii=False)
+        }
+    finally:
+        release_connection(conn)
+
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps({'success': True, **stats})
+    }
+
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
-    '''Ищет клиента в 1С по телефону, возвращает ФИО и автомобиль через цепочку ЗаказНаряд→СводныйРемонтныйЗаказ→Автомобиль'''
+    '''Ищет клиента в 1С по телефону, возвращает ФИО и автомобиль через цепочку ЗаказНаряд→СводныйРемонтныйЗаказ→Автомобиль.
+    ?action=sync — шаг фоновой синхронизации локального индекса телефонов (вызывается по расписанию,
+    только с паролем администратора в X-Authorization)'''
 
     if event.get('httpMethod') == 'OPTIONS':
         return {
@@ -19,7 +232,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Authorization',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
@@ -28,7 +241,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     params = event.get('queryStringParameters') or {}
     phone = params.get('phone', '').strip()
 
-    if not phone:
+    if params.get('action') == 'sync' and not _is_admin(event):
+        return {
+            'statusCode': 401,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'success': False, 'error': 'Unauthorized'})
+        }
+
+    if not phone and params.get('action') != 'sync':
         return {
             'statusCode': 400,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -49,17 +269,38 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     import urllib3
     urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
     auth = HTTPBasicAuth(user, password)
-    null_guid = '00000000-0000-0000-0000-000000000000'
+
+    if params.get('action') == 'sync':
+        return _sync_index(odata_url, auth, params)
 
     digits = normalize_phone(phone)
     tail = digits[-10:] if len(digits) >= 10 else digits
 
-    # 1. Ищем контрагента по телефону
+    # 1. Ищем контрагента по телефону в локальном индексе; пока индекс не построен или номера в нём нет
+    #    (клиент создан после последнего прохода) — в 1С, найденный номер добавляем в индекс
+    dsn = os.environ.get('DATABASE_URL')
     try:
-        resp = requests.get(
-            f"{odata_url}/Catalog_Контрагенты_КонтактнаяИнформация?$format=json&$top=2000",
-            auth=auth, headers={'Accept': 'application/json'}, timeout=15, verify=False
-        )
+        kontragent_key = None
+        index_ready = False
+        if dsn:
+            conn = get_connection(dsn)
+            try:
+                index_ready = is_index_ready(conn)
+                if index_ready:
+                    kontragent_key = find_kontragent_key(conn, phone)
+            finally:
+                release_connection(conn)
+        if not kontragent_key:
+            kontragent_key = _scan_contacts(odata_url, auth, tail)
+            if kontragent_key and index_ready:
+                conn = get_connection(dsn)
+                try:
+                    remember_kontragent_phone(conn, phone, kontragent_key)
+                except Exception as e:
+                    print(f"[1C] Номер не добавлен в локальный индекс: {e}")
+                    conn.rollback()
+                finally:
+                    release_connection(conn)
     except Exception as e:
         return {
             'statusCode': 200,
@@ -67,15 +308,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'found': False, 'error': f'Ошибка подключения к 1С: {str(e)}'})
         }
 
-    kontragent_key = None
-    if resp.ok:
-        for item in resp.json().get('value', []):
-            raw = item.get('Представление', '') or ''
-            item_tail = normalize_phone(raw)[-10:]
-            if item_tail and item_tail == tail:
-                kontragent_key = item.get('ObjectId') or item.get('Ref_Key')
-                break
-
     if not kontragent_key:
         return {
             'statusCode': 200,
@@ -83,99 +315,24 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'found': False})
         }
 
-    # 2. Получаем данные контрагента (ФИО, email)
-    client_data = {'kontragent_key': kontragent_key}
+    # 2. Данные контрагента и цепочка поиска автомобиля запрашиваются параллельно
+    #    в общем keep-alive сеансе с общим дедлайном; по истечении отдаём то, что успели собрать
+    deadline = time.monotonic() + LOOKUP_DEADLINE_SECONDS
+    executor = ThreadPoolExecutor(max_workers=MAX_PARALLEL_REQUESTS)
     try:
-        resp_k = requests.get(
-            f"{odata_url}/Catalog_Контрагенты(guid'{kontragent_key}')?$format=json",
-            auth=auth, headers={'Accept': 'application/json'}, timeout=10, verify=False
-        )
-        if resp_k.ok:
-            k = resp_k.json()
-            last = (k.get('Фамилия') or '').strip()
-            first = (k.get('Имя') or '').strip()
-            middle = (k.get('Отчество') or '').strip()
-            full_name = ' '.join(filter(None, [last, first, middle])) or k.get('Description', '')
-            client_data['name'] = full_name
-            client_data['email'] = ''
-            for ci in k.get('КонтактнаяИнформация', []):
-                if ci.get('Тип') == 'АдресЭлектроннойПочты':
-                    client_data['email'] = ci.get('Представление', '')
-                    break
-    except Exception:
-        pass
-
-    def resolve_car(auto_key: str) -> dict:
-        result = {}
-        if not auto_key or auto_key == null_guid:
-            return result
+        client_future = executor.submit(_load_client, odata_url, auth, kontragent_key, deadline)
+        car_data, car_complete = _find_car(executor, odata_url, auth, kontragent_key, deadline)
         try:
-            resp_a = requests.get(
-                f"{odata_url}/Catalog_Автомобили(guid'{auto_key}')?$format=json",
-                auth=auth, headers={'Accept': 'application/json'}, timeout=10, verify=False
-            )
-            if resp_a.ok:
-                a = resp_a.json()
-                result['avtomobil_key'] = auto_key
-                result['car_full_name'] = (a.get('НаименованиеПолное') or a.get('Description') or '').strip()
-                result['vin'] = (a.get('VIN') or a.get('НомерКузова') or '').strip()
-                result['plate_number'] = (a.get('НомерГаражный') or a.get('ГосНомер') or '').strip()
-                result['god_vypuska'] = str(a.get('ГодВыпуска') or '')[:4]
-                marka_key = a.get('Марка_Key')
-                model_key = a.get('Модель_Key')
-                if marka_key and marka_key != null_guid:
-                    try:
-                        rm = requests.get(
-                            f"{odata_url}/Catalog_МаркиАвтомобилей(guid'{marka_key}')?$format=json",
-                            auth=auth, headers={'Accept': 'application/json'}, timeout=8, verify=False
-                        )
-                        if rm.ok:
-                            result['car_brand'] = (rm.json().get('Description') or '').strip()
-                    except Exception:
-                        pass
-                if model_key and model_key != null_guid:
-                    try:
-                        rmod = requests.get(
-                            f"{odata_url}/Catalog_МоделиАвтомобилей(guid'{model_key}')?$format=json",
-                            auth=auth, headers={'Accept': 'application/json'}, timeout=8, verify=False
-                        )
-                        if rmod.ok:
-                            result['car_model'] = (rmod.json().get('Description') or '').strip()
-                    except Exception:
-                        pass
-        except Exception:
-            pass
-        return result
-
-    car_data = {}
-
-    # 3. Ищем автомобиль через цепочку:
-    #    ЗаказНаряд (по контрагенту) → СводныйРемонтныйЗаказ_Key → Document_СводныйРемонтныйЗаказ → Автомобиль_Key
-    try:
-        resp_zn = requests.get(
-            f"{odata_url}/Document_ЗаказНаряд?$format=json&$top=10&$orderby=Date desc"
-            f"&$filter=Контрагент_Key eq guid'{kontragent_key}' and Posted eq true"
-            f"&$select=Ref_Key,Date,СводныйРемонтныйЗаказ_Key",
-            auth=auth, headers={'Accept': 'application/json'}, timeout=12, verify=False
-        )
-        if resp_zn.ok:
-            for doc in resp_zn.json().get('value', []):
-                svod_key = doc.get('СводныйРемонтныйЗаказ_Key', '')
-                if not svod_key or svod_key == null_guid:
-                    continue
-                resp_svod = requests.get(
-                    f"{odata_url}/Document_СводныйРемонтныйЗаказ(guid'{svod_key}')?$format=json"
-                    f"&$select=Автомобиль_Key",
-                    auth=auth, headers={'Accept': 'application/json'}, timeout=10, verify=False
-                )
-                if resp_svod.ok:
-                    auto_key = resp_svod.json().get('Автомобиль_Key', '')
-                    if auto_key and auto_key != null_guid:
-                        car_data = resolve_car(auto_key)
-                        if car_data:
-                            break
-    except Exception:
-        pass
+            client_data = client_future.result(timeout=_remaining(deadline))
+        except FuturesTimeout:
+            client_data = None
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    partial = client_data is None or not car_complete
+    if partial:
+        print(f"[1C] lookup-client: дедлайн {LOOKUP_DEADLINE_SECONDS} с истёк, отдаём частичный результат")
+    client_data = client_data or {}
 
     return {
         'statusCode': 200,
@@ -185,6 +342,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'kontragent_key': kontragent_key,
             'name': client_data.get('name', ''),
             'email': client_data.get('email', ''),
-            'car': car_data
+            'car': car_data,
+            'partial': partial
         }, ensure_ascii=False)
     }
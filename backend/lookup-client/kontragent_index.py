@@ -0,0 +1,224 @@
+import re
+import time
+from psycopg2.extras import execute_values
+from odata_1c import basic_getter, build_query, iter_entities, eq, or_, and_, guid, string
+
+SYNC_NAME = 'kontragent_phones'
+PHONE_TAIL_LENGTH = 10
+SYNC_PAGE_SIZE = 500
+CONTACTS_BATCH_SIZE = 25
+
+
+def phone_tail(phone: str) -> str:
+    """Последние 10 цифр номера — по ним сравниваются +7, 8 и номера без кода страны"""
+    return re.sub(r'\D', '', phone or '')[-PHONE_TAIL_LENGTH:]
+
+
+def is_index_ready(conn) -> bool:
+    """Индекс готов, когда завершён хотя бы один полный проход по справочнику"""
+    cur = conn.cursor()
+    cur.execute("SELECT last_full_pass_at FROM kontragent_sync_state WHERE name = %s", (SYNC_NAME,))
+    row = cur.fetchone()
+    cur.close()
+    return bool(row and row[0])
+
+
+def find_kontragent_key(conn, phone: str) -> str | None:
+    """Ищет контрагента в локальном индексе по хвосту номера (индексный поиск по первичному ключу)"""
+    tail = phone_tail(phone)
+    if not tail:
+        return None
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT p.kontragent_key
+        FROM kontragent_phones p
+        LEFT JOIN kontragent_versions v ON v.kontragent_key = p.kontragent_key
+        WHERE p.phone_tail = %s
+        ORDER BY v.seen_at DESC NULLS LAST
+        LIMIT 1
+        """,
+        (tail,)
+    )
+    row = cur.fetchone()
+    cur.close()
+    return row[0] if row else None
+
+
+def find_kontragent_keys(conn, phones: list) -> dict:
+    """Пакетный поиск по индексу: {хвост номера: kontragent_key} одним запросом"""
+    tails = sorted({phone_tail(phone) for phone in phones} - {''})
+    if not tails:
+        return {}
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT DISTINCT ON (p.phone_tail) p.phone_tail, p.kontragent_key
+        FROM kontragent_phones p
+        LEFT JOIN kontragent_versions v ON v.kontragent_key = p.kontragent_key
+        WHERE p.phone_tail = ANY(%s)
+        ORDER BY p.phone_tail, v.seen_at DESC NULLS LAST
+        """,
+        (tails,)
+    )
+    keys = dict(cur.fetchall())
+    cur.close()
+    return keys
+
+
+def remember_kontragent_phone(conn, phone: str, kontragent_key: str) -> None:
+    """
+    Добавляет в индекс телефон контрагента, найденного в 1С мимо индекса
+    (клиент создан после последнего прохода), чтобы следующий поиск не ходил в 1С
+    """
+    tail = phone_tail(phone)
+    if not tail or not kontragent_key:
+        return
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO kontragent_phones (phone_tail, kontragent_key, presentation) VALUES (%s, %s, %s) ON CONFLICT DO NOTHING",
+        (tail, kontragent_key, (phone or '')[:500])
+    )
+    conn.commit()
+    cur.close()
+
+
+def _fetch_phones(get, keys: list) -> list:
+    """Телефоны изменившихся контрагентов пачками по CONTACTS_BATCH_SIZE"""
+    rows = []
+    for start in range(0, len(keys), CONTACTS_BATCH_SIZE):
+        batch = keys[start:start + CONTACTS_BATCH_SIZE]
+        items = iter_entities(
+            get, 'Catalog_Контрагенты_КонтактнаяИнформация',
+            filter=and_(eq('Тип', string('Телефон')), or_(*(eq('Ref_Key', guid(key)) for key in batch))),
+            select=['Ref_Key', 'Тип', 'Представление'],
+            client_filter=lambda item: item.get('Тип') == 'Телефон' and item.get('Ref_Key') in batch
+        )
+        for item in items:
+            raw = item.get('Представление', '') or ''
+            tail = phone_tail(raw)
+            if tail:
+                rows.append((tail, item['Ref_Key'], raw[:500]))
+    return rows
+
+
+def _sync_page(cur, get, after_key: str | None) -> tuple:
+    """
+    Обрабатывает одну страницу Catalog_Контрагенты после after_key (по возрастанию Ref_Key):
+    сверяет DataVersion с локальными и перечитывает телефоны только у новых и изменившихся контрагентов.
+    Страницы выбираются по ключу, а не по $skip: добавление и удаление контрагентов в 1С
+    между запусками не сдвигает позицию прохода.
+    Возвращает (число контрагентов на странице, последний Ref_Key страницы).
+    """
+    items = get(build_query(
+        'Catalog_Контрагенты', filter=f"Ref_Key gt {guid(after_key)}" if after_key else None,
+        select=['Ref_Key', 'DataVersion', 'DeletionMark'], orderby='Ref_Key', top=SYNC_PAGE_SIZE
+    )).get('value', [])
+    page = [
+        (item['Ref_Key'], str(item.get('DataVersion') or ''), bool(item.get('DeletionMark')))
+        for item in items if item.get('Ref_Key')
+    ]
+    if not page:
+        return 0, after_key
+
+    cur.execute(
+        """
+        SELECT t.key
+        FROM unnest(%s::text[], %s::text[]) AS t(key, data_version)
+        LEFT JOIN kontragent_versions v ON v.kontragent_key = t.key
+        WHERE v.data_version IS DISTINCT FROM t.data_version
+        """,
+        ([key for key, _, _ in page], [version for _, version, _ in page])
+    )
+    changed = [row[0] for row in cur.fetchall()]
+    deleted = {key for key, _, deletion_mark in page if deletion_mark}
+    to_fetch = [key for key in changed if key not in deleted]
+    phones = _fetch_phones(get, to_fetch) if to_fetch else []
+
+    if changed:
+        cur.execute("DELETE FROM kontragent_phones WHERE kontragent_key = ANY(%s)", (changed,))
+    if phones:
+        execute_values(
+            cur,
+            "INSERT INTO kontragent_phones (phone_tail, kontragent_key, presentation) VALUES %s ON CONFLICT DO NOTHING",
+            phones,
+            page_size=1000
+        )
+    execute_values(
+        cur,
+        """
+        INSERT INTO kontragent_versions (kontragent_key, data_version, seen_at) VALUES %s
+        ON CONFLICT (kontragent_key)
+        DO UPDATE SET data_version = EXCLUDED.data_version, seen_at = CURRENT_TIMESTAMP
+        """,
+        [(key, version) for key, version, _ in page],
+        template="(%s, %s, CURRENT_TIMESTAMP)",
+        page_size=1000
+    )
+    if deleted:
+        cur.execute("DELETE FROM kontragent_phones WHERE kontragent_key = ANY(%s)", (list(deleted),))
+
+    print(f"[1C] Индекс телефонов: страница после {after_key}, контрагентов {len(page)}, изменено {len(changed)}, телефонов {len(phones)}")
+    return len(items), page[-1][0]
+
+
+def sync_kontragent_phones(conn, odata_url: str, auth, time_budget: float = 20.0) -> dict:
+    """
+    Фоновая дельта-синхронизация индекса телефонов.
+    Проходит Catalog_Контрагенты страницами по Ref_Key, пока есть время; последний обработанный
+    ключ хранится в kontragent_sync_state, поэтому следующий запуск продолжает с того же места.
+    В конце полного прохода удаляет контрагентов, которых больше нет в 1С.
+    Каждая страница фиксируется отдельной транзакцией.
+    """
+    deadline = time.monotonic() + time_budget
+    get = basic_getter(odata_url, auth)
+    cur = conn.cursor()
+    cur.execute(
+        """
+        INSERT INTO kontragent_sync_state (name) VALUES (%s)
+        ON CONFLICT (name) DO UPDATE SET last_run_at = CURRENT_TIMESTAMP
+        RETURNING pass_offset, pass_last_key, pass_started_at
+        """,
+        (SYNC_NAME,)
+    )
+    offset, last_key, pass_started_at = cur.fetchone()
+    conn.commit()
+
+    pages = 0
+    completed = False
+    while time.monotonic() < deadline:
+        count, last_key = _sync_page(cur, get, last_key)
+        offset += count
+        pages += 1
+        if count < SYNC_PAGE_SIZE:
+            cur.execute("DELETE FROM kontragent_versions WHERE seen_at < %s RETURNING kontragent_key", (pass_started_at,))
+            removed = [row[0] for row in cur.fetchall()]
+            if removed:
+                cur.execute("DELETE FROM kontragent_phones WHERE kontragent_key = ANY(%s)", (removed,))
+            cur.execute(
+                """
+                UPDATE kontragent_sync_state
+                SET pass_offset = 0, pass_last_key = NULL, pass_started_at = CURRENT_TIMESTAMP,
+                    last_full_pass_at = CURRENT_TIMESTAMP, last_run_at = CURRENT_TIMESTAMP
+                WHERE name = %s
+                """,
+                (SYNC_NAME,)
+            )
+            conn.commit()
+            completed = True
+            print(f"[1C] Индекс телефонов: полный проход завершён, удалено контрагентов {len(removed)}")
+            break
+        cur.execute(
+            """
+            UPDATE kontragent_sync_state
+            SET pass_offset = %s, pass_last_key = %s, last_run_at = CURRENT_TIMESTAMP
+            WHERE name = %s
+            """,
+            (offset, last_key, SYNC_NAME)
+        )
+        conn.commit()
+
+    cur.execute("SELECT COUNT(*) FROM kontragent_phones")
+    phones_total = cur.fetchone()[0]
+    cur.close()
+    return {'pages': pages, 'offset': 0 if completed else offset, 'pass_completed': completed, 'phones': phones_total}
@@ -1,8 +1,9 @@
 import json
 import os
 from typing import Dict, Any
-import psycopg2
 from psycopg2.extras import RealDictCursor
+from db import get_connection, release_connection
+from catalog_cache import bump_catalog_version
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -30,7 +31,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if not dsn:
             raise Exception('DATABASE_URL not configured')
         
-        conn = psycopg2.connect(dsn)
+        conn = get_connection(dsn)
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
         # CREATE new brand
@@ -75,9 +76,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             )
             
             result = cur.fetchone()
+            bump_catalog_version(cur, 'brands')
             conn.commit()
             cur.close()
-            conn.close()
+            release_connection(conn)
             
             return {
                 'statusCode': 201,
@@ -126,7 +128,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             
             if not result:
                 cur.close()
-                conn.close()
+                release_connection(conn)
                 return {
                     'statusCode': 404,
                     'headers': {
@@ -136,9 +138,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'body': json.dumps({'error': 'Бренд не найден'})
                 }
             
+            bump_catalog_version(cur, 'brands')
             conn.commit()
             cur.close()
-            conn.close()
+            release_connection(conn)
             
             return {
                 'statusCode': 200,
@@ -174,7 +177,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             
             if not result:
                 cur.close()
-                conn.close()
+                release_connection(conn)
                 return {
                     'statusCode': 404,
                     'headers': {
@@ -184,9 +187,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'body': json.dumps({'error': 'Бренд не найден'})
                 }
             
+            bump_catalog_version(cur, 'brands')
             conn.commit()
             cur.close()
-            conn.close()
+            release_connection(conn)
             
             return {
                 'statusCode': 200,
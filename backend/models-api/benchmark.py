@@ -0,0 +1,95 @@
+"""
+Бенчмарк GET models-api: коррелированный подзапрос тегов против агрегированного JOIN.
+
+Запуск: DATABASE_URL=... python benchmark.py [1000 5000 10000 20000]
+
+Данные генерируются во временных таблицах сессии (pg_temp стоит первым в search_path
+и перекрывает рабочие brands/car_models/model_tags/car_model_tags), поэтому реальные
+данные не читаются и не изменяются.
+"""
+import os
+import sys
+import time
+import psycopg2
+from index import MODELS_WITH_TAGS_QUERY
+
+CORRELATED_QUERY = """
+    SELECT m.*, b.name as brand_name,
+           COALESCE(
+               (SELECT json_agg(json_build_object('id', mt.id, 'name', mt.name, 'color', mt.color))
+                FROM car_model_tags cmt
+                JOIN model_tags mt ON cmt.tag_id = mt.id
+                WHERE cmt.model_id = m.id),
+               '[]'::json
+           ) as tags
+    FROM car_models m
+    JOIN brands b ON m.brand_id = b.id
+    ORDER BY b.name, m.name
+"""
+
+BRANDS_COUNT = 150
+TAGS_COUNT = 8
+RUNS = 5
+
+
+def _prepare(cur, models_count: int) -> None:
+    cur.execute("DROP TABLE IF EXISTS pg_temp.car_model_tags, pg_temp.model_tags, pg_temp.car_models, pg_temp.brands")
+    cur.execute("CREATE TEMP TABLE brands (id SERIAL PRIMARY KEY, name VARCHAR(100))")
+    cur.execute("""
+        CREATE TEMP TABLE car_models (
+            id SERIAL PRIMARY KEY, brand_id INTEGER NOT NULL, name VARCHAR(255) NOT NULL,
+            year_from INTEGER, year_to INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("CREATE TEMP TABLE model_tags (id SERIAL PRIMARY KEY, name VARCHAR(100), color VARCHAR(20))")
+    cur.execute("CREATE TEMP TABLE car_model_tags (model_id INTEGER, tag_id INTEGER, PRIMARY KEY (model_id, tag_id))")
+    cur.execute("CREATE INDEX ON car_models(brand_id)")
+    cur.execute("CREATE INDEX ON car_model_tags(model_id)")
+
+    cur.execute("INSERT INTO brands (name) SELECT 'BRAND ' || g FROM generate_series(1, %s) g", (BRANDS_COUNT,))
+    cur.execute("INSERT INTO model_tags (name, color) SELECT 'Тег ' || g, '#3b82f6' FROM generate_series(1, %s) g", (TAGS_COUNT,))
+    cur.execute("""
+        INSERT INTO car_models (brand_id, name, year_from, year_to)
+        SELECT 1 + g %% %s, 'Model ' || g, 2000 + g %% 20, 2010 + g %% 15
+        FROM generate_series(1, %s) g
+    """, (BRANDS_COUNT, models_count))
+    cur.execute("""
+        INSERT INTO car_model_tags (model_id, tag_id)
+        SELECT m.id, 1 + (m.id + k) %% %s
+        FROM car_models m, generate_series(0, 1) k
+        ON CONFLICT DO NOTHING
+    """, (TAGS_COUNT,))
+    cur.execute("ANALYZE brands, car_models, model_tags, car_model_tags")
+
+
+def _measure(cur, query: str) -> float:
+    timings = []
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        cur.execute(query)
+        cur.fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def main() -> None:
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 5000, 10000, 20000]
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+
+    print(f"{'models':>8} | {'correlated, ms':>15} | {'join, ms':>10} | {'join, µs/model':>15}")
+    for size in sizes:
+        _prepare(cur, size)
+        correlated_ms = _measure(cur, CORRELATED_QUERY)
+        join_ms = _measure(cur, MODELS_WITH_TAGS_QUERY)
+        print(f"{size:>8} | {correlated_ms:>15.1f} | {join_ms:>10.1f} | {join_ms * 1000 / size:>15.1f}")
+
+    conn.rollback()
+    cur.close()
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -3,8 +3,60 @@ API для управления моделями автомобилей
 """
 import json
 import os
-import psycopg2
 from psycopg2.extras import RealDictCursor
+from db import get_connection, release_connection
+from catalog_cache import (
+    read_through, bump_catalog_version, get_catalog_versions,
+    make_etag, is_not_modified, cache_headers, not_modified_response
+)
+
+# Теги агрегируются одним GROUP BY и присоединяются к моделям,
+# а не коррелированным подзапросом на каждую строку car_models
+MODELS_WITH_TAGS_QUERY = """
+    SELECT m.*, b.name as brand_name, COALESCE(t.tags, '[]'::json) as tags
+    FROM car_models m
+    JOIN brands b ON m.brand_id = b.id
+    LEFT JOIN (
+        SELECT cmt.model_id,
+               json_agg(json_build_object('id', mt.id, 'name', mt.name, 'color', mt.color)) as tags
+        FROM car_model_tags cmt
+        JOIN model_tags mt ON cmt.tag_id = mt.id
+        GROUP BY cmt.model_id
+    ) t ON t.model_id = m.id
+    ORDER BY b.name, m.name
+"""
+
+MODELS_BY_BRAND_WITH_TAGS_QUERY = """
+    SELECT m.*, b.name as brand_name, COALESCE(t.tags, '[]'::json) as tags
+    FROM car_models m
+    JOIN brands b ON m.brand_id = b.id
+    LEFT JOIN (
+        SELECT cmt.model_id,
+               json_agg(json_build_object('id', mt.id, 'name', mt.name, 'color', mt.color)) as tags
+        FROM car_model_tags cmt
+        JOIN car_models cm ON cmt.model_id = cm.id
+        JOIN model_tags mt ON cmt.tag_id = mt.id
+        WHERE cm.brand_id = %s
+        GROUP BY cmt.model_id
+    ) t ON t.model_id = m.id
+    WHERE m.brand_id = %s
+    ORDER BY m.name
+"""
+
+
+def _load_tags(cur) -> list:
+    cur.execute("SELECT * FROM model_tags ORDER BY name")
+    return cur.fetchall()
+
+
+def _load_models(cur, brand_id) -> list:
+    if brand_id:
+        cur.execute(MODELS_BY_BRAND_WITH_TAGS_QUERY, (brand_id, brand_id))
+    else:
+        cur.execute(MODELS_WITH_TAGS_QUERY)
+    
+    return cur.fetchall()
+
 
 def handler(event: dict, context) -> dict:
     method = event.get('httpMethod', 'GET')
@@ -23,7 +75,7 @@ def handler(event: dict, context) -> dict:
     dsn = os.environ.get('DATABASE_URL')
     
     try:
-        conn = psycopg2.connect(dsn)
+        conn = get_connection(dsn)
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
         if method == 'GET':
@@ -31,57 +83,44 @@ def handler(event: dict, context) -> dict:
             
             # Если запрос тегов
             if params.get('tags') == 'true':
-                cur.execute("SELECT * FROM model_tags ORDER BY name")
-                tags = cur.fetchall()
+                stamp = get_catalog_versions(cur, ['models'])
+                etag = make_etag('tags', stamp)
+                if is_not_modified(event, etag):
+                    return not_modified_response(etag)
+                
+                tags = read_through(cur, 'tags', ['models'], _load_tags, stamp)
                 return {
                     'statusCode': 200,
                     'headers': {
                         'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
+                        'Access-Control-Allow-Origin': '*',
+                        **cache_headers(etag)
                     },
                     'body': json.dumps({'tags': tags}, default=str)
                 }
             
             # Иначе запрос моделей
             brand_id = params.get('brand_id')
+            cache_key = f'models:{brand_id or "all"}'
+            stamp = get_catalog_versions(cur, ['brands', 'models'])
+            etag = make_etag(cache_key, stamp)
+            if is_not_modified(event, etag):
+                return not_modified_response(etag)
             
-            if brand_id:
-                cur.execute("""
-                    SELECT m.*, b.name as brand_name,
-                           COALESCE(
-                               (SELECT json_agg(json_build_object('id', mt.id, 'name', mt.name, 'color', mt.color))
-                                FROM car_model_tags cmt
-                                JOIN model_tags mt ON cmt.tag_id = mt.id
-                                WHERE cmt.model_id = m.id),
-                               '[]'::json
-                           ) as tags
-                    FROM car_models m
-                    JOIN brands b ON m.brand_id = b.id
-                    WHERE m.brand_id = %s
-                    ORDER BY m.name
-                """, (brand_id,))
-            else:
-                cur.execute("""
-                    SELECT m.*, b.name as brand_name,
-                           COALESCE(
-                               (SELECT json_agg(json_build_object('id', mt.id, 'name', mt.name, 'color', mt.color))
-                                FROM car_model_tags cmt
-                                JOIN model_tags mt ON cmt.tag_id = mt.id
-                                WHERE cmt.model_id = m.id),
-                               '[]'::json
-                           ) as tags
-                    FROM car_models m
-                    JOIN brands b ON m.brand_id = b.id
-                    ORDER BY b.name, m.name
-                """)
-            
-            models = cur.fetchall()
+            models = read_through(
+                cur,
+                cache_key,
+                ['brands', 'models'],
+                lambda c: _load_models(c, brand_id),
+                stamp
+            )
             
             return {
                 'statusCode': 200,
                 'headers': {
                     'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
+                    'Access-Control-Allow-Origin': '*',
+                    **cache_headers(etag)
                 },
                 'body': json.dumps({'models': models}, default=str)
             }
@@ -119,6 +158,7 @@ def handler(event: dict, context) -> dict:
                     ON CONFLICT DO NOTHING
                 """, (model_id, tag_id))
             
+            bump_catalog_version(cur, 'models')
             conn.commit()
             
             return {
@@ -167,6 +207,7 @@ def handler(event: dict, context) -> dict:
                         ON CONFLICT DO NOTHING
                     """, (model_id, tag_id))
             
+            bump_catalog_version(cur, 'models')
             conn.commit()
             
             return {
@@ -232,6 +273,7 @@ def handler(event: dict, context) -> dict:
                         cur.execute("DELETE FROM car_models WHERE id = %s", (old_id,))
                         deleted_count += 1
                 
+                bump_catalog_version(cur, 'models', 'prices')
                 conn.commit()
                 
                 return {
@@ -252,6 +294,7 @@ def handler(event: dict, context) -> dict:
                 }
             
             cur.execute("DELETE FROM car_models WHERE id = %s", (model_id,))
+            bump_catalog_version(cur, 'models', 'prices')
             conn.commit()
             
             return {
@@ -285,4 +328,4 @@ def handler(event: dict, context) -> dict:
         if 'cur' in locals():
             cur.close()
         if 'conn' in locals():
-            conn.close()
\ No newline at end of file
+            release_connection(conn)
\ No newline at end of file
@@ -6,8 +6,149 @@ import os
 import csv
 import io
 import base64
-import psycopg2
 from psycopg2.extras import RealDictCursor
+from db import get_connection, release_connection
+from catalog_cache import bump_catalog_version
+
+
+def _iter_rows(file_data: bytes, file_type: str):
+    """Отдаёт строки файла по одной: (номер строки, name, year_from, year_to, tags)"""
+    if file_type == 'csv':
+        text_stream = io.TextIOWrapper(io.BytesIO(file_data), encoding='utf-8-sig', newline='')
+        for row_no, row in enumerate(csv.DictReader(text_stream), start=1):
+            tags_raw = row.get('tags') or row.get('Tags') or row.get('Теги') or ''
+            yield (
+                row_no,
+                row.get('name') or row.get('Name') or row.get('Название'),
+                row.get('year_from') or row.get('Year From') or row.get('Год с'),
+                row.get('year_to') or row.get('Year To') or row.get('Год по'),
+                tags_raw
+            )
+    else:
+        data = json.loads(file_data)
+        items = data if isinstance(data, list) else data.get('models', [])
+        for row_no, item in enumerate(items, start=1):
+            if not isinstance(item, dict):
+                yield row_no, None, None, None, []
+                continue
+            yield row_no, item.get('name'), item.get('year_from'), item.get('year_to'), item.get('tags') or []
+
+
+def _year(value) -> int | None:
+    if value is None or str(value).strip() == '':
+        return None
+    year = int(str(value).strip())
+    if year < 1900 or year > 2100:
+        raise ValueError(f'год {year} вне диапазона')
+    return year
+
+
+def _stage_rows(rows) -> tuple:
+    """
+    Проверяет строки и пишет их в CSV-буферы для COPY: модели и пары (название модели, тег).
+    Возвращает (буфер моделей, буфер тегов, построчные ошибки).
+    """
+    models_buffer = io.StringIO()
+    tags_buffer = io.StringIO()
+    models_writer = csv.writer(models_buffer)
+    tags_writer = csv.writer(tags_buffer)
+    errors = []
+    
+    for row_no, name, year_from, year_to, tags in rows:
+        name = name.strip() if isinstance(name, str) else None
+        if not name:
+            errors.append({'row': row_no, 'name': None, 'error': 'Не указано название модели'})
+            continue
+        if len(name) > 255:
+            errors.append({'row': row_no, 'name': name[:50], 'error': 'Название длиннее 255 символов'})
+            continue
+        try:
+            year_from = _year(year_from)
+            year_to = _year(year_to)
+        except ValueError as e:
+            errors.append({'row': row_no, 'name': name, 'error': f'Некорректный год: {e}'})
+            continue
+        
+        if isinstance(tags, str):
+            tags = tags.split(',')
+        tag_names = {str(tag).strip() for tag in tags if str(tag).strip()}
+        if any(len(tag) > 100 for tag in tag_names):
+            errors.append({'row': row_no, 'name': name, 'error': 'Название тега длиннее 100 символов'})
+            continue
+        
+        models_writer.writerow([row_no, name, year_from, year_to])
+        for tag in tag_names:
+            tags_writer.writerow([name, tag])
+    
+    models_buffer.seek(0)
+    tags_buffer.seek(0)
+    return models_buffer, tags_buffer, errors
+
+
+def _merge_models(cur, brand_id: int, models_buffer, tags_buffer) -> tuple:
+    """
+    Загружает подготовленные строки через COPY во временные таблицы и сливает их
+    в car_models, model_tags и car_model_tags несколькими set-based запросами.
+    Повторы названия в файле схлопываются: применяется последняя строка.
+    Возвращает (добавлено, обновлено).
+    """
+    cur.execute("""
+        CREATE TEMP TABLE upload_models (
+            row_no INTEGER PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            year_from INTEGER,
+            year_to INTEGER
+        ) ON COMMIT DROP
+    """)
+    cur.execute("CREATE TEMP TABLE upload_model_tags (model_name VARCHAR(255) NOT NULL, tag_name VARCHAR(100) NOT NULL) ON COMMIT DROP")
+    cur.copy_expert("COPY upload_models (row_no, name, year_from, year_to) FROM STDIN WITH (FORMAT csv)", models_buffer)
+    cur.copy_expert("COPY upload_model_tags (model_name, tag_name) FROM STDIN WITH (FORMAT csv)", tags_buffer)
+    
+    # Последняя строка с тем же названием перекрывает предыдущие
+    cur.execute("""
+        DELETE FROM upload_models u
+        USING upload_models later
+        WHERE later.name = u.name AND later.row_no > u.row_no
+    """)
+    
+    # Уникального индекса на (brand_id, name) нет, поэтому от параллельной загрузки защищаемся блокировкой
+    cur.execute("LOCK TABLE car_models IN SHARE ROW EXCLUSIVE MODE")
+    
+    cur.execute("""
+        UPDATE car_models m
+        SET year_from = u.year_from, year_to = u.year_to, updated_at = CURRENT_TIMESTAMP
+        FROM upload_models u
+        WHERE m.brand_id = %s AND m.name = u.name
+          AND (m.year_from IS DISTINCT FROM u.year_from OR m.year_to IS DISTINCT FROM u.year_to)
+    """, (brand_id,))
+    updated = cur.rowcount
+    
+    cur.execute("""
+        INSERT INTO car_models (brand_id, name, year_from, year_to)
+        SELECT %s, u.name, u.year_from, u.year_to
+        FROM upload_models u
+        WHERE NOT EXISTS (SELECT 1 FROM car_models m WHERE m.brand_id = %s AND m.name = u.name)
+    """, (brand_id, brand_id))
+    added = cur.rowcount
+    
+    cur.execute("""
+        INSERT INTO model_tags (name)
+        SELECT DISTINCT tag_name FROM upload_model_tags
+        ON CONFLICT (name) DO NOTHING
+    """)
+    
+    # Теги строк-повторов тоже привязываются: они относятся к той же модели
+    cur.execute("""
+        INSERT INTO car_model_tags (model_id, tag_id)
+        SELECT DISTINCT m.id, mt.id
+        FROM upload_model_tags ut
+        JOIN model_tags mt ON mt.name = ut.tag_name
+        JOIN car_models m ON m.brand_id = %s AND m.name = ut.model_name
+        ON CONFLICT (model_id, tag_id) DO NOTHING
+    """, (brand_id,))
+    
+    return added, updated
+
 
 def handler(event: dict, context) -> dict:
     method = event.get('httpMethod', 'POST')
@@ -45,91 +186,23 @@ def handler(event: dict, context) -> dict:
                 'body': json.dumps({'error': 'file и brand_id обязательны'})
             }
         
-        # Decode base64 file
-        file_data = base64.b64decode(file_content)
-        file_text = file_data.decode('utf-8')
-        
-        models = []
-        
-        if file_type == 'csv':
-            csv_reader = csv.DictReader(io.StringIO(file_text))
-            for row in csv_reader:
-                tags_raw = row.get('tags') or row.get('Tags') or row.get('Теги') or ''
-                tags = [t.strip() for t in tags_raw.split(',') if t.strip()] if tags_raw else []
-                
-                models.append({
-                    'name': row.get('name') or row.get('Name') or row.get('Название'),
-                    'year_from': row.get('year_from') or row.get('Year From') or row.get('Год с'),
-                    'year_to': row.get('year_to') or row.get('Year To') or row.get('Год по'),
-                    'tags': tags
-                })
-        elif file_type == 'json':
-            data = json.loads(file_text)
-            models = data if isinstance(data, list) else data.get('models', [])
-        else:
+        if file_type not in ('csv', 'json'):
             return {
                 'statusCode': 400,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                 'body': json.dumps({'error': 'Поддерживаются только CSV и JSON'})
             }
         
-        conn = psycopg2.connect(dsn)
-        cur = conn.cursor(cursor_factory=RealDictCursor)
+        # Разбор идёт потоком прямо в буферы COPY, без промежуточного списка моделей
+        file_data = base64.b64decode(file_content)
+        models_buffer, tags_buffer, errors = _stage_rows(_iter_rows(file_data, file_type))
         
-        added = 0
-        skipped = 0
-        errors = []
+        conn = get_connection(dsn)
+        cur = conn.cursor(cursor_factory=RealDictCursor)
         
-        for model in models:
-            name = model.get('name')
-            if not name:
-                skipped += 1
-                continue
-            
-            year_from = model.get('year_from')
-            year_to = model.get('year_to')
-            tags = model.get('tags', [])
-            
-            try:
-                cur.execute("""
-                    INSERT INTO car_models (brand_id, name, year_from, year_to)
-                    VALUES (%s, %s, %s, %s)
-                    ON CONFLICT (brand_id, name) DO UPDATE SET
-                        year_from = EXCLUDED.year_from,
-                        year_to = EXCLUDED.year_to
-                    RETURNING id
-                """, (brand_id, name, year_from, year_to))
-                
-                result = cur.fetchone()
-                if result:
-                    model_id = result['id']
-                    
-                    # Добавляем теги к модели
-                    for tag_name in tags:
-                        # Получаем или создаем тег
-                        cur.execute("""
-                            INSERT INTO model_tags (name)
-                            VALUES (%s)
-                            ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name
-                            RETURNING id
-                        """, (tag_name,))
-                        tag_result = cur.fetchone()
-                        tag_id = tag_result['id']
-                        
-                        # Связываем модель с тегом
-                        cur.execute("""
-                            INSERT INTO car_model_tags (model_id, tag_id)
-                            VALUES (%s, %s)
-                            ON CONFLICT (model_id, tag_id) DO NOTHING
-                        """, (model_id, tag_id))
-                    
-                    added += 1
-                else:
-                    skipped += 1
-            except Exception as e:
-                errors.append(f'{name}: {str(e)}')
-                skipped += 1
+        added, updated = _merge_models(cur, brand_id, models_buffer, tags_buffer)
         
+        bump_catalog_version(cur, 'models')
         conn.commit()
         
         return {
@@ -141,7 +214,8 @@ def handler(event: dict, context) -> dict:
             'body': json.dumps({
                 'success': True,
                 'added': added,
-                'skipped': skipped,
+                'updated': updated,
+                'skipped': len(errors),
                 'errors': errors
             })
         }
@@ -159,4 +233,4 @@ def handler(event: dict, context) -> dict:
         if 'cur' in locals():
             cur.close()
         if 'conn' in locals():
-            conn.close()
\ No newline at end of file
+            release_connection(conn)
\ No newline at end of file
@@ -1,11 +1,14 @@
 import json
 import os
 from typing import Dict, Any
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
+from db import get_connection, release_connection
+from catalog_cache import bump_catalog_version
+
+MAX_DIFF_ROWS = 500
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
-    '''Нормализация названий брендов согласно официальной регистрации'''
+    '''Нормализация названий брендов согласно официальной регистрации (dry_run=true — только предпросмотр)'''
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
@@ -52,60 +55,99 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'DATABASE_URL не настроен'})
         }
     
-    conn = psycopg2.connect(dsn)
+    params = event.get('queryStringParameters') or {}
+    try:
+        body_data = json.loads(event.get('body') or '{}')
+    except json.JSONDecodeError:
+        body_data = {}
+    dry_run = str(params.get('dry_run', body_data.get('dry_run', False))).lower() in ('true', '1')
+    
+    conn = get_connection(dsn)
     cur = conn.cursor(cursor_factory=RealDictCursor)
     
-    # Нормализация брендов
-    cur.execute("SELECT id, name FROM brands")
-    brands = cur.fetchall()
+    # Официальные названия передаются в БД одним VALUES, дальше всё считается на стороне PostgreSQL
+    cur.execute("CREATE TEMP TABLE official_brand_names (name_lower TEXT PRIMARY KEY, official_name TEXT NOT NULL) ON COMMIT DROP")
+    execute_values(cur, "INSERT INTO official_brand_names (name_lower, official_name) VALUES %s", list(OFFICIAL_NAMES.items()))
+    
+    # Бренды: официальное название или первая буква каждого слова заглавная
+    cur.execute("""
+        CREATE TEMP TABLE brand_name_changes ON COMMIT DROP AS
+        SELECT b.id, b.name AS old_name, COALESCE(o.official_name, initcap(b.name)) AS new_name
+        FROM brands b
+        LEFT JOIN official_brand_names o ON o.name_lower = lower(trim(b.name))
+    """)
+    cur.execute("SELECT COUNT(*) AS total FROM brand_name_changes")
+    total_brands = cur.fetchone()['total']
+    
+    # brands.name уникален: бренды, которые сойдутся в одно название, не трогаем
+    cur.execute("""
+        SELECT new_name, array_agg(old_name ORDER BY id) AS names
+        FROM brand_name_changes
+        GROUP BY new_name
+        HAVING COUNT(*) > 1
+    """)
+    brand_collisions = cur.fetchall()
     
-    brands_updated = 0
-    errors = []
+    cur.execute("""
+        UPDATE brands b
+        SET name = c.new_name
+        FROM brand_name_changes c
+        WHERE b.id = c.id AND c.old_name <> c.new_name
+          AND c.new_name NOT IN (
+              SELECT new_name FROM brand_name_changes GROUP BY new_name HAVING COUNT(*) > 1
+          )
+        RETURNING b.id, c.old_name, c.new_name
+    """)
+    brand_changes = cur.fetchall()
     
-    for brand in brands:
-        original_name = brand['name']
-        name_lower = original_name.lower().strip()
-        
-        # Проверить официальное название
-        if name_lower in OFFICIAL_NAMES:
-            normalized_name = OFFICIAL_NAMES[name_lower]
-        else:
-            # Стандартная нормализация: первая буква заглавная
-            normalized_name = original_name.title()
-        
-        if original_name != normalized_name:
-            try:
-                cur.execute(
-                    "UPDATE brands SET name = %s WHERE id = %s",
-                    (normalized_name, brand['id'])
-                )
-                brands_updated += 1
-            except Exception as e:
-                errors.append(f"Бренд {original_name}: {str(e)}")
+    # Модели: все буквы в верхний регистр
+    cur.execute("""
+        CREATE TEMP TABLE model_name_changes ON COMMIT DROP AS
+        SELECT id, brand_id, name AS old_name, upper(trim(name)) AS new_name
+        FROM car_models
+    """)
+    cur.execute("SELECT COUNT(*) AS total FROM model_name_changes")
+    total_models = cur.fetchone()['total']
     
-    # Нормализация моделей (все буквы в верхний регистр)
-    cur.execute("SELECT id, name FROM car_models")
-    models = cur.fetchall()
+    # Разные модели бренда, которые после нормализации станут дублями
+    cur.execute("""
+        SELECT brand_id, new_name, array_agg(old_name ORDER BY id) AS names
+        FROM model_name_changes
+        GROUP BY brand_id, new_name
+        HAVING COUNT(*) > 1 AND COUNT(DISTINCT old_name) > 1
+    """)
+    model_collisions = cur.fetchall()
     
-    models_updated = 0
+    cur.execute("""
+        UPDATE car_models m
+        SET name = c.new_name
+        FROM model_name_changes c
+        WHERE m.id = c.id AND c.old_name <> c.new_name
+          AND (c.brand_id, c.new_name) NOT IN (
+              SELECT brand_id, new_name FROM model_name_changes
+              GROUP BY brand_id, new_name
+              HAVING COUNT(*) > 1 AND COUNT(DISTINCT old_name) > 1
+          )
+        RETURNING m.id, c.old_name, c.new_name
+    """)
+    model_changes = cur.fetchall()
     
-    for model in models:
-        original_name = model['name']
-        normalized_name = original_name.upper().strip()
-        
-        if original_name != normalized_name:
-            try:
-                cur.execute(
-                    "UPDATE car_models SET name = %s WHERE id = %s",
-                    (normalized_name, model['id'])
-                )
-                models_updated += 1
-            except Exception as e:
-                errors.append(f"Модель {original_name}: {str(e)}")
+    errors = [
+        f"Бренды {', '.join(c['names'])} совпадут как {c['new_name']}, пропущены"
+        for c in brand_collisions
+    ] + [
+        f"Модели бренда {c['brand_id']}: {', '.join(c['names'])} совпадут как {c['new_name']}, пропущены"
+        for c in model_collisions
+    ]
     
-    conn.commit()
+    if dry_run:
+        conn.rollback()
+    else:
+        if brand_changes or model_changes:
+            bump_catalog_version(cur, 'brands', 'models')
+        conn.commit()
     cur.close()
-    conn.close()
+    release_connection(conn)
     
     return {
         'statusCode': 200,
@@ -115,10 +157,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         },
         'body': json.dumps({
             'success': True,
-            'brands_updated': brands_updated,
-            'models_updated': models_updated,
-            'total_brands': len(brands),
-            'total_models': len(models),
+            'dry_run': dry_run,
+            'brands_updated': len(brand_changes),
+            'models_updated': len(model_changes),
+            'total_brands': total_brands,
+            'total_models': total_models,
+            'brand_changes': brand_changes[:MAX_DIFF_ROWS],
+            'model_changes': model_changes[:MAX_DIFF_ROWS],
             'errors': errors
         })
     }
\ No newline at end of file
@@ -0,0 +1,180 @@
+import csv
+import io
+import json
+import base64
+from decimal import Decimal, InvalidOperation
+from psycopg2.extras import execute_values
+
+MAX_BULK_ROWS = 20000
+# Пределы колонок временной таблицы: base_price NUMERIC(10, 2), currency VARCHAR(10)
+MAX_PRICE = Decimal('100000000')
+MAX_CURRENCY_LENGTH = 10
+
+
+def _optional_int(value) -> int | None:
+    if value is None or str(value).strip() in ('', 'null', 'None'):
+        return None
+    return int(str(value).strip())
+
+
+def parse_bulk_rows(body_data: dict) -> tuple:
+    """
+    Разбирает строки массовой загрузки цен.
+    Принимает {"rows": [...]} или файл как в models-upload: {"file": base64, "type": "csv" | "json"}.
+    Колонки: service_id, brand_id, model_id (пусто — цена бренда), base_price (или price), currency.
+    Возвращает (валидные строки, ошибки разбора) с номерами строк исходных данных.
+    """
+    if body_data.get('rows') is not None:
+        raw_rows = body_data['rows']
+    else:
+        file_text = base64.b64decode(body_data.get('file') or '').decode('utf-8-sig')
+        if body_data.get('type', 'csv') == 'json':
+            data = json.loads(file_text)
+            raw_rows = data if isinstance(data, list) else data.get('rows', [])
+        else:
+            raw_rows = csv.DictReader(io.StringIO(file_text))
+
+    rows = []
+    errors = []
+    for row_no, raw in enumerate(raw_rows, start=1):
+        if row_no > MAX_BULK_ROWS:
+            raise ValueError(f'Не более {MAX_BULK_ROWS} строк за один запрос')
+        if not isinstance(raw, dict):
+            errors.append({'row': row_no, 'status': 'error', 'error': 'Строка должна быть объектом'})
+            continue
+        try:
+            service_id = _optional_int(raw.get('service_id'))
+            brand_id = _optional_int(raw.get('brand_id'))
+            model_id = _optional_int(raw.get('model_id'))
+            price_raw = raw.get('base_price', raw.get('price'))
+            base_price = Decimal(str(price_raw).replace(' ', '').replace(',', '.')) if price_raw not in (None, '') else None
+        except (ValueError, InvalidOperation):
+            errors.append({'row': row_no, 'status': 'error', 'error': 'Некорректные числовые значения'})
+            continue
+        # Decimal принимает NaN и Infinity; такие значения и слишком большие цены отклоняем здесь,
+        # иначе одна строка прервёт загрузку всего файла
+        if base_price is not None and not base_price.is_finite():
+            errors.append({'row': row_no, 'status': 'error', 'error': 'Некорректные числовые значения'})
+            continue
+
+        if not service_id or not brand_id or base_price is None:
+            errors.append({'row': row_no, 'status': 'error', 'error': 'service_id, brand_id и base_price обязательны'})
+            continue
+        if base_price < 0:
+            errors.append({'row': row_no, 'status': 'error', 'error': 'Цена не может быть отрицательной'})
+            continue
+        if base_price.quantize(Decimal('0.01')) >= MAX_PRICE:
+            errors.append({'row': row_no, 'status': 'error', 'error': f'Цена должна быть меньше {MAX_PRICE}'})
+            continue
+
+        currency = str(raw.get('currency') or '₽').strip()
+        if len(currency) > MAX_CURRENCY_LENGTH:
+            errors.append({'row': row_no, 'status': 'error', 'error': f'Валюта длиннее {MAX_CURRENCY_LENGTH} символов'})
+            continue
+        rows.append((row_no, service_id, brand_id, model_id, base_price, currency))
+
+    return rows, errors
+
+
+def bulk_upsert_prices(cur, rows: list) -> list:
+    """
+    Загружает строки во временную таблицу одним execute_values и сливает их в service_prices
+    набором запросов в текущей транзакции. Строки с тем же ключом
+    (service_id, brand_id, model_id) обновляются, новые вставляются.
+    Возвращает построчный результат: inserted / updated / unchanged / error.
+    """
+    cur.execute("""
+        CREATE TEMP TABLE bulk_prices (
+            row_no INTEGER PRIMARY KEY,
+            service_id INTEGER NOT NULL,
+            brand_id INTEGER NOT NULL,
+            model_id INTEGER,
+            base_price NUMERIC(10, 2) NOT NULL,
+            currency VARCHAR(10) NOT NULL,
+            error TEXT
+        ) ON COMMIT DROP
+    """)
+    execute_values(
+        cur,
+        "INSERT INTO bulk_prices (row_no, service_id, brand_id, model_id, base_price, currency) VALUES %s",
+        rows,
+        page_size=1000
+    )
+
+    # Проверки ссылок и повторов в файле — одним проходом по временной таблице
+    cur.execute("""
+        UPDATE bulk_prices b SET error = CASE
+            WHEN NOT EXISTS (SELECT 1 FROM services s WHERE s.id = b.service_id) THEN 'Услуга не найдена'
+            WHEN NOT EXISTS (SELECT 1 FROM brands br WHERE br.id = b.brand_id) THEN 'Бренд не найден'
+            WHEN b.model_id IS NOT NULL AND NOT EXISTS (
+                SELECT 1 FROM car_models cm WHERE cm.id = b.model_id AND cm.brand_id = b.brand_id
+            ) THEN 'Модель не найдена у этого бренда'
+            WHEN EXISTS (
+                SELECT 1 FROM bulk_prices later
+                WHERE later.service_id = b.service_id AND later.brand_id = b.brand_id
+                  AND later.model_id IS NOT DISTINCT FROM b.model_id AND later.row_no > b.row_no
+            ) THEN 'Повторяется ниже в файле, применена последняя строка'
+        END
+    """)
+
+    # Защищаемся от параллельной вставки тех же ключей другим запросом
+    cur.execute("LOCK TABLE service_prices IN SHARE ROW EXCLUSIVE MODE")
+
+    cur.execute("""
+        WITH staged AS (
+            SELECT * FROM bulk_prices WHERE error IS NULL
+        ),
+        current_prices AS (
+            SELECT s.row_no, MIN(sp.id) AS price_id, MIN(sp.base_price) AS old_price
+            FROM staged s
+            JOIN service_prices sp
+              ON sp.service_id = s.service_id AND sp.brand_id = s.brand_id
+             AND sp.model_id IS NOT DISTINCT FROM s.model_id
+            GROUP BY s.row_no
+        ),
+        updated AS (
+            UPDATE service_prices sp
+            SET base_price = s.base_price, currency = s.currency, updated_at = CURRENT_TIMESTAMP
+            FROM staged s
+            WHERE sp.service_id = s.service_id AND sp.brand_id = s.brand_id
+              AND sp.model_id IS NOT DISTINCT FROM s.model_id
+              AND (sp.base_price <> s.base_price OR sp.currency IS DISTINCT FROM s.currency)
+            RETURNING s.row_no
+        ),
+        inserted AS (
+            INSERT INTO service_prices (service_id, brand_id, model_id, base_price, currency)
+            SELECT s.service_id, s.brand_id, s.model_id, s.base_price, s.currency
+            FROM staged s
+            WHERE NOT EXISTS (SELECT 1 FROM current_prices c WHERE c.row_no = s.row_no)
+            RETURNING id, service_id, brand_id, model_id
+        )
+        SELECT s.row_no,
+               COALESCE(i.id, c.price_id) AS price_id,
+               c.old_price,
+               s.base_price AS new_price,
+               CASE
+                   WHEN i.id IS NOT NULL THEN 'inserted'
+                   WHEN EXISTS (SELECT 1 FROM updated u WHERE u.row_no = s.row_no) THEN 'updated'
+                   ELSE 'unchanged'
+               END AS status
+        FROM staged s
+        LEFT JOIN current_prices c ON c.row_no = s.row_no
+        LEFT JOIN inserted i
+          ON i.service_id = s.service_id AND i.brand_id = s.brand_id
+         AND i.model_id IS NOT DISTINCT FROM s.model_id
+        ORDER BY s.row_no
+    """)
+    results = [
+        {
+            'row': row['row_no'],
+            'status': row['status'],
+            'price_id': row['price_id'],
+            'old_price': float(row['old_price']) if row['old_price'] is not None else None,
+            'new_price': float(row['new_price'])
+        }
+        for row in cur.fetchall()
+    ]
+
+    cur.execute("SELECT row_no, error FROM bulk_prices WHERE error IS NOT NULL")
+    results.extend({'row': row['row_no'], 'status': 'error', 'error': row['error']} for row in cur.fetchall())
+    return results
@@ -1,9 +1,133 @@
 import json
 import os
+import base64
+import binascii
 from typing import Dict, Any
 from decimal import Decimal
-import psycopg2
 from psycopg2.extras import RealDictCursor
+from db import get_connection, release_connection
+from bulk_prices import parse_bulk_rows, bulk_upsert_prices
+from repricing import apply_repricing_rule, MAX_PREVIEW_ROWS
+from catalog_cache import bump_catalog_version, get_catalog_versions, make_etag, is_not_modified, cache_headers, not_modified_response
+
+# Поля, доступные для проекции через ?fields=
+PRICE_FIELDS = {
+    'id': 'sp.id',
+    'service_id': 'sp.service_id',
+    'brand_id': 'sp.brand_id',
+    'model_id': 'sp.model_id',
+    'base_price': 'sp.base_price',
+    'currency': 'sp.currency',
+    'created_at': 'sp.created_at',
+    'updated_at': 'sp.updated_at',
+    'service_title': 's.title',
+    'brand_name': 'b.name',
+    'model_name': 'cm.name',
+}
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+def _int_param(params: dict, name: str) -> int | None:
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'Некорректный параметр {name}')
+
+
+def _price_param(params: dict, name: str) -> Decimal | None:
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return Decimal(value)
+    except ArithmeticError:
+        raise ValueError(f'Некорректный параметр {name}')
+
+
+def _encode_cursor(brand_id: int, service_id: int, price_id: int) -> str:
+    raw = json.dumps([brand_id, service_id, price_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(cursor: str) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        key = json.loads(raw)
+        if len(key) != 3:
+            raise ValueError
+        return [int(part) for part in key]
+    except (ValueError, TypeError, binascii.Error):
+        raise ValueError('Некорректный cursor')
+
+
+def _list_prices(cur, params: dict) -> str:
+    """
+    Список цен с фильтрами brand_id, service_id, model_id, min_price, max_price и проекцией fields.
+    С limit или cursor отдаёт страницу по ключу (brand_id, service_id, id), число строк страницы (count)
+    и next_cursor, без них — весь список в прежнем порядке (бренд, услуга) с total.
+    JSON строк собирает PostgreSQL, поэтому Decimal и даты не конвертируются в Python.
+    """
+    fields = [f.strip() for f in (params.get('fields') or '').split(',') if f.strip()] or list(PRICE_FIELDS)
+    unknown = [f for f in fields if f not in PRICE_FIELDS]
+    if unknown:
+        raise ValueError(f"Неизвестные поля: {', '.join(unknown)}")
+    row_json = 'json_build_object(' + ', '.join(f"'{f}', {PRICE_FIELDS[f]}" for f in fields) + ')::text'
+
+    query = f"""
+        SELECT sp.brand_id AS k_brand, sp.service_id AS k_service, sp.id AS k_id, {row_json} AS row_json
+        FROM service_prices sp
+        JOIN services s ON sp.service_id = s.id
+        JOIN brands b ON sp.brand_id = b.id
+        LEFT JOIN car_models cm ON sp.model_id = cm.id
+        WHERE 1=1
+    """
+    query_params = []
+    for name, column in (('brand_id', 'sp.brand_id'), ('service_id', 'sp.service_id'), ('model_id', 'sp.model_id')):
+        value = _int_param(params, name)
+        if value is not None:
+            query += f" AND {column} = %s"
+            query_params.append(value)
+    min_price = _price_param(params, 'min_price')
+    if min_price is not None:
+        query += " AND sp.base_price >= %s"
+        query_params.append(min_price)
+    max_price = _price_param(params, 'max_price')
+    if max_price is not None:
+        query += " AND sp.base_price <= %s"
+        query_params.append(max_price)
+
+    paginated = bool(params.get('limit') or params.get('cursor'))
+    if not paginated:
+        query += " ORDER BY b.name, s.title"
+        cur.execute(query, query_params)
+        rows = cur.fetchall()
+        return '{"prices": [' + ','.join(row['row_json'] for row in rows) + '], "total": ' + str(len(rows)) + '}'
+
+    limit = min(max(_int_param(params, 'limit') or DEFAULT_PAGE_SIZE, 1), MAX_PAGE_SIZE)
+    if params.get('cursor'):
+        query += " AND (sp.brand_id, sp.service_id, sp.id) > (%s, %s, %s)"
+        query_params.extend(_decode_cursor(params['cursor']))
+    query += " ORDER BY sp.brand_id, sp.service_id, sp.id LIMIT %s"
+    query_params.append(limit + 1)
+
+    cur.execute(query, query_params)
+    rows = cur.fetchall()
+    page = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = page[-1]
+        next_cursor = _encode_cursor(last['k_brand'], last['k_service'], last['k_id'])
+
+    return (
+        '{"prices": [' + ','.join(row['row_json'] for row in page) + '], '
+        + '"count": ' + str(len(page)) + ', '
+        + '"next_cursor": ' + json.dumps(next_cursor) + '}'
+    )
+
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -28,58 +152,118 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if not dsn:
             raise Exception('DATABASE_URL not configured')
         
-        conn = psycopg2.connect(dsn)
+        conn = get_connection(dsn)
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
         if method == 'GET':
             params = event.get('queryStringParameters') or {}
-            brand_id = params.get('brand_id')
-            service_id = params.get('service_id')
             
-            query = """
-                SELECT 
-                    sp.id, sp.service_id, sp.brand_id, sp.model_id,
-                    sp.base_price, sp.currency, sp.created_at, sp.updated_at,
-                    s.title as service_title,
-                    b.name as brand_name,
-                    cm.name as model_name
-                FROM service_prices sp
-                JOIN services s ON sp.service_id = s.id
-                JOIN brands b ON sp.brand_id = b.id
-                LEFT JOIN car_models cm ON sp.model_id = cm.id
-                WHERE 1=1
-            """
+            stamp = get_catalog_versions(cur, ['prices', 'services', 'brands', 'models'])
+            variant = '&'.join(f'{k}={params[k]}' for k in sorted(params))
+            etag = make_etag(f'prices:{variant}', stamp)
+            if is_not_modified(event, etag):
+                cur.close()
+                release_connection(conn)
+                return not_modified_response(etag)
             
-            params_list = []
-            if brand_id:
-                query += " AND sp.brand_id = %s"
-                params_list.append(brand_id)
-            if service_id:
-                query += " AND sp.service_id = %s"
-                params_list.append(service_id)
+            try:
+                body = _list_prices(cur, params)
+            except ValueError as e:
+                cur.close()
+                release_connection(conn)
+                return {
+                    'statusCode': 400,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps({'error': str(e)})
+                }
             
-            query += " ORDER BY b.name, s.title"
+            cur.close()
+            release_connection(conn)
             
-            if params_list:
-                cur.execute(query, params_list)
-            else:
-                cur.execute(query)
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*',
+                    **cache_headers(etag)
+                },
+                'isBase64Encoded': False,
+                'body': body
+            }
+        
+        elif method == 'POST' and (event.get('queryStringParameters') or {}).get('action') == 'bulk':
+            body_data = json.loads(event.get('body') or '{}')
+            try:
+                rows, parse_errors = parse_bulk_rows(body_data)
+            except (ValueError, binascii.Error) as e:
+                cur.close()
+                release_connection(conn)
+                return {
+                    'statusCode': 400,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps({'error': f'Не удалось разобрать данные: {e}'})
+                }
+            
+            results = bulk_upsert_prices(cur, rows) if rows else []
+            results.extend(parse_errors)
+            results.sort(key=lambda r: r['row'])
+            
+            summary = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'error': 0}
+            for result in results:
+                summary[result['status']] += 1
             
-            rows = cur.fetchall()
+            if summary['inserted'] or summary['updated']:
+                bump_catalog_version(cur, 'prices')
+            conn.commit()
+            cur.close()
+            release_connection(conn)
             
-            prices = []
-            for row in rows:
-                price = dict(row)
-                if price.get('created_at'):
-                    price['created_at'] = price['created_at'].isoformat()
-                if price.get('updated_at'):
-                    price['updated_at'] = price['updated_at'].isoformat()
-                if isinstance(price.get('base_price'), Decimal):
-                    price['base_price'] = float(price['base_price'])
-                prices.append(price)
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'isBase64Encoded': False,
+                'body': json.dumps({
+                    'success': True,
+                    'summary': summary,
+                    'rows': results
+                })
+            }
+        
+        elif method == 'POST' and (event.get('queryStringParameters') or {}).get('action') == 'reprice':
+            rule = json.loads(event.get('body') or '{}')
+            dry_run = rule.get('dry_run', True) is not False
+            try:
+                changes = apply_repricing_rule(cur, rule)
+            except ValueError as e:
+                conn.rollback()
+                cur.close()
+                release_connection(conn)
+                return {
+                    'statusCode': 400,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps({'error': str(e)})
+                }
             
+            if dry_run:
+                conn.rollback()
+            else:
+                if changes:
+                    bump_catalog_version(cur, 'prices')
+                conn.commit()
             cur.close()
-            conn.close()
+            release_connection(conn)
             
             return {
                 'statusCode': 200,
@@ -89,8 +273,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 },
                 'isBase64Encoded': False,
                 'body': json.dumps({
-                    'prices': prices,
-                    'total': len(prices)
+                    'success': True,
+                    'dry_run': dry_run,
+                    'affected': len(changes),
+                    'changes': changes[:MAX_PREVIEW_ROWS],
+                    'truncated': len(changes) > MAX_PREVIEW_ROWS,
+                    'message': 'Предпросмотр изменений' if dry_run else 'Цены обновлены'
                 })
             }
         
@@ -127,7 +315,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             
             if existing:
                 cur.close()
-                conn.close()
+                release_connection(conn)
                 return {
                     'statusCode': 409,
                     'headers': {
@@ -147,9 +335,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             )
             
             result = cur.fetchone()
+            bump_catalog_version(cur, 'prices')
             conn.commit()
             cur.close()
-            conn.close()
+            release_connection(conn)
             
             price_data = dict(result)
             if isinstance(price_data.get('base_price'), Decimal):
@@ -198,7 +387,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             
             if not result:
                 cur.close()
-                conn.close()
+                release_connection(conn)
                 return {
                     'statusCode': 404,
                     'headers': {
@@ -208,9 +397,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'body': json.dumps({'error': 'Цена не найдена'})
                 }
             
+            bump_catalog_version(cur, 'prices')
             conn.commit()
             cur.close()
-            conn.close()
+            release_connection(conn)
             
             price_data = dict(result)
             if isinstance(price_data.get('base_price'), Decimal):
@@ -249,7 +439,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             
             if not result:
                 cur.close()
-                conn.close()
+                release_connection(conn)
                 return {
                     'statusCode': 404,
                     'headers': {
@@ -259,9 +449,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'body': json.dumps({'error': 'Цена не найдена'})
                 }
             
+            bump_catalog_version(cur, 'prices')
             conn.commit()
             cur.close()
-            conn.close()
+            release_connection(conn)
             
             return {
                 'statusCode': 200,
@@ -278,7 +469,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         else:
             cur.close()
-            conn.close()
+            release_connection(conn)
             return {
                 'statusCode': 405,
                 'headers': {
@@ -0,0 +1,151 @@
+from decimal import Decimal, InvalidOperation
+
+MAX_PREVIEW_ROWS = 500
+ROUND_FUNCTIONS = {'nearest': 'ROUND', 'up': 'CEIL', 'down': 'FLOOR'}
+
+
+def _int_or_none(rule: dict, name: str) -> int | None:
+    value = rule.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'Некорректный параметр {name}')
+
+
+def _decimal_or_none(rule: dict, name: str) -> Decimal | None:
+    value = rule.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        number = Decimal(str(value).replace(',', '.'))
+    except InvalidOperation:
+        raise ValueError(f'Некорректный параметр {name}')
+    # NaN и Infinity Decimal принимает, но в цены они попасть не должны
+    if not number.is_finite():
+        raise ValueError(f'Некорректный параметр {name}')
+    return number
+
+
+def _filters(rule: dict, alias: str) -> tuple:
+    """
+    Общие фильтры правил: brand_id, service_id, model_id, min_price, max_price и
+    scope — 'all' (по умолчанию), 'brand' (только цены бренда без модели) или 'models'.
+    """
+    clauses = []
+    params = []
+    for name in ('brand_id', 'service_id', 'model_id'):
+        value = _int_or_none(rule, name)
+        if value is not None:
+            clauses.append(f'{alias}.{name} = %s')
+            params.append(value)
+    min_price = _decimal_or_none(rule, 'min_price')
+    if min_price is not None:
+        clauses.append(f'{alias}.base_price >= %s')
+        params.append(min_price)
+    max_price = _decimal_or_none(rule, 'max_price')
+    if max_price is not None:
+        clauses.append(f'{alias}.base_price <= %s')
+        params.append(max_price)
+
+    scope = rule.get('scope', 'all')
+    if scope == 'brand':
+        clauses.append(f'{alias}.model_id IS NULL')
+    elif scope == 'models':
+        clauses.append(f'{alias}.model_id IS NOT NULL')
+    elif scope != 'all':
+        raise ValueError("scope должен быть 'all', 'brand' или 'models'")
+
+    return (' AND '.join(clauses) or 'TRUE'), params
+
+
+def _adjust(cur, rule: dict) -> list:
+    """
+    Новая цена = set_price или base_price * (1 + percent / 100) + add,
+    затем округление до шага round_to (round_mode: nearest / up / down).
+    """
+    percent = _decimal_or_none(rule, 'percent') or Decimal(0)
+    add = _decimal_or_none(rule, 'add') or Decimal(0)
+    set_price = _decimal_or_none(rule, 'set_price')
+    round_to = _decimal_or_none(rule, 'round_to')
+    round_function = ROUND_FUNCTIONS.get(rule.get('round_mode', 'nearest'))
+    if not round_function:
+        raise ValueError("round_mode должен быть 'nearest', 'up' или 'down'")
+    if round_to is not None and round_to <= 0:
+        raise ValueError('round_to должен быть больше нуля')
+    if set_price is None and not percent and not add and round_to is None:
+        raise ValueError('Укажите percent, add, set_price или round_to')
+
+    price_expr = '%s::numeric' if set_price is not None else 'sp.base_price * (1 + %s::numeric / 100) + %s::numeric'
+    price_params = [set_price] if set_price is not None else [percent, add]
+    if round_to is not None:
+        price_expr = f'{round_function}(({price_expr}) / %s::numeric) * %s::numeric'
+        price_params += [round_to, round_to]
+
+    where, where_params = _filters(rule, 'sp')
+    cur.execute(f"""
+        WITH changes AS (
+            SELECT sp.id, sp.base_price AS old_price,
+                   GREATEST(ROUND({price_expr}, 2), 0) AS new_price
+            FROM service_prices sp
+            WHERE {where}
+        )
+        UPDATE service_prices sp
+        SET base_price = c.new_price, updated_at = CURRENT_TIMESTAMP
+        FROM changes c
+        WHERE sp.id = c.id AND c.new_price <> c.old_price
+        RETURNING sp.id, sp.service_id, sp.brand_id, sp.model_id, c.old_price, c.new_price
+    """, price_params + where_params)
+    return cur.fetchall()
+
+
+def _fill_missing_models(cur, rule: dict) -> list:
+    """Копирует цену бренда (model_id IS NULL) во все модели бренда, у которых своей цены на услугу нет"""
+    rule = {**rule, 'scope': 'brand', 'model_id': None}
+    where, where_params = _filters(rule, 'bp')
+    cur.execute("LOCK TABLE service_prices IN SHARE ROW EXCLUSIVE MODE")
+    cur.execute(f"""
+        INSERT INTO service_prices (service_id, brand_id, model_id, base_price, currency)
+        SELECT DISTINCT ON (bp.service_id, bp.brand_id, cm.id)
+               bp.service_id, bp.brand_id, cm.id, bp.base_price, bp.currency
+        FROM service_prices bp
+        JOIN car_models cm ON cm.brand_id = bp.brand_id
+        WHERE {where}
+          AND NOT EXISTS (
+              SELECT 1 FROM service_prices sp
+              WHERE sp.service_id = bp.service_id AND sp.brand_id = bp.brand_id AND sp.model_id = cm.id
+          )
+        ORDER BY bp.service_id, bp.brand_id, cm.id, bp.id DESC
+        RETURNING id, service_id, brand_id, model_id, NULL::numeric AS old_price, base_price AS new_price
+    """, where_params)
+    return cur.fetchall()
+
+
+RULES = {
+    'adjust': _adjust,
+    'fill_missing_models': _fill_missing_models,
+}
+
+
+def apply_repricing_rule(cur, rule: dict) -> list:
+    """
+    Применяет правило массовой переоценки одним set-based запросом в текущей транзакции.
+    Вызывающий код делает commit() или, в режиме предпросмотра, rollback(),
+    поэтому предпросмотр показывает ровно те изменения, что будут применены.
+    """
+    rule_function = RULES.get(rule.get('rule'))
+    if not rule_function:
+        raise ValueError(f"Неизвестное правило. Доступны: {', '.join(RULES)}")
+
+    return [
+        {
+            'id': row['id'],
+            'service_id': row['service_id'],
+            'brand_id': row['brand_id'],
+            'model_id': row['model_id'],
+            'old_price': float(row['old_price']) if row['old_price'] is not None else None,
+            'new_price': float(row['new_price'])
+        }
+        for row in rule_function(cur, rule)
+    ]
@@ -0,0 +1,264 @@
+import json
+import time
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2.extras import RealDictCursor
+from requests.auth import HTTPBasicAuth
+from db import get_connection, release_connection
+from kontragent_index import is_index_ready, find_kontragent_keys, phone_tail
+from order_refs import is_backfill_done, find_order_refs, save_order_refs
+from odata_1c import CONNECT_TIMEOUT_SECONDS, get_client, basic_getter, iter_entities, eq, read_timeout, string
+from reference_cache import get_reference, find_by_name
+from utils_1c import build_order_document, get_vid_remonta, load_existing_orders, normalize_phone
+
+DEFAULT_WINDOW_DAYS = 7
+DEFAULT_BATCH_LIMIT = 100
+MAX_BATCH_LIMIT = 500
+MAX_PARALLEL_REQUESTS = 4
+# Сколько последних документов 1С просматриваем, чтобы не создать дубли уже отправленных заявок
+EXISTING_ORDERS_LOOKBACK = 2000
+# Время на пакет, если не передан budget; остаток времени функции ограничивает его сверху
+DEFAULT_TIME_BUDGET_SECONDS = 60
+MAX_TIME_BUDGET_SECONDS = 240
+# Новую отправку не начинаем, если до конца бюджета не уложится самый долгий запрос к 1С
+SEND_RESERVE_SECONDS = CONNECT_TIMEOUT_SECONDS + read_timeout('Document_ЗаявкаНаРемонт')
+
+
+def batch_time_budget(context, body: dict) -> float:
+    """Время на пакет: budget из запроса или DEFAULT_TIME_BUDGET_SECONDS, но не больше остатка времени функции"""
+    try:
+        budget = min(float(body.get('budget') or DEFAULT_TIME_BUDGET_SECONDS), MAX_TIME_BUDGET_SECONDS)
+    except (TypeError, ValueError):
+        budget = DEFAULT_TIME_BUDGET_SECONDS
+    get_remaining = getattr(context, 'get_remaining_time_in_millis', None)
+    if callable(get_remaining):
+        budget = min(budget, get_remaining() / 1000 - 5)
+    return budget
+
+
+def _date_param(body: dict, name: str, default: datetime) -> datetime:
+    value = body.get(name)
+    if not value:
+        return default
+    try:
+        return datetime.strptime(str(value)[:10], '%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f'Некорректная дата {name}, ожидается ГГГГ-ММ-ДД')
+
+
+def _load_contacts_index(odata_url: str, auth, deadline: float) -> dict:
+    """
+    Пока локальный индекс не построен — один раз читаем телефоны контрагентов из 1С и строим словарь.
+    На deadline чтение прекращается: заявки с непрочитанными номерами уйдут без контрагента
+    """
+    items = iter_entities(
+        basic_getter(odata_url, auth, timeout=30, deadline=deadline), 'Catalog_Контрагенты_КонтактнаяИнформация',
+        filter=eq('Тип', string('Телефон')), select=['Ref_Key', 'Тип', 'Представление'],
+        client_filter=lambda item: item.get('Тип') == 'Телефон'
+    )
+    keys = {}
+    try:
+        for item in items:
+            tail = normalize_phone(item.get('Представление', '') or '')[-10:]
+            if tail:
+                keys.setdefault(tail, item.get('Ref_Key'))
+    except TimeoutError as e:
+        print(f"[1C] Телефоны контрагентов прочитаны не полностью ({len(keys)}): {e}")
+    return keys
+
+
+def _deferred(booking: dict) -> dict:
+    return {'booking_id': booking['id'], 'success': False, 'deferred': True,
+            'error': 'Не хватило времени пакета, заявка не отправлялась'}
+
+
+def retry_batch(dsn: str, odata_url: str, user: str, password: str, body: dict,
+                time_budget: float = DEFAULT_TIME_BUDGET_SECONDS) -> dict:
+    """
+    Пакетная повторная отправка: все заявки с synced_to_1c = FALSE за окно date_from..date_to
+    (по умолчанию последние 7 дней), не больше limit. Заявки, которые ждут отправки в onec_outbox
+    (pending/processing), пропускаются: их отправит обработчик очереди, иначе в 1С появятся два документа.
+    Справочники и контрагенты загружаются один раз на весь пакет (контрагенты — из локального индекса,
+    пока он не построен — одним чтением телефонов из 1С), существующие документы 1С
+    берутся из onec_order_refs (из 1С — только пока не заполнены ссылки старых заявок).
+    Документы отправляются параллельно, отметки о синхронизации и ссылки сохраняются одной транзакцией.
+    Перед каждым запросом к 1С проверяется time_budget: что не успевает завершиться, не начинается (deferred).
+    """
+    deadline = time.monotonic() + time_budget
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    date_to = _date_param(body, 'date_to', today)
+    date_from = _date_param(body, 'date_from', date_to - timedelta(days=DEFAULT_WINDOW_DAYS))
+    try:
+        limit = min(int(body.get('limit') or DEFAULT_BATCH_LIMIT), MAX_BATCH_LIMIT)
+    except (TypeError, ValueError):
+        raise ValueError('limit должен быть числом')
+
+    auth = HTTPBasicAuth(user, password)
+    conn = get_connection(dsn)
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute(
+            """
+            SELECT id, customer_name, customer_phone, customer_email,
+                   service_type, promotion, car_brand, car_model, preferred_date,
+                   preferred_time, comment
+            FROM bookings
+            WHERE synced_to_1c IS NOT TRUE
+              AND created_at >= %s AND created_at < %s + INTERVAL '1 day'
+              AND NOT EXISTS (
+                  SELECT 1 FROM onec_outbox o
+                  WHERE o.booking_id = bookings.id AND o.status IN ('pending', 'processing')
+              )
+            ORDER BY id
+            LIMIT %s
+            """,
+            (date_from, date_to, limit)
+        )
+        bookings = cur.fetchall()
+        cur.execute(
+            """
+            SELECT COUNT(*) AS queued
+            FROM bookings b JOIN onec_outbox o ON o.booking_id = b.id
+            WHERE b.synced_to_1c IS NOT TRUE
+              AND b.created_at >= %s AND b.created_at < %s + INTERVAL '1 day'
+              AND o.status IN ('pending', 'processing')
+            """,
+            (date_from, date_to)
+        )
+        queued = cur.fetchone()['queued']
+        cur.close()
+        if not bookings:
+            return {'total': 0, 'synced': 0, 'failed': 0, 'deferred': 0, 'queued': queued, 'results': []}
+
+        phones = [booking.get('customer_phone') or '' for booking in bookings]
+        index_ready = is_index_ready(conn)
+        kontragent_keys = find_kontragent_keys(conn, phones) if index_ready else {}
+        existing_orders = find_order_refs(conn, [booking['id'] for booking in bookings])
+        backfill_done = is_backfill_done(conn)
+    finally:
+        release_connection(conn)
+
+    # Запросы к 1С до отправки не должны съесть время, нужное на саму отправку
+    send_deadline = deadline - SEND_RESERVE_SECONDS
+    results = None
+    marketing = None
+    vid_remont_key = None
+    found_orders = {}
+    try:
+        if not index_ready:
+            if time.monotonic() >= send_deadline:
+                raise TimeoutError('нет времени на чтение телефонов контрагентов')
+            kontragent_keys = _load_contacts_index(odata_url, auth, send_deadline)
+        if time.monotonic() >= send_deadline:
+            raise TimeoutError('нет времени на справочники')
+        marketing = get_reference(dsn, 'marketing_programs', odata_url, auth)
+        if time.monotonic() >= send_deadline:
+            raise TimeoutError('нет времени на справочники')
+        vid_remont_key = get_vid_remonta(odata_url, user, password, dsn)
+        if not backfill_done and len(existing_orders) < len(bookings):
+            # Без списка уже созданных документов отправлять нельзя: появятся дубли
+            if time.monotonic() >= send_deadline:
+                raise TimeoutError('нет времени на поиск уже созданных документов')
+            found_orders = load_existing_orders(odata_url, user, password, EXISTING_ORDERS_LOOKBACK, send_deadline)
+            found_orders = {
+                booking['id']: found_orders[booking['id']] for booking in bookings
+                if booking['id'] in found_orders and booking['id'] not in existing_orders
+            }
+    except TimeoutError as e:
+        print(f"[1C] Пакетная отправка отложена: {e}")
+        results = [_deferred(booking) for booking in bookings]
+    existing_orders = {**found_orders, **existing_orders}
+
+    client = get_client(odata_url, user, password)
+
+    def push(booking: dict) -> dict:
+        if deadline - time.monotonic() < SEND_RESERVE_SECONDS:
+            return _deferred(booking)
+        doc_data = build_order_document(booking)
+        # Контрагент только из индекса или прочитанных один раз телефонов: поиск в 1С на каждую заявку
+        # не укладывается в бюджет пакета; номера, которых нет в индексе, добавит его синхронизация
+        kontragent_key = kontragent_keys.get(phone_tail(booking.get('customer_phone') or ''))
+        if kontragent_key:
+            doc_data["Заказчик_Key"] = kontragent_key
+            doc_data["Контрагент_Key"] = kontragent_key
+        if booking.get('promotion'):
+            item = find_by_name(marketing, booking['promotion'])
+            if item:
+                doc_data["МаркетинговаяПрограмма_Key"] = item.get('Ref_Key')
+        if vid_remont_key:
+            doc_data["ВидРемонта_Key"] = vid_remont_key
+
+        existing_ref = existing_orders.get(booking['id'])
+        try:
+            if existing_ref:
+                response = client.patch(f"Document_ЗаявкаНаРемонт(guid'{existing_ref}')", doc_data)
+            else:
+                response = client.post('Document_ЗаявкаНаРемонт', doc_data)
+        except Exception as e:
+            return {'booking_id': booking['id'], 'success': False, 'error': f'Ошибка подключения к 1С: {e}'}
+
+        if response.status_code in (200, 201):
+            ref_key = existing_ref
+            if not ref_key:
+                try:
+                    ref_key = response.json().get('Ref_Key')
+                except ValueError:
+                    pass
+            return {
+                'booking_id': booking['id'], 'success': True,
+                'action': 'updated' if existing_ref else 'created', 'ref_key': ref_key
+            }
+        return {
+            'booking_id': booking['id'],
+            'success': False,
+            'error': f'1С вернула ошибку {response.status_code}',
+            'detail': response.text[:300]
+        }
+
+    if results is None:
+        print(f"[1C] Пакетная отправка: заявок {len(bookings)}, контрагентов найдено {len(kontragent_keys)}, "
+              f"документов 1С уже известно {len(existing_orders)}")
+        with ThreadPoolExecutor(max_workers=MAX_PARALLEL_REQUESTS) as executor:
+            results = list(executor.map(push, bookings))
+
+    synced_ids = [result['booking_id'] for result in results if result['success']]
+    if synced_ids:
+        created_refs = {
+            result['booking_id']: result['ref_key'] for result in results
+            if result['success'] and result['booking_id'] not in found_orders
+        }
+        conn = get_connection(dsn)
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                "UPDATE bookings SET synced_to_1c = TRUE, synced_to_1c_at = NOW() WHERE id = ANY(%s)",
+                (synced_ids,)
+            )
+            # Заявка из очереди, отклонённая после всех попыток, теперь отправлена
+            cur.execute(
+                """
+                UPDATE onec_outbox SET status = 'done', processed_at = CURRENT_TIMESTAMP, last_error = NULL
+                WHERE booking_id = ANY(%s) AND status = 'failed'
+                """,
+                (synced_ids,)
+            )
+            save_order_refs(conn, created_refs, 'created')
+            save_order_refs(conn, found_orders, 'search')
+            conn.commit()
+            cur.close()
+        finally:
+            release_connection(conn)
+
+    deferred = sum(1 for result in results if result.get('deferred'))
+    for result in results:
+        if not result['success'] and not result.get('deferred'):
+            print(f"[1C] Заявка {result['booking_id']}: {json.dumps(result, ensure_ascii=False)}")
+
+    return {
+        'total': len(results),
+        'synced': len(synced_ids),
+        'failed': len(results) - len(synced_ids) - deferred,
+        'deferred': deferred,
+        'queued': queued,
+        'results': results
+    }
@@ -1,18 +1,27 @@
 import json
 import os
-import psycopg2
 from psycopg2.extras import RealDictCursor
 import requests
 from requests.auth import HTTPBasicAuth
-from datetime import datetime
-from utils_1c import find_kontragent_by_phone, get_vid_remonta, find_marketing_program_by_name, find_existing_order_by_booking_id
+from odata_1c import CircuitOpenError, get_client
+from utils_1c import (
+    find_kontragent_by_phone, get_vid_remonta, find_marketing_program_by_name,
+    find_existing_order_by_booking_id, build_order_document
+)
+from batch_retry import batch_time_budget, retry_batch
+from order_refs import is_backfill_done, find_order_refs, save_order_refs, backfill_order_refs
+from onec_outbox import TIME_BUDGET_SECONDS, claim_booking, drain_outbox, release_booking
 
 import urllib3
+from db import get_connection, release_connection
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 
 def handler(event: dict, context) -> dict:
-    '''Повторная отправка заявки в 1С для заявок, которые не были синхронизированы'''
+    '''Повторная отправка заявки в 1С для заявок, которые не были синхронизированы.
+    {"batch": true, "date_from", "date_to", "limit", "budget"} — пакетная отправка несинхронизированных заявок за период
+    {"backfill_refs": true, "budget"} — разовое заполнение ссылок на документы 1С для старых заявок
+    {"outbox": true, "budget"} — разбор очереди onec_outbox (запускает zeon-cron)'''
 
     if event.get('httpMethod') == 'OPTIONS':
         return {
@@ -36,8 +45,11 @@ def handler(event: dict, context) -> dict:
     raw_body = event.get('body') or '{}'
     body = json.loads(raw_body) if raw_body.strip() else {}
     booking_id = body.get('booking_id')
+    batch_mode = bool(body.get('batch'))
+    backfill_mode = bool(body.get('backfill_refs'))
+    outbox_mode = bool(body.get('outbox'))
 
-    if not booking_id:
+    if not booking_id and not batch_mode and not backfill_mode and not outbox_mode:
         return {
             'statusCode': 400,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -56,7 +68,69 @@ def handler(event: dict, context) -> dict:
             'body': json.dumps({'success': False, 'error': 'Не настроены параметры подключения'})
         }
 
-    conn = psycopg2.connect(dsn)
+    if backfill_mode:
+        try:
+            time_budget = min(float(body.get('budget') or 20), 240)
+        except (TypeError, ValueError):
+            time_budget = 20
+        conn = get_connection(dsn)
+        try:
+            stats = backfill_order_refs(conn, odata_url, HTTPBasicAuth(odata_user, odata_password), time_budget)
+        except Exception as e:
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'success': False, 'error': f'Ошибка заполнения ссылок: {e}'}, ensure_ascii=False)
+            }
+        finally:
+            release_connection(conn)
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'success': True, **stats}, ensure_ascii=False)
+        }
+
+    if outbox_mode:
+        try:
+            time_budget = min(float(body.get('budget') or TIME_BUDGET_SECONDS), 240)
+        except (TypeError, ValueError):
+            time_budget = TIME_BUDGET_SECONDS
+        try:
+            stats = drain_outbox(dsn, odata_url, HTTPBasicAuth(odata_user, odata_password), time_budget)
+        except Exception as e:
+            return {
+                'statusCode': 500,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'success': False, 'error': str(e)}, ensure_ascii=False)
+            }
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'success': True, **stats}, ensure_ascii=False)
+        }
+
+    if batch_mode:
+        try:
+            summary = retry_batch(dsn, odata_url, odata_user, odata_password, body, batch_time_budget(context, body))
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'success': False, 'error': str(e)}, ensure_ascii=False)
+            }
+        except Exception as e:
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'success': False, 'error': f'Ошибка пакетной отправки: {e}'}, ensure_ascii=False)
+            }
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'success': True, **summary}, ensure_ascii=False)
+        }
+
+    conn = get_connection(dsn)
     cur = conn.cursor(cursor_factory=RealDictCursor)
     cur.execute(
         """SELECT id, customer_name, customer_phone, customer_email,
@@ -67,7 +141,14 @@ def handler(event: dict, context) -> dict:
     )
     booking = cur.fetchone()
     cur.close()
-    conn.close()
+    kontragent_info = None
+    existing_ref = None
+    backfill_done = False
+    if booking:
+        kontragent_info = find_kontragent_by_phone(odata_url, odata_user, odata_password, booking.get('customer_phone', ''), conn)
+        existing_ref = find_order_refs(conn, [booking['id']]).get(booking['id'])
+        backfill_done = is_backfill_done(conn)
+    release_connection(conn)
 
     if not booking:
         return {
@@ -76,41 +157,9 @@ def handler(event: dict, context) -> dict:
             'body': json.dumps({'success': False, 'error': 'Заявка не найдена'})
         }
 
-    parts = []
-    if booking.get('customer_phone'):
-        parts.append(f"Телефон: {booking['customer_phone']}")
-    if booking.get('service_type'):
-        parts.append(f"Услуга: {booking['service_type']}")
-    if booking.get('promotion'):
-        parts.append(f"Акция: {booking['promotion']}")
-    if booking.get('car_brand'):
-        parts.append(f"Марка: {booking['car_brand']}")
-    if booking.get('car_model'):
-        parts.append(f"Модель: {booking['car_model']}")
-    if booking.get('preferred_date'):
-        parts.append(f"Желаемая дата: {str(booking['preferred_date'])}")
-    if booking.get('preferred_time'):
-        parts.append(f"Желаемое время: {booking['preferred_time']}")
-    if booking.get('customer_email'):
-        parts.append(f"Email: {booking['customer_email']}")
-    parts.append(f"ID заявки сайта: {booking['id']}")
-    if booking.get('comment'):
-        parts.append(f"Комментарий: {booking['comment']}")
-
-    description = "\n".join(parts)
-    date_str = datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
-
-    doc_data = {
-        "Date": date_str,
-        "ОбращениеККлиенту": booking.get('customer_name', ''),
-        "ПредставлениеТелефонаСтрокой": booking.get('customer_phone', ''),
-        "АдресЭлектроннойПочтыСтрокой": booking.get('customer_email', ''),
-        "ОписаниеПричиныОбращения": description,
-        "Комментарий": description,
-    }
-
-    # Ищем контрагента по телефону
-    kontragent_info = find_kontragent_by_phone(odata_url, odata_user, odata_password, booking.get('customer_phone', ''))
+    doc_data = build_order_document(booking)
+
+    # Контрагент по телефону найден выше, пока было открыто соединение с БД
     if kontragent_info:
         kontragent_key = kontragent_info.get('kontragent_key')
         if kontragent_key:
@@ -120,54 +169,85 @@ def handler(event: dict, context) -> dict:
     # Ищем маркетинговую программу (акцию) по названию
     promotion = booking.get('promotion', '')
     if promotion:
-        marketing_key = find_marketing_program_by_name(odata_url, odata_user, odata_password, promotion)
+        marketing_key = find_marketing_program_by_name(odata_url, odata_user, odata_password, promotion, dsn)
         if marketing_key:
             doc_data["МаркетинговаяПрограмма_Key"] = marketing_key
 
     # Получаем Вид ремонта
-    vid_remont_key = get_vid_remonta(odata_url, odata_user, odata_password)
+    vid_remont_key = get_vid_remonta(odata_url, odata_user, odata_password, dsn)
     if vid_remont_key:
         doc_data["ВидРемонта_Key"] = vid_remont_key
 
-    # Ищем существующий документ в 1С по ID заявки сайта
-    existing_ref = find_existing_order_by_booking_id(odata_url, odata_user, odata_password, booking['id'])
+    # Документ 1С берём из onec_order_refs; искать в 1С нужно, только пока не заполнены ссылки старых заявок
+    ref_source = 'created'
+    if not existing_ref and not backfill_done:
+        existing_ref = find_existing_order_by_booking_id(odata_url, odata_user, odata_password, booking['id'])
+        if existing_ref:
+            ref_source = 'search'
 
     print(f"[1C] body: {json.dumps(doc_data, ensure_ascii=False)}")
 
-    if existing_ref:
-        print(f"[1C] PATCH {odata_url}/Document_ЗаявкаНаРемонт(guid'{existing_ref}')")
-        response = requests.patch(
-            f"{odata_url}/Document_ЗаявкаНаРемонт(guid'{existing_ref}')",
-            auth=HTTPBasicAuth(odata_user, odata_password),
-            headers={'Content-Type': 'application/json', 'Accept': 'application/json', 'If-Match': '*'},
-            json=doc_data,
-            timeout=15,
-            verify=False
-        )
-    else:
-        print(f"[1C] POST {odata_url}/Document_ЗаявкаНаРемонт")
-        response = requests.post(
-            f"{odata_url}/Document_ЗаявкаНаРемонт",
-            auth=HTTPBasicAuth(odata_user, odata_password),
-            headers={'Content-Type': 'application/json', 'Accept': 'application/json'},
-            json=doc_data,
-            timeout=15,
-            verify=False
-        )
+    # Запись очереди этой заявки забираем на время отправки: иначе обработчик очереди
+    # может создать в 1С второй документ параллельно с ручной отправкой
+    conn = get_connection(dsn)
+    try:
+        outbox_ids = claim_booking(conn, booking['id'])
+    finally:
+        release_connection(conn)
+    if outbox_ids is None:
+        return {
+            'statusCode': 409,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'success': False, 'error': 'Заявка сейчас отправляется в 1С из очереди, повторите позже'}, ensure_ascii=False)
+        }
+
+    def release_outbox(error: str) -> None:
+        conn = get_connection(dsn)
+        try:
+            release_booking(conn, outbox_ids, error)
+            conn.commit()
+        finally:
+            release_connection(conn)
+
+    client = get_client(odata_url, odata_user, odata_password)
+    try:
+        if existing_ref:
+            print(f"[1C] PATCH {odata_url}/Document_ЗаявкаНаРемонт(guid'{existing_ref}')")
+            response = client.patch(f"Document_ЗаявкаНаРемонт(guid'{existing_ref}')", doc_data)
+        else:
+            print(f"[1C] POST {odata_url}/Document_ЗаявкаНаРемонт")
+            response = client.post('Document_ЗаявкаНаРемонт', doc_data)
+    except (CircuitOpenError, requests.RequestException) as e:
+        print(f"[1C] error: {e}")
+        release_outbox(f'Ошибка подключения к 1С: {e}')
+        return {
+            'statusCode': 503,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'success': False, 'error': f'Ошибка подключения к 1С: {e}'}, ensure_ascii=False)
+        }
 
     print(f"[1C] status: {response.status_code}")
     print(f"[1C] response: {response.text[:2000]}")
 
     if response.status_code in (200, 201):
-        conn2 = psycopg2.connect(dsn)
+        if existing_ref:
+            ref_key = existing_ref
+        else:
+            try:
+                ref_key = response.json().get('Ref_Key')
+            except ValueError:
+                ref_key = None
+        conn2 = get_connection(dsn)
         cur2 = conn2.cursor()
         cur2.execute(
             "UPDATE bookings SET synced_to_1c = TRUE, synced_to_1c_at = NOW() WHERE id = %s",
             (booking_id,)
         )
+        save_order_refs(conn2, {booking['id']: ref_key}, ref_source)
+        release_booking(conn2, outbox_ids, None)
         conn2.commit()
         cur2.close()
-        conn2.close()
+        release_connection(conn2)
 
         return {
             'statusCode': 200,
@@ -175,6 +255,7 @@ def handler(event: dict, context) -> dict:
             'body': json.dumps({'success': True, 'message': 'Заявка успешно передана в 1С'}, ensure_ascii=False)
         }
     else:
+        release_outbox(f'1С вернула ошибку {response.status_code}: {response.text[:300]}')
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -1,7 +1,15 @@
 import re
 import json
-import requests
+import time
+from datetime import datetime
 from requests.auth import HTTPBasicAuth
+from kontragent_index import is_index_ready, find_kontragent_key, remember_kontragent_phone
+from odata_1c import basic_getter, iter_entities, first_entity, eq, string, substringof
+from reference_cache import get_reference, find_by_name
+
+# Поиск номера в 1С при промахе индекса: сколько телефонов просматриваем и сколько ждём 1С
+PHONE_SCAN_MAX_ROWS = 2000
+PHONE_SCAN_SECONDS = 10
 
 
 def normalize_phone(phone: str) -> str:
@@ -9,10 +17,14 @@ def normalize_phone(phone: str) -> str:
     return re.sub(r'\D', '', phone or '')
 
 
-def find_kontragent_by_phone(odata_url: str, user: str, password: str, phone: str) -> dict | None:
+def find_kontragent_by_phone(odata_url: str, user: str, password: str, phone: str, conn=None) -> dict | None:
     """
     Ищет контрагента в 1С по номеру телефона.
-    ObjectId в записи КонтактнаяИнформация — это Ref_Key самого контрагента.
+    Если передано соединение с БД и локальный индекс телефонов (kontragent_phones) построен,
+    сначала ищет по нему без запросов к 1С.
+    Если индекс не построен или номера в нём нет (клиент создан после последнего прохода),
+    ищет в контактной информации контрагентов (Catalog_Контрагенты_КонтактнаяИнформация),
+    не больше PHONE_SCAN_MAX_ROWS телефонов и PHONE_SCAN_SECONDS, и добавляет найденный номер в индекс.
     Возвращает dict с ключом kontragent_key, или None.
     """
     digits = normalize_phone(phone)
@@ -21,64 +33,95 @@ def find_kontragent_by_phone(odata_url: str, user: str, password: str, phone: st
 
     search_tail = digits[-10:] if len(digits) >= 10 else digits
 
-    try:
-        resp = requests.get(
-            f"{odata_url}/Catalog_Контрагенты_КонтактнаяИнформация?$format=json&$top=2000",
-            auth=HTTPBasicAuth(user, password),
-            headers={'Accept': 'application/json'},
-            timeout=15,
-            verify=False
-        )
-        if resp.status_code == 200:
-            items = resp.json().get('value', [])
-            for item in items:
-                raw = item.get('Представление', '') or ''
-                item_digits = normalize_phone(raw)
-                item_tail = item_digits[-10:] if len(item_digits) >= 10 else item_digits
-                if item_tail and item_tail == search_tail:
-                    kontragent_key = item.get('ObjectId') or item.get('Ref_Key')
-                    print(f"[1C] Найден контрагент по телефону {phone}: ObjectId={item.get('ObjectId')} Ref_Key={item.get('Ref_Key')} ('{raw}')")
+    if conn is not None:
+        try:
+            if is_index_ready(conn):
+                kontragent_key = find_kontragent_key(conn, phone)
+                if kontragent_key:
+                    print(f"[1C] Найден контрагент по телефону {phone} в локальном индексе: {kontragent_key}")
                     return {'kontragent_key': kontragent_key}
+                print(f"[1C] Контрагент по телефону {phone} ({search_tail}) не найден в локальном индексе, ищем в 1С")
+        except Exception as e:
+            print(f"[1C] Ошибка локального индекса телефонов, ищем в 1С: {e}")
+            conn.rollback()
+
+    def same_phone(item: dict) -> bool:
+        if item.get('Тип') != 'Телефон':
+            return False
+        item_digits = normalize_phone(item.get('Представление', '') or '')
+        item_tail = item_digits[-10:] if len(item_digits) >= 10 else item_digits
+        return bool(item_tail) and item_tail == search_tail
 
-            print(f"[1C] Контрагент по телефону {phone} ({search_tail}) не найден среди {len(items)} записей")
-        else:
-            print(f"[1C] Ошибка КонтактнаяИнформация: {resp.status_code}")
+    try:
+        # Номер в 1С хранится в свободном формате: на стороне 1С отбираем только телефоны,
+        # а хвост номера сравниваем здесь. Полный просмотр справочника — работа синхронизации индекса,
+        # здесь он ограничен по строкам и времени. Ref_Key записи табличной части — это Ref_Key самого контрагента
+        item = first_entity(
+            basic_getter(odata_url, HTTPBasicAuth(user, password), timeout=15,
+                         deadline=time.monotonic() + PHONE_SCAN_SECONDS),
+            'Catalog_Контрагенты_КонтактнаяИнформация',
+            filter=eq('Тип', string('Телефон')),
+            select=['Ref_Key', 'Тип', 'Представление'],
+            client_filter=same_phone,
+            max_scan=PHONE_SCAN_MAX_ROWS
+        )
+        if item:
+            print(f"[1C] Найден контрагент по телефону {phone}: Ref_Key={item.get('Ref_Key')} ('{item.get('Представление')}')")
+            if conn is not None:
+                try:
+                    remember_kontragent_phone(conn, phone, item.get('Ref_Key'))
+                except Exception as e:
+                    print(f"[1C] Номер не добавлен в локальный индекс: {e}")
+                    conn.rollback()
+            return {'kontragent_key': item.get('Ref_Key')}
+        print(f"[1C] Контрагент по телефону {phone} ({search_tail}) не найден")
     except Exception as e:
         print(f"[1C] Исключение при поиске контрагента: {e}")
 
     return None
 
 
-def find_marketing_program_by_name(odata_url: str, user: str, password: str, promotion_name: str) -> str | None:
+def find_marketing_program_by_name(odata_url: str, user: str, password: str, promotion_name: str, dsn: str | None = None) -> str | None:
     """
     Ищет маркетинговую программу в 1С по названию (частичное совпадение).
+    С dsn справочник берётся из общего кэша справочников 1С (reference_cache).
     Возвращает Ref_Key или None.
     """
     if not promotion_name:
         return None
 
-    try:
-        resp = requests.get(
-            f"{odata_url}/Catalog_МаркетинговыеПрограммы?$format=json&$top=500",
-            auth=HTTPBasicAuth(user, password),
-            headers={'Accept': 'application/json'},
-            timeout=10,
-            verify=False
-        )
-        if resp.status_code != 200:
-            print(f"[1C] Ошибка загрузки маркетинговых программ: {resp.status_code}")
+    if dsn:
+        try:
+            entry = get_reference(dsn, 'marketing_programs', odata_url, HTTPBasicAuth(user, password))
+            item = find_by_name(entry, promotion_name)
+            if item:
+                print(f"[1C] Найдена маркетинговая программа '{promotion_name}': {item.get('Ref_Key')} ('{item.get('Description')}')")
+                return item.get('Ref_Key')
+            print(f"[1C] Маркетинговая программа '{promotion_name}' не найдена среди {len(entry['items'])} записей")
             return None
+        except Exception as e:
+            print(f"[1C] Ошибка кэша справочников, ищем в 1С: {e}")
 
-        items = resp.json().get('value', [])
-        promo_lower = promotion_name.lower().strip()
-        for item in items:
-            desc = (item.get('Description') or '').lower().strip()
-            if desc and (desc == promo_lower or promo_lower in desc or desc in promo_lower):
-                key = item.get('Ref_Key')
-                print(f"[1C] Найдена маркетинговая программа '{promotion_name}': {key} ('{item.get('Description')}')")
-                return key
+    promo_lower = promotion_name.lower().strip()
 
-        print(f"[1C] Маркетинговая программа '{promotion_name}' не найдена среди {len(items)} записей")
+    def matches(item: dict) -> bool:
+        desc = (item.get('Description') or '').lower().strip()
+        return bool(desc) and (desc == promo_lower or promo_lower in desc or desc in promo_lower)
+
+    try:
+        item = first_entity(
+            basic_getter(odata_url, HTTPBasicAuth(user, password), timeout=10),
+            'Catalog_МаркетинговыеПрограммы',
+            filter=eq('DeletionMark', 'false'),
+            select=['Ref_Key', 'Description'],
+            client_filter=matches,
+            max_scan=500
+        )
+        if item:
+            key = item.get('Ref_Key')
+            print(f"[1C] Найдена маркетинговая программа '{promotion_name}': {key} ('{item.get('Description')}')")
+            return key
+        print(f"[1C] Маркетинговая программа '{promotion_name}' не найдена")
     except Exception as e:
         print(f"[1C] Исключение при поиске маркетинговой программы: {e}")
 
@@ -90,48 +133,114 @@ def find_existing_order_by_booking_id(odata_url: str, user: str, password: str,
     Ищет существующую Заявку на ремонт в 1С по ID заявки сайта в поле ОписаниеПричиныОбращения.
     Возвращает Ref_Key документа или None.
     """
+    search_text = f"ID заявки сайта: {booking_id}"
+    # «ID заявки сайта: 12» не должен совпасть с заявкой 123
+    pattern = re.compile(rf'{re.escape(search_text)}(?!\d)')
+
+    def mentions_booking(item: dict) -> bool:
+        return bool(pattern.search(item.get('ОписаниеПричиныОбращения', '') or '')
+                    or pattern.search(item.get('Комментарий', '') or ''))
+
     try:
-        search_text = f"ID заявки сайта: {booking_id}"
-        resp = requests.get(
-            f"{odata_url}/Document_ЗаявкаНаРемонт?$format=json&$top=500&$orderby=Date desc",
-            auth=HTTPBasicAuth(user, password),
-            headers={'Accept': 'application/json'},
-            timeout=15,
-            verify=False
+        item = first_entity(
+            basic_getter(odata_url, HTTPBasicAuth(user, password), timeout=15),
+            'Document_ЗаявкаНаРемонт',
+            filter=substringof(search_text, 'ОписаниеПричиныОбращения'),
+            select=['Ref_Key', 'ОписаниеПричиныОбращения', 'Комментарий'],
+            orderby='Date desc',
+            client_filter=mentions_booking,
+            max_scan=500
         )
-        if resp.status_code == 200:
-            items = resp.json().get('value', [])
-            for item in items:
-                desc = item.get('ОписаниеПричиныОбращения', '') or ''
-                comment = item.get('Комментарий', '') or ''
-                if search_text in desc or search_text in comment:
-                    ref_key = item.get('Ref_Key')
-                    print(f"[1C] Найден существующий документ для заявки {booking_id}: {ref_key}")
-                    return ref_key
-            print(f"[1C] Существующий документ для заявки {booking_id} не найден среди {len(items)} документов")
-        else:
-            print(f"[1C] Ошибка поиска документов: {resp.status_code}")
+        if item:
+            ref_key = item.get('Ref_Key')
+            print(f"[1C] Найден существующий документ для заявки {booking_id}: {ref_key}")
+            return ref_key
+        print(f"[1C] Существующий документ для заявки {booking_id} не найден")
     except Exception as e:
         print(f"[1C] Исключение при поиске документа: {e}")
     return None
 
 
-def get_vid_remonta(odata_url: str, user: str, password: str) -> str | None:
-    """Получает первый доступный Вид ремонта из справочника 1С"""
+def build_order_document(booking: dict) -> dict:
+    """Документ Document_ЗаявкаНаРемонт по строке bookings (без ссылок на справочники 1С)"""
+    parts = []
+    if booking.get('customer_phone'):
+        parts.append(f"Телефон: {booking['customer_phone']}")
+    if booking.get('service_type'):
+        parts.append(f"Услуга: {booking['service_type']}")
+    if booking.get('promotion'):
+        parts.append(f"Акция: {booking['promotion']}")
+    if booking.get('car_brand'):
+        parts.append(f"Марка: {booking['car_brand']}")
+    if booking.get('car_model'):
+        parts.append(f"Модель: {booking['car_model']}")
+    if booking.get('preferred_date'):
+        parts.append(f"Желаемая дата: {str(booking['preferred_date'])}")
+    if booking.get('preferred_time'):
+        parts.append(f"Желаемое время: {booking['preferred_time']}")
+    if booking.get('customer_email'):
+        parts.append(f"Email: {booking['customer_email']}")
+    parts.append(f"ID заявки сайта: {booking['id']}")
+    if booking.get('comment'):
+        parts.append(f"Комментарий: {booking['comment']}")
+
+    description = "\n".join(parts)
+    date_str = datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
+
+    return {
+        "Date": date_str,
+        "ОбращениеККлиенту": booking.get('customer_name', ''),
+        "ПредставлениеТелефонаСтрокой": booking.get('customer_phone', ''),
+        "АдресЭлектроннойПочтыСтрокой": booking.get('customer_email', ''),
+        "ОписаниеПричиныОбращения": description,
+        "Комментарий": description,
+    }
+
+
+def load_existing_orders(odata_url: str, user: str, password: str, top: int = 500,
+                         deadline: float | None = None) -> dict:
+    """
+    Загружает последние документы Заявка на ремонт одним запросом и строит
+    словарь {ID заявки сайта: Ref_Key} для пакетной повторной отправки.
+    С deadline (time.monotonic()) после дедлайна — TimeoutError.
+    """
+    items = iter_entities(
+        basic_getter(odata_url, HTTPBasicAuth(user, password), timeout=30, deadline=deadline),
+        'Document_ЗаявкаНаРемонт',
+        select=['Ref_Key', 'ОписаниеПричиныОбращения', 'Комментарий'],
+        orderby='Date desc',
+        max_rows=top
+    )
+    orders = {}
+    for item in items:
+        text = f"{item.get('ОписаниеПричиныОбращения') or ''}\n{item.get('Комментарий') or ''}"
+        for match in re.finditer(r'ID заявки сайта: (\d+)', text):
+            orders.setdefault(int(match.group(1)), item.get('Ref_Key'))
+    return orders
+
+
+def get_vid_remonta(odata_url: str, user: str, password: str, dsn: str | None = None) -> str | None:
+    """Получает первый доступный Вид ремонта из справочника 1С (с dsn — из кэша справочников)"""
+    if dsn:
+        try:
+            items = get_reference(dsn, 'repair_types', odata_url, HTTPBasicAuth(user, password))['items']
+            if items:
+                print(f"[1C] ВидРемонта_Key: {items[0].get('Ref_Key')} ({items[0].get('Description', '')})")
+                return items[0].get('Ref_Key')
+        except Exception as e:
+            print(f"[1C] Ошибка кэша справочников, запрашиваем 1С: {e}")
+
     try:
-        resp = requests.get(
-            f"{odata_url}/Catalog_ВидыРемонта?$top=1&$format=json",
-            auth=HTTPBasicAuth(user, password),
-            headers={'Accept': 'application/json'},
-            timeout=10,
-            verify=False
+        item = first_entity(
+            basic_getter(odata_url, HTTPBasicAuth(user, password), timeout=10),
+            'Catalog_ВидыРемонта',
+            filter=eq('DeletionMark', 'false'),
+            select=['Ref_Key', 'Description']
         )
-        if resp.status_code == 200:
-            items = resp.json().get('value', [])
-            if items:
-                key = items[0].get('Ref_Key')
-                print(f"[1C] ВидРемонта_Key: {key} ({items[0].get('Description', '')})")
-                return key
+        if item:
+            key = item.get('Ref_Key')
+            print(f"[1C] ВидРемонта_Key: {key} ({item.get('Description', '')})")
+            return key
     except Exception as e:
         print(f"[1C] Ошибка получения ВидыРемонта: {e}")
-    return None
\ No newline at end of file
+    return None
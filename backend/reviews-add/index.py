@@ -2,6 +2,8 @@ import json
 import os
 import psycopg2
 from datetime import datetime
+from db import get_connection, release_connection
+from catalog_cache import bump_catalog_version
 
 def handler(event: dict, context) -> dict:
     '''API для добавления отзывов вручную (админка)'''
@@ -81,7 +83,7 @@ def handler(event: dict, context) -> dict:
                 'body': json.dumps({'error': 'Database connection not configured'})
             }
 
-        conn = psycopg2.connect(dsn)
+        conn = get_connection(dsn)
         cur = conn.cursor()
 
         customer_name_escaped = customer_name.replace("'", "''")
@@ -97,6 +99,7 @@ def handler(event: dict, context) -> dict:
         """)
 
         result = cur.fetchone()
+        bump_catalog_version(cur, 'reviews')
         conn.commit()
 
         review = {
@@ -112,7 +115,7 @@ def handler(event: dict, context) -> dict:
         }
 
         cur.close()
-        conn.close()
+        release_connection(conn)
 
         return {
             'statusCode': 201,
@@ -1,9 +1,11 @@
 import json
 import os
 import requests
-from requests.auth import HTTPBasicAuth
 from datetime import datetime
+from odata_1c import CircuitOpenError, get_client
 from utils_1c import find_kontragent_by_phone, get_vid_remonta, find_marketing_program_by_name
+from db import get_connection, release_connection
+from order_refs import find_order_refs, save_order_refs
 
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -63,9 +65,6 @@ def handler(event: dict, context) -> dict:
             'body': json.dumps({'success': False, 'error': 'Имя и телефон обязательны'})
         }
 
-    auth = HTTPBasicAuth(doc_user, doc_password)
-    headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
-
     description_parts = []
     if customer_phone:
         description_parts.append(f"Телефон: {customer_phone}")
@@ -100,8 +99,18 @@ def handler(event: dict, context) -> dict:
         "Комментарий": description,
     }
 
-    # Ищем контрагента по телефону
-    kontragent_info = find_kontragent_by_phone(odata_url, doc_user, doc_password, customer_phone)
+    # Ищем контрагента по телефону (в локальном индексе, если подключена БД)
+    dsn = os.environ.get('DATABASE_URL')
+    conn = get_connection(dsn) if dsn else None
+    existing_ref = None
+    try:
+        kontragent_info = find_kontragent_by_phone(odata_url, doc_user, doc_password, customer_phone, conn)
+        # Документ по этой заявке уже создан — обновляем его, а не создаём дубль
+        if conn is not None and str(booking_id or '').isdigit():
+            existing_ref = find_order_refs(conn, [int(booking_id)]).get(int(booking_id))
+    finally:
+        if conn is not None:
+            release_connection(conn)
     kontragent_key = None
     if kontragent_info:
         kontragent_key = kontragent_info.get('kontragent_key')
@@ -111,26 +120,34 @@ def handler(event: dict, context) -> dict:
 
     # Ищем маркетинговую программу (акцию) по названию
     if promotion:
-        marketing_key = find_marketing_program_by_name(odata_url, doc_user, doc_password, promotion)
+        marketing_key = find_marketing_program_by_name(odata_url, doc_user, doc_password, promotion, dsn)
         if marketing_key:
             doc_data["МаркетинговаяПрограмма_Key"] = marketing_key
 
     # Получаем Вид ремонта
-    vid_remont_key = get_vid_remonta(odata_url, doc_user, doc_password)
+    vid_remont_key = get_vid_remonta(odata_url, doc_user, doc_password, dsn)
     if vid_remont_key:
         doc_data["ВидРемонта_Key"] = vid_remont_key
 
-    print(f"[1C] POST {odata_url}/Document_ЗаявкаНаРемонт")
+    client = get_client(odata_url, doc_user, doc_password)
+    if existing_ref:
+        print(f"[1C] PATCH {odata_url}/Document_ЗаявкаНаРемонт(guid'{existing_ref}')")
+    else:
+        print(f"[1C] POST {odata_url}/Document_ЗаявкаНаРемонт")
     print(f"[1C] body: {json.dumps(doc_data, ensure_ascii=False)}")
 
-    response = requests.post(
-        f"{odata_url}/Document_ЗаявкаНаРемонт",
-        auth=auth,
-        headers=headers,
-        json=doc_data,
-        timeout=15,
-        verify=False
-    )
+    try:
+        if existing_ref:
+            response = client.patch(f"Document_ЗаявкаНаРемонт(guid'{existing_ref}')", doc_data)
+        else:
+            response = client.post('Document_ЗаявкаНаРемонт', doc_data)
+    except (CircuitOpenError, requests.RequestException) as e:
+        print(f"[1C] error: {e}")
+        return {
+            'statusCode': 503,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'success': False, 'error': f'Ошибка подключения к 1С: {e}'}, ensure_ascii=False)
+        }
 
     print(f"[1C] status: {response.status_code}")
     print(f"[1C] response: {response.text[:500]}")
@@ -140,13 +157,23 @@ def handler(event: dict, context) -> dict:
             result = response.json()
         except Exception:
             result = {}
+        ref_key = existing_ref or result.get('Ref_Key') or result.get('ref_key', '')
+        if dsn and ref_key and str(booking_id or '').isdigit():
+            conn = get_connection(dsn)
+            try:
+                save_order_refs(conn, {int(booking_id): ref_key})
+                conn.commit()
+            except Exception as e:
+                print(f"[1C] Ссылка на документ не сохранена: {e}")
+            finally:
+                release_connection(conn)
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
             'body': json.dumps({
                 'success': True,
                 'message': 'Заявка передана в 1С',
-                '1c_ref': result.get('Ref_Key') or result.get('ref_key', ''),
+                '1c_ref': ref_key,
                 '1c_number': result.get('Number', ''),
                 'kontragent_found': kontragent_info is not None
             }, ensure_ascii=False)
@@ -0,0 +1,319 @@
+import re
+import time
+import threading
+import requests
+import urllib3
+from typing import Callable, Iterator
+from urllib.parse import quote
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+NULL_GUID = '00000000-0000-0000-0000-000000000000'
+DEFAULT_PAGE_SIZE = 500
+# Эти символы оставляем как есть: без них 1С не разбирает литералы и вызовы функций в $filter
+SAFE_QUERY_CHARS = "',()/:"
+GUID_PATTERN = re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$')
+
+POOL_SIZE = 8
+CONNECT_TIMEOUT_SECONDS = 5
+# Таймаут чтения по типу сущности: документы и регистры 1С отдаёт заметно медленнее справочников
+ENDPOINT_READ_TIMEOUTS = (
+    ('$metadata', 30),
+    ('Document_', 30),
+    ('InformationRegister_', 30),
+    ('Catalog_', 20),
+)
+DEFAULT_READ_TIMEOUT_SECONDS = 15
+# После 5 подряд сбоев соединения или ответов 502/503/504 запросы к 1С 30 секунд не отправляются
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_OPEN_SECONDS = 30
+BREAKER_STATUSES = (502, 503, 504)
+# Так 1С отвечает на $filter, который не умеет выполнить; остальные ошибки 500 — сбой, а не повод читать всё
+UNSUPPORTED_FILTER_STATUSES = (400, 501)
+UNSUPPORTED_FILTER_MARKERS = ('не поддерживается', 'not supported', 'unsupported')
+
+
+class ODataError(Exception):
+    """Ответ 1С с кодом ошибки; status_code помогает отличить неподдерживаемый $filter от сбоя"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f'1С вернула ошибку {status_code}: {message[:300]}')
+        self.status_code = status_code
+
+
+class CircuitOpenError(ODataError):
+    """1С недавно не отвечала: запрос не отправлялся, чтобы не ждать таймаут"""
+
+    def __init__(self, odata_url: str, retry_in: float):
+        Exception.__init__(self, f'1С недоступна, повторная попытка через {retry_in:.0f} с ({odata_url})')
+        self.status_code = 503
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Предохранитель на адрес 1С, общий для всех запросов тёплого контейнера.
+    После BREAKER_FAILURE_THRESHOLD сбоев подряд запросы BREAKER_OPEN_SECONDS отклоняются сразу,
+    затем пропускается один пробный: успех закрывает предохранитель, сбой снова открывает.
+    """
+
+    def __init__(self, odata_url: str):
+        self.odata_url = odata_url
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    def is_open(self) -> bool:
+        with self._lock:
+            return self.opened_at is not None and time.time() < self.opened_at + BREAKER_OPEN_SECONDS
+
+    def before_request(self) -> None:
+        with self._lock:
+            if self.opened_at is None:
+                return
+            retry_in = self.opened_at + BREAKER_OPEN_SECONDS - time.time()
+            if retry_in > 0 or self.probing:
+                raise CircuitOpenError(self.odata_url, max(retry_in, 0))
+            self.probing = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.opened_at is not None:
+                print(f"[1C] {self.odata_url}: связь восстановлена")
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.probing or self.failures >= BREAKER_FAILURE_THRESHOLD:
+                if self.opened_at is None or self.probing:
+                    print(f"[1C] {self.odata_url}: {self.failures} сбоев подряд, запросы приостановлены на {BREAKER_OPEN_SECONDS} с")
+                self.opened_at = time.time()
+                self.probing = False
+
+
+def read_timeout(path: str) -> float:
+    """Таймаут чтения для запроса по имени сущности (см. ENDPOINT_READ_TIMEOUTS)"""
+    entity = path.split('?', 1)[0].rstrip('/').rsplit('/', 1)[-1]
+    for prefix, seconds in ENDPOINT_READ_TIMEOUTS:
+        if entity.startswith(prefix):
+            return seconds
+    return DEFAULT_READ_TIMEOUT_SECONDS
+
+
+class ODataClient:
+    """
+    Клиент 1С на время жизни тёплого контейнера: одна сессия с keep-alive пулом соединений,
+    Basic-авторизацией и сжатием ответов, таймауты по типу сущности и общий предохранитель.
+    Экземпляры берутся через get_client; сессию можно использовать из нескольких потоков.
+    """
+
+    def __init__(self, odata_url: str, user: str, password: str, pool_size: int = POOL_SIZE):
+        self.odata_url = odata_url.rstrip('/')
+        self.auth = HTTPBasicAuth(user, password)
+        self.session = requests.Session()
+        self.session.auth = self.auth
+        self.session.headers.update({'Accept': 'application/json', 'Accept-Encoding': 'gzip, deflate'})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        with _clients_lock:
+            self.breaker = _breakers.setdefault(self.odata_url, CircuitBreaker(self.odata_url))
+
+    def url(self, path: str) -> str:
+        if not path:
+            return self.odata_url
+        return path if path.startswith('http') else f"{self.odata_url}/{path}"
+
+    def request(self, method: str, path: str, timeout: float | None = None, **kwargs) -> requests.Response:
+        """
+        Запрос к 1С по относительному или полному URL. Ответ возвращается как есть;
+        сбой соединения пробрасывается, при открытом предохранителе — CircuitOpenError.
+        """
+        self.breaker.before_request()
+        try:
+            resp = self.session.request(
+                method, self.url(path), timeout=(CONNECT_TIMEOUT_SECONDS, timeout or read_timeout(path)),
+                verify=False, **kwargs
+            )
+        except requests.RequestException:
+            self.breaker.record_failure()
+            raise
+        if resp.status_code in BREAKER_STATUSES:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return resp
+
+    def get(self, path: str, timeout: float | None = None, **kwargs) -> requests.Response:
+        return self.request('GET', path, timeout, **kwargs)
+
+    def post(self, path: str, json: dict, timeout: float | None = None, **kwargs) -> requests.Response:
+        return self.request('POST', path, timeout, json=json, **kwargs)
+
+    def patch(self, path: str, json: dict, timeout: float | None = None, **kwargs) -> requests.Response:
+        headers = {'If-Match': '*', **kwargs.pop('headers', {})}
+        return self.request('PATCH', path, timeout, json=json, headers=headers, **kwargs)
+
+    def get_json(self, path: str, timeout: float | None = None) -> dict:
+        """GET с разбором JSON; при ошибке HTTP — ODataError"""
+        resp = self.get(path, timeout)
+        if not resp.ok:
+            raise ODataError(resp.status_code, resp.text)
+        return resp.json()
+
+
+_clients: dict = {}
+_breakers: dict = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(odata_url: str, user: str, password: str) -> ODataClient:
+    """Клиент для адреса и учётной записи 1С; создаётся один раз на тёплый контейнер"""
+    key = (odata_url.rstrip('/'), user, password)
+    with _clients_lock:
+        client = _clients.get(key)
+    if client is None:
+        client = ODataClient(odata_url, user, password)
+        with _clients_lock:
+            client = _clients.setdefault(key, client)
+    return client
+
+
+def guid(value: str) -> str:
+    """Литерал guid'...' для $filter; чужие строки в запрос не попадают"""
+    if not GUID_PATTERN.match(value or ''):
+        raise ValueError(f'Некорректный GUID: {value}')
+    return f"guid'{value}'"
+
+
+def string(value: str) -> str:
+    """Строковый литерал OData: одинарные кавычки удваиваются"""
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def eq(field: str, literal: str) -> str:
+    return f'{field} eq {literal}'
+
+
+def and_(*conditions: str) -> str:
+    return ' and '.join(f'({c})' if ' or ' in c else c for c in conditions if c)
+
+
+def or_(*conditions: str) -> str:
+    return ' or '.join(c for c in conditions if c)
+
+
+def substringof(text: str, field: str) -> str:
+    return f'substringof({string(text)}, {field})'
+
+
+def build_query(entity: str, filter: str | None = None, select: list | None = None,
+                orderby: str | None = None, top: int | None = None, skip: int | None = None,
+                expand: list | None = None) -> str:
+    """
+    Относительный URL запроса к 1С: Catalog_X?$format=json&$filter=...&$select=...
+    Значения параметров кодируются, поэтому &, # и + в литералах не ломают запрос.
+    """
+    params = [('$format', 'json')]
+    if filter:
+        params.append(('$filter', filter))
+    if select:
+        params.append(('$select', ','.join(select)))
+    if expand:
+        params.append(('$expand', ','.join(expand)))
+    if orderby:
+        params.append(('$orderby', orderby))
+    if top is not None:
+        params.append(('$top', str(top)))
+    if skip:
+        params.append(('$skip', str(skip)))
+    return f"{entity}?" + '&'.join(f"{name}={quote(value, safe=SAFE_QUERY_CHARS)}" for name, value in params)
+
+
+def basic_getter(odata_url: str, auth: HTTPBasicAuth, timeout: float | None = None,
+                 deadline: float | None = None) -> Callable[[str], dict]:
+    """
+    GET по относительному URL с Basic-авторизацией через общий клиент (get_client);
+    при ошибке HTTP — ODataError. Без timeout таймаут выбирается по сущности.
+    С deadline (time.monotonic()) таймаут не дольше остатка, после дедлайна — TimeoutError без запроса.
+    """
+    client = get_client(odata_url, auth.username, auth.password)
+    if deadline is None:
+        return lambda path: client.get_json(path, timeout)
+
+    def get(path: str) -> dict:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f'Истекло время на запросы к 1С: {path.split("?", 1)[0]}')
+        return client.get_json(path, min(timeout or read_timeout(path), remaining))
+    return get
+
+
+def _filter_unsupported(error: ODataError) -> bool:
+    if error.status_code in UNSUPPORTED_FILTER_STATUSES:
+        return True
+    message = str(error).lower()
+    return error.status_code == 500 and any(marker in message for marker in UNSUPPORTED_FILTER_MARKERS)
+
+
+def iter_entities(get: Callable[[str], dict], entity: str, filter: str | None = None, select: list | None = None,
+                  orderby: str | None = None, page_size: int = DEFAULT_PAGE_SIZE, max_rows: int | None = None,
+                  client_filter: Callable[[dict], bool] | None = None, max_scan: int | None = None) -> Iterator[dict]:
+    """
+    Постранично читает набор сущностей: по odata.nextLink, если 1С его отдаёт, иначе по $skip.
+    client_filter уточняет отбор на нашей стороне (для полей, которые 1С фильтровать не умеет).
+    Если 1С отклоняет $filter (400/501 или 500 с сообщением о неподдерживаемом отборе),
+    запрос повторяется без него и отбор целиком делает client_filter; прочие ошибки пробрасываются. max_scan ограничивает число строк, просмотренных с client_filter.
+    """
+    use_server_filter = bool(filter)
+    skip = 0
+    returned = 0
+    scanned = 0
+    next_link = None
+    while True:
+        # С отбором на нашей стороне доля подходящих строк неизвестна — читаем полными страницами
+        if client_filter is not None:
+            top = page_size if max_scan is None else min(page_size, max_scan - scanned)
+        else:
+            top = page_size if max_rows is None else min(page_size, max_rows - returned)
+        if top <= 0:
+            return
+        path = next_link or build_query(
+            entity, filter if use_server_filter else None, select, orderby, top, skip
+        )
+        try:
+            data = get(path)
+        except ODataError as e:
+            if not use_server_filter or client_filter is None or not _filter_unsupported(e):
+                raise
+            print(f"[1C] {entity}: $filter не поддерживается ({e.status_code}), отбор на стороне функции")
+            use_server_filter = False
+            continue
+
+        items = data.get('value', [])
+        scanned += len(items)
+        for item in items:
+            if client_filter is None or client_filter(item):
+                yield item
+                returned += 1
+                if max_rows is not None and returned >= max_rows:
+                    return
+
+        next_link = data.get('odata.nextLink') or data.get('@odata.nextLink')
+        if not next_link:
+            if len(items) < top:
+                return
+            skip += len(items)
+
+
+def first_entity(get: Callable[[str], dict], entity: str, filter: str | None = None, select: list | None = None,
+                 orderby: str | None = None, client_filter: Callable[[dict], bool] | None = None,
+                 max_scan: int | None = None) -> dict | None:
+    """Первая подходящая сущность или None; с фильтром на стороне 1С запрашивается одна строка"""
+    return next(iter_entities(get, entity, filter, select, orderby, DEFAULT_PAGE_SIZE, 1, client_filter, max_scan), None)
@@ -0,0 +1,121 @@
+import re
+import time
+from odata_1c import basic_getter, build_query, guid, GUID_PATTERN
+
+BACKFILL_PAGE_SIZE = 500
+BOOKING_ID_PATTERN = re.compile(r'ID заявки сайта: (\d+)')
+
+
+def is_backfill_done(conn) -> bool:
+    """После разового прохода по документам 1С заявка без ссылки считается не отправленной"""
+    cur = conn.cursor()
+    cur.execute("SELECT completed_at FROM onec_order_refs_backfill WHERE id = 1")
+    row = cur.fetchone()
+    cur.close()
+    return bool(row and row[0])
+
+
+def find_order_refs(conn, booking_ids: list) -> dict:
+    """{booking_id: Ref_Key документа 1С} одним запросом по первичному ключу"""
+    if not booking_ids:
+        return {}
+    cur = conn.cursor()
+    cur.execute("SELECT booking_id, ref_key FROM onec_order_refs WHERE booking_id = ANY(%s)", (list(booking_ids),))
+    refs = dict(cur.fetchall())
+    cur.close()
+    return refs
+
+
+def save_order_refs(conn, refs: dict, source: str = 'created') -> None:
+    """
+    Запоминает ссылки на документы 1С в onec_order_refs и bookings.onec_ref_key.
+    Ссылки созданных нами документов заменяют найденные; найденные не перезаписывают известные.
+    Транзакцию фиксирует вызывающий код.
+    """
+    refs = {booking_id: ref for booking_id, ref in refs.items() if ref and GUID_PATTERN.match(ref)}
+    if not refs:
+        return
+    on_conflict = (
+        "DO UPDATE SET ref_key = EXCLUDED.ref_key, source = EXCLUDED.source, recorded_at = CURRENT_TIMESTAMP"
+        if source == 'created' else "DO NOTHING"
+    )
+    cur = conn.cursor()
+    cur.execute(
+        f"""
+        WITH saved AS (
+            INSERT INTO onec_order_refs (booking_id, ref_key, source)
+            SELECT r.booking_id, r.ref_key, %s
+            FROM unnest(%s::int[], %s::varchar[]) AS r(booking_id, ref_key)
+            JOIN bookings b ON b.id = r.booking_id
+            ON CONFLICT (booking_id) {on_conflict}
+            RETURNING booking_id, ref_key
+        )
+        UPDATE bookings b SET onec_ref_key = saved.ref_key
+        FROM saved WHERE b.id = saved.booking_id
+        """,
+        (source, list(refs.keys()), list(refs.values()))
+    )
+    cur.close()
+
+
+def backfill_order_refs(conn, odata_url: str, auth, time_budget: float = 20.0) -> dict:
+    """
+    Разовое заполнение onec_order_refs по документам, созданным до появления таблицы.
+    Document_ЗаявкаНаРемонт читается страницами по возрастанию Ref_Key (как Catalog_Контрагенты
+    в kontragent_index): новые и удалённые документы не сдвигают позицию. ID заявки сайта берётся из описания.
+    Позиция хранится в onec_order_refs_backfill, поэтому проход растягивается на несколько запусков;
+    завершённый проход не повторяется.
+    """
+    deadline = time.monotonic() + time_budget
+    get = basic_getter(odata_url, auth, timeout=30)
+    cur = conn.cursor()
+    cur.execute(
+        """
+        INSERT INTO onec_order_refs_backfill (id) VALUES (1)
+        ON CONFLICT (id) DO UPDATE SET last_run_at = CURRENT_TIMESTAMP
+        RETURNING last_key, documents_seen, completed_at
+        """
+    )
+    last_key, seen, completed_at = cur.fetchone()
+    conn.commit()
+    if completed_at:
+        cur.close()
+        return {'pages': 0, 'found': 0, 'documents': seen, 'pass_completed': True}
+
+    pages = 0
+    found = 0
+    completed = False
+    while time.monotonic() < deadline:
+        page = get(build_query(
+            'Document_ЗаявкаНаРемонт', filter=f"Ref_Key gt {guid(last_key)}" if last_key else None,
+            select=['Ref_Key', 'ОписаниеПричиныОбращения', 'Комментарий'],
+            orderby='Ref_Key', top=BACKFILL_PAGE_SIZE
+        )).get('value', [])
+        refs = {}
+        for item in page:
+            text = f"{item.get('ОписаниеПричиныОбращения') or ''}\n{item.get('Комментарий') or ''}"
+            for match in BOOKING_ID_PATTERN.finditer(text):
+                refs.setdefault(int(match.group(1)), item.get('Ref_Key'))
+        save_order_refs(conn, refs, 'backfill')
+        if page:
+            last_key = page[-1].get('Ref_Key') or last_key
+        seen += len(page)
+        pages += 1
+        found += len(refs)
+        completed = len(page) < BACKFILL_PAGE_SIZE
+        cur.execute(
+            """
+            UPDATE onec_order_refs_backfill
+            SET last_key = %s, documents_seen = %s, last_run_at = CURRENT_TIMESTAMP,
+                completed_at = CASE WHEN %s THEN CURRENT_TIMESTAMP ELSE completed_at END
+            WHERE id = 1
+            """,
+            (last_key, seen, completed)
+        )
+        conn.commit()
+        if completed:
+            print(f"[1C] Ссылки на документы: проход завершён, просмотрено документов {seen}")
+            break
+
+    cur.close()
+    return {'pages': pages, 'found': found, 'documents': seen, 'pass_completed': completed}
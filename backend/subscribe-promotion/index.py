@@ -1,10 +1,10 @@
 import json
 import os
 import smtplib
-import psycopg2
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime
+from db import get_connection, release_connection
 
 LOGO_URL = 'https://cdn.poehali.dev/projects/06c15a5e-698d-45c4-8ef4-b26fa9657aca/bucket/979b7247-a981-48f4-9326-8c07c9b7658d.png'
 SITE_URL = 'https://hybrid24.ru'
@@ -95,7 +95,7 @@ def handler(event: dict, context) -> dict:
                 'body': json.dumps({'success': False, 'error': 'Некорректный email'})
             }
         schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = get_connection(os.environ['DATABASE_URL'])
         cursor = conn.cursor()
         cursor.execute(
             f'UPDATE {schema}.subscriptions SET is_active = FALSE WHERE email = %s',
@@ -103,7 +103,7 @@ def handler(event: dict, context) -> dict:
         )
         conn.commit()
         cursor.close()
-        conn.close()
+        release_connection(conn)
         html = f"""<!DOCTYPE html>
 <html lang="ru"><head><meta charset="UTF-8"><meta name="viewport" content="width=device-width,initial-scale=1">
 <title>Отписка от рассылки</title></head>
@@ -148,7 +148,7 @@ def handler(event: dict, context) -> dict:
         }
 
     schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn = get_connection(os.environ['DATABASE_URL'])
     cursor = conn.cursor()
 
     cursor.execute(
@@ -160,7 +160,7 @@ def handler(event: dict, context) -> dict:
     if existing:
         if existing[1]:
             cursor.close()
-            conn.close()
+            release_connection(conn)
             return {
                 'statusCode': 200,
                 'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
@@ -179,7 +179,7 @@ def handler(event: dict, context) -> dict:
 
     conn.commit()
     cursor.close()
-    conn.close()
+    release_connection(conn)
 
     _send_admin_notification(email)
     _send_welcome_email(email)
@@ -0,0 +1,59 @@
+import json
+import os
+from typing import Dict, Any
+from requests.auth import HTTPBasicAuth
+from onec_outbox import TIME_BUDGET_SECONDS, drain_outbox
+
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Отправляет в 1С заявки из очереди onec_outbox (запускается по расписанию)
+    Args: event - HTTP запрос, ?budget=секунды ограничивает время разбора; context - контекст выполнения
+    Returns: HTTP response со статистикой: отправлено, отложено на повтор, отклонено окончательно, остаток очереди
+    '''
+    method: str = event.get('httpMethod', 'GET')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': ''
+        }
+
+    odata_url = os.environ.get('ODATA_1C_URL', '').rstrip('/')
+    doc_user = os.environ.get('ODATA_1C_DOC_USER') or os.environ.get('ODATA_1C_USER')
+    doc_password = os.environ.get('ODATA_1C_DOC_PASSWORD') or os.environ.get('ODATA_1C_PASSWORD')
+    dsn = os.environ.get('DATABASE_URL')
+
+    if not all([odata_url, doc_user, doc_password, dsn]):
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'success': False, 'error': 'Не настроены параметры подключения'}, ensure_ascii=False)
+        }
+
+    params = event.get('queryStringParameters') or {}
+    try:
+        time_budget = min(float(params.get('budget') or TIME_BUDGET_SECONDS), 240)
+    except ValueError:
+        time_budget = TIME_BUDGET_SECONDS
+
+    try:
+        stats = drain_outbox(dsn, odata_url, HTTPBasicAuth(doc_user, doc_password), time_budget)
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'success': False, 'error': str(e)}, ensure_ascii=False)
+        }
+
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps({'success': True, **stats}, ensure_ascii=False)
+    }
@@ -0,0 +1,300 @@
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2.extras import RealDictCursor
+from db import get_connection, release_connection
+from odata_1c import NULL_GUID, get_client
+from reference_cache import get_reference, find_by_name
+from order_refs import save_order_refs
+
+BATCH_SIZE = 20
+MAX_PARALLEL_REQUESTS = 4
+MAX_ATTEMPTS = 10
+BASE_RETRY_DELAY_SECONDS = 30
+MAX_RETRY_DELAY_SECONDS = 3600
+# Запись, взятая упавшим обработчиком, снова становится доступной через это время
+PROCESSING_TIMEOUT_SECONDS = 300
+TIME_BUDGET_SECONDS = 50
+
+
+def _build_document(booking_data: dict, booking_id: int, marketing_key: str | None) -> dict:
+    """Документ Document_ЗаявкаНаРемонт из данных заявки"""
+    parts = []
+    if booking_data.get('phone'):
+        parts.append(f"Телефон: {booking_data['phone']}")
+    if booking_data.get('service'):
+        parts.append(f"Услуга: {booking_data['service']}")
+    if booking_data.get('promotion'):
+        parts.append(f"Акция: {booking_data['promotion']}")
+    if booking_data.get('car_full_name'):
+        parts.append(f"Автомобиль: {booking_data['car_full_name']}")
+    elif booking_data.get('brand'):
+        parts.append(f"Марка: {booking_data['brand']}")
+        if booking_data.get('model'):
+            parts.append(f"Модель: {booking_data['model']}")
+    if booking_data.get('vin'):
+        parts.append(f"VIN: {booking_data['vin']}")
+    if booking_data.get('plate_number'):
+        parts.append(f"Гос.Номер: {booking_data['plate_number']}")
+    if booking_data.get('date'):
+        parts.append(f"Желаемая дата: {booking_data['date']}")
+    if booking_data.get('time'):
+        parts.append(f"Желаемое время: {booking_data['time']}")
+    if booking_data.get('email'):
+        parts.append(f"Email: {booking_data['email']}")
+    parts.append(f"ID заявки сайта: {booking_id}")
+    if booking_data.get('comment'):
+        parts.append(f"Комментарий: {booking_data['comment']}")
+
+    description = "\n".join(parts)
+
+    doc_data = {
+        "Date": booking_data.get('created_at'),
+        "ОбращениеККлиенту": booking_data.get('name', ''),
+        "ПредставлениеТелефонаСтрокой": booking_data.get('phone', ''),
+        "АдресЭлектроннойПочтыСтрокой": booking_data.get('email', ''),
+        "ОписаниеПричиныОбращения": description,
+        "Комментарий": description,
+    }
+
+    # Контрагент из 1С (если найден при создании заявки)
+    kontragent_key = booking_data.get('kontragent_key')
+    if kontragent_key and kontragent_key != NULL_GUID:
+        doc_data["Заказчик_Key"] = kontragent_key
+        doc_data["Контрагент_Key"] = kontragent_key
+
+    # Автомобиль из 1С
+    avtomobil_key = booking_data.get('avtomobil_key')
+    if avtomobil_key and avtomobil_key != NULL_GUID:
+        doc_data["Автомобиль_Key"] = avtomobil_key
+
+    # VIN и госномер
+    if booking_data.get('vin'):
+        doc_data["VIN"] = booking_data['vin']
+    if booking_data.get('plate_number'):
+        doc_data["ГосНомер"] = booking_data['plate_number']
+
+    if marketing_key:
+        doc_data["МаркетинговаяПрограмма_Key"] = marketing_key
+
+    return doc_data
+
+
+def _send(odata_url: str, auth, dsn: str, item: dict) -> tuple:
+    """
+    Отправляет одну запись очереди; возвращает (id, ошибка или None, Ref_Key документа).
+    Если документ уже создан (ссылка есть в onec_order_refs), он обновляется, а не создаётся повторно.
+    """
+    booking_data = item['payload']
+    marketing_key = None
+    if booking_data.get('promotion'):
+        try:
+            marketing = find_by_name(get_reference(dsn, 'marketing_programs', odata_url, auth), booking_data['promotion'])
+            marketing_key = marketing.get('Ref_Key') if marketing else None
+        except Exception as e:
+            print(f"[1C] Маркетинговая программа не определена: {e}")
+
+    doc_data = _build_document(booking_data, item['booking_id'], marketing_key)
+    client = get_client(odata_url, auth.username, auth.password)
+    ref_key = item.get('ref_key')
+    try:
+        if ref_key:
+            response = client.patch(f"Document_ЗаявкаНаРемонт(guid'{ref_key}')", doc_data)
+        else:
+            response = client.post('Document_ЗаявкаНаРемонт', doc_data)
+    except Exception as e:
+        return item['id'], f'Ошибка подключения к 1С: {e}', None
+    if response.status_code in (200, 201):
+        if not ref_key:
+            try:
+                ref_key = response.json().get('Ref_Key')
+            except ValueError:
+                pass
+        return item['id'], None, ref_key
+    return item['id'], f'1С вернула ошибку {response.status_code}: {response.text[:300]}', None
+
+
+def _claim_batch(conn) -> list:
+    """Берёт пачку просроченных записей; SKIP LOCKED не даёт двум обработчикам взять одну запись"""
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    # Заявки, уже отправленные вручную через retry-1c-sync, повторно не отправляем
+    cur.execute(
+        """
+        UPDATE onec_outbox o
+        SET status = 'done', processed_at = CURRENT_TIMESTAMP, last_error = NULL
+        FROM bookings b
+        WHERE o.booking_id = b.id AND o.status = 'pending' AND b.synced_to_1c = TRUE
+        """
+    )
+    cur.execute(
+        """
+        UPDATE onec_outbox o
+        SET status = 'processing', locked_at = CURRENT_TIMESTAMP, attempts = o.attempts + 1
+        WHERE o.id IN (
+            SELECT id FROM onec_outbox
+            WHERE ((status = 'pending' AND next_attempt_at <= CURRENT_TIMESTAMP)
+                OR (status = 'processing' AND locked_at < CURRENT_TIMESTAMP - make_interval(secs => %s)))
+            ORDER BY next_attempt_at, id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING o.id, o.booking_id, o.payload, o.attempts,
+                  (SELECT r.ref_key FROM onec_order_refs r WHERE r.booking_id = o.booking_id) AS ref_key
+        """,
+        (PROCESSING_TIMEOUT_SECONDS, BATCH_SIZE)
+    )
+    batch = cur.fetchall()
+    conn.commit()
+    cur.close()
+    return batch
+
+
+def claim_booking(conn, booking_id: int) -> list | None:
+    """
+    Забирает записи очереди заявки под ручную отправку (retry-1c-sync), чтобы обработчик очереди
+    не отправил её одновременно. Возвращает id взятых записей; None — заявку сейчас отправляет обработчик
+    """
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT id, status = 'processing' AND locked_at >= CURRENT_TIMESTAMP - make_interval(secs => %s)
+        FROM onec_outbox
+        WHERE booking_id = %s AND status IN ('pending', 'processing', 'failed')
+        FOR UPDATE
+        """,
+        (PROCESSING_TIMEOUT_SECONDS, booking_id)
+    )
+    rows = cur.fetchall()
+    if any(busy for _, busy in rows):
+        conn.rollback()
+        cur.close()
+        return None
+    ids = [row_id for row_id, _ in rows]
+    if ids:
+        cur.execute(
+            "UPDATE onec_outbox SET status = 'processing', locked_at = CURRENT_TIMESTAMP WHERE id = ANY(%s)",
+            (ids,)
+        )
+    conn.commit()
+    cur.close()
+    return ids
+
+
+def release_booking(conn, ids: list, error: str | None) -> None:
+    """
+    Возвращает записи, взятые claim_booking: без ошибки они закрываются, с ошибкой — снова ждут обработчик.
+    Транзакцию фиксирует вызывающий
+    """
+    if not ids:
+        return
+    cur = conn.cursor()
+    if error is None:
+        cur.execute(
+            """
+            UPDATE onec_outbox
+            SET status = 'done', processed_at = CURRENT_TIMESTAMP, locked_at = NULL, last_error = NULL
+            WHERE id = ANY(%s)
+            """,
+            (ids,)
+        )
+    else:
+        cur.execute(
+            "UPDATE onec_outbox SET status = 'pending', locked_at = NULL, last_error = %s WHERE id = ANY(%s)",
+            (error, ids)
+        )
+    cur.close()
+
+
+def _retry_delay(attempts: int) -> int:
+    """Экспоненциальная задержка с разбросом, чтобы после сбоя 1С записи не шли одной волной"""
+    delay = min(BASE_RETRY_DELAY_SECONDS * 2 ** (attempts - 1), MAX_RETRY_DELAY_SECONDS)
+    return int(delay * random.uniform(0.8, 1.2))
+
+
+def _save_results(conn, batch: list, errors: dict, refs: dict) -> dict:
+    """Фиксирует результаты пачки и ссылки на созданные документы 1С одной транзакцией"""
+    sent = [item['id'] for item in batch if errors.get(item['id']) is None]
+    retry = [
+        (item['id'], errors[item['id']], _retry_delay(item['attempts']))
+        for item in batch if errors.get(item['id']) is not None and item['attempts'] < MAX_ATTEMPTS
+    ]
+    failed = [
+        (item['id'], errors[item['id']])
+        for item in batch if errors.get(item['id']) is not None and item['attempts'] >= MAX_ATTEMPTS
+    ]
+
+    cur = conn.cursor()
+    if sent:
+        cur.execute(
+            """
+            WITH done AS (
+                UPDATE onec_outbox
+                SET status = 'done', processed_at = CURRENT_TIMESTAMP, locked_at = NULL, last_error = NULL
+                WHERE id = ANY(%s)
+                RETURNING booking_id
+            )
+            UPDATE bookings SET synced_to_1c = TRUE, synced_to_1c_at = NOW()
+            WHERE id IN (SELECT booking_id FROM done)
+            """,
+            (sent,)
+        )
+    if retry:
+        cur.execute(
+            """
+            UPDATE onec_outbox o
+            SET status = 'pending', locked_at = NULL, last_error = r.error,
+                next_attempt_at = CURRENT_TIMESTAMP + make_interval(secs => r.delay)
+            FROM unnest(%s::bigint[], %s::text[], %s::int[]) AS r(id, error, delay)
+            WHERE o.id = r.id
+            """,
+            ([r[0] for r in retry], [r[1] for r in retry], [r[2] for r in retry])
+        )
+    if failed:
+        cur.execute(
+            """
+            UPDATE onec_outbox o
+            SET status = 'failed', locked_at = NULL, last_error = r.error, processed_at = CURRENT_TIMESTAMP
+            FROM unnest(%s::bigint[], %s::text[]) AS r(id, error)
+            WHERE o.id = r.id
+            """,
+            ([r[0] for r in failed], [r[1] for r in failed])
+        )
+    save_order_refs(conn, {item['booking_id']: refs.get(item['id']) for item in batch if item['id'] in sent})
+    conn.commit()
+    cur.close()
+    return {'sent': len(sent), 'retry_scheduled': len(retry), 'failed': len(failed)}
+
+
+def drain_outbox(dsn: str, odata_url: str, auth, time_budget: float) -> dict:
+    """Разбирает очередь пачками по BATCH_SIZE, пока есть записи и не вышло время"""
+    deadline = time.monotonic() + time_budget
+    totals = {'sent': 0, 'retry_scheduled': 0, 'failed': 0}
+    breaker = get_client(odata_url, auth.username, auth.password).breaker
+    conn = get_connection(dsn)
+    try:
+        with ThreadPoolExecutor(max_workers=MAX_PARALLEL_REQUESTS) as executor:
+            while time.monotonic() < deadline:
+                # 1С не отвечает: остаток очереди не трогаем, чтобы не тратить на него попытки
+                if breaker.is_open():
+                    print("[1C] 1С недоступна, разбор очереди отложен до следующего запуска")
+                    break
+                batch = _claim_batch(conn)
+                if not batch:
+                    break
+                results = list(executor.map(lambda item: _send(odata_url, auth, dsn, item), batch))
+                errors = {item_id: error for item_id, error, _ in results}
+                refs = {item_id: ref_key for item_id, _, ref_key in results}
+                for item_id, error in errors.items():
+                    if error:
+                        print(f"[1C] outbox {item_id}: {error}")
+                stats = _save_results(conn, batch, errors, refs)
+                for key, value in stats.items():
+                    totals[key] += value
+
+        cur = conn.cursor()
+        cur.execute("SELECT status, COUNT(*) FROM onec_outbox WHERE status IN ('pending', 'processing', 'failed') GROUP BY status")
+        totals['queue'] = {status: count for status, count in cur.fetchall()}
+        cur.close()
+    finally:
+        release_connection(conn)
+    return totals
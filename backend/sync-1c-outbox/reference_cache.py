@@ -0,0 +1,199 @@
+import re
+import json
+import time
+import threading
+from db import get_connection, release_connection
+from odata_1c import basic_getter, iter_entities, eq
+
+# Справочники меняются несколько раз в месяц: свежими считаем 6 часов,
+# устаревшие до 14 дней отдаём сразу и обновляем в фоне
+REFERENCE_TTL_SECONDS = 6 * 3600
+REFERENCE_MAX_STALE_SECONDS = 14 * 24 * 3600
+REFRESH_LOCK_SECONDS = 60
+
+# Набор сущностей 1С и поля, которые нужны функциям; помеченные на удаление отбрасываются
+REFERENCE_CATALOGS = {
+    'marketing_programs': ('Catalog_МаркетинговыеПрограммы', ['Ref_Key', 'Description', 'DeletionMark']),
+    'repair_types': ('Catalog_ВидыРемонта', ['Ref_Key', 'Description', 'DeletionMark']),
+    'car_brands': ('Catalog_МаркиАвтомобилей', ['Ref_Key', 'Description', 'DeletionMark']),
+    'car_models': ('Catalog_МоделиАвтомобилей', ['Ref_Key', 'Description', 'Owner_Key', 'DeletionMark']),
+}
+
+_entries: dict = {}
+_refreshing: set = set()
+_lock = threading.Lock()
+
+
+def normalize_name(value: str) -> str:
+    """Приводит название к виду для сравнения: нижний регистр, ё → е, одиночные пробелы"""
+    return re.sub(r'\s+', ' ', (value or '').lower().replace('ё', 'е')).strip()
+
+
+def _build_entry(items: list, fetched_at: float) -> dict:
+    """Элементы справочника и предсобранные индексы: по Ref_Key, по точному названию и по словам"""
+    by_key = {}
+    by_name = {}
+    by_word = {}
+    names = []
+    for position, item in enumerate(items):
+        by_key[item.get('Ref_Key')] = item
+        name = normalize_name(item.get('Description'))
+        names.append(name)
+        if name:
+            by_name.setdefault(name, item)
+            for word in set(name.split(' ')):
+                by_word.setdefault(word, []).append(position)
+    return {
+        'items': items, 'by_key': by_key, 'by_name': by_name, 'by_word': by_word,
+        'names': names, 'fetched_at': fetched_at
+    }
+
+
+def find_by_name(entry: dict, name: str) -> dict | None:
+    """
+    Ищет элемент по названию: точное совпадение, затем вхождение одной строки в другую.
+    Кандидаты на вхождение берутся из индекса по словам, полный перебор —
+    только если ни одно слово запроса не встретилось в справочнике.
+    """
+    query = normalize_name(name)
+    if not query:
+        return None
+    exact = entry['by_name'].get(query)
+    if exact:
+        return exact
+
+    positions = sorted({p for word in query.split(' ') for p in entry['by_word'].get(word, [])})
+    candidates = positions or range(len(entry['items']))
+    for position in candidates:
+        desc = entry['names'][position]
+        if desc and (query in desc or desc in query):
+            return entry['items'][position]
+    if positions:
+        # Вхождение внутри слова («шин» в «шиномонтаж») индекс по словам не видит
+        for position, desc in enumerate(entry['names']):
+            if desc and (query in desc or desc in query):
+                return entry['items'][position]
+    return None
+
+
+def _fetch(catalog: str, odata_url: str, auth) -> list:
+    entity, select = REFERENCE_CATALOGS[catalog]
+    return list(iter_entities(
+        basic_getter(odata_url, auth, timeout=15), entity,
+        filter=eq('DeletionMark', 'false'), select=select,
+        client_filter=lambda item: not item.get('DeletionMark')
+    ))
+
+
+def _store(conn, catalog: str, items: list) -> None:
+    cur = conn.cursor()
+    cur.execute(
+        """
+        INSERT INTO onec_reference_cache (catalog, payload, items_count, fetched_at, refreshing_since)
+        VALUES (%s, %s::jsonb, %s, CURRENT_TIMESTAMP, NULL)
+        ON CONFLICT (catalog)
+        DO UPDATE SET payload = EXCLUDED.payload, items_count = EXCLUDED.items_count,
+                      fetched_at = CURRENT_TIMESTAMP, refreshing_since = NULL
+        """,
+        (catalog, json.dumps(items, ensure_ascii=False), len(items))
+    )
+    conn.commit()
+    cur.close()
+
+
+def _remember(catalog: str, entry: dict) -> dict:
+    with _lock:
+        _entries[catalog] = entry
+    return entry
+
+
+def _refresh_in_background(dsn: str, catalog: str, odata_url: str, auth) -> None:
+    """
+    Обновляет справочник, если копия в БД всё ещё устарела
+    и ни одна другая функция не занята этим последнюю минуту
+    """
+    conn = get_connection(dsn)
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            UPDATE onec_reference_cache SET refreshing_since = CURRENT_TIMESTAMP
+            WHERE catalog = %s
+              AND fetched_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+              AND (refreshing_since IS NULL OR refreshing_since < CURRENT_TIMESTAMP - make_interval(secs => %s))
+            RETURNING catalog
+            """,
+            (catalog, REFERENCE_TTL_SECONDS, REFRESH_LOCK_SECONDS)
+        )
+        claimed = cur.fetchone() is not None
+        conn.commit()
+        cur.close()
+        if claimed:
+            items = _fetch(catalog, odata_url, auth)
+            _store(conn, catalog, items)
+            _remember(catalog, _build_entry(items, time.time()))
+            print(f"[1C] Справочник {catalog} обновлён в фоне: {len(items)} элементов")
+    except Exception as e:
+        print(f"[1C] Ошибка фонового обновления справочника {catalog}: {e}")
+    finally:
+        release_connection(conn)
+        with _lock:
+            _refreshing.discard(catalog)
+
+
+def get_reference(dsn: str, catalog: str, odata_url: str, auth) -> dict:
+    """
+    Возвращает справочник 1С с индексами (см. _build_entry).
+    Порядок: память тёплого контейнера → onec_reference_cache → 1С.
+    Когда копия в памяти устарела, сначала перечитывается onec_reference_cache: справочник
+    мог уже обновить другой контейнер. Устаревший, но не старше REFERENCE_MAX_STALE_SECONDS
+    справочник отдаётся сразу, а обновление запускается в фоновом потоке; более старый
+    загружается из 1С до ответа (фоновый поток может быть остановлен после ответа функции).
+    Если 1С недоступна, отдаётся последняя копия.
+    """
+    now = time.time()
+    with _lock:
+        entry = _entries.get(catalog)
+    if entry and now - entry['fetched_at'] < REFERENCE_TTL_SECONDS:
+        return entry
+
+    conn = get_connection(dsn)
+    try:
+        # Сначала только возраст копии в БД; payload читаем, если она новее той, что в памяти
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - fetched_at) FROM onec_reference_cache WHERE catalog = %s",
+            (catalog,)
+        )
+        row = cur.fetchone()
+        if row:
+            stored_at = now - float(row[0])
+            if not entry or stored_at > entry['fetched_at'] + 1:
+                cur.execute("SELECT payload FROM onec_reference_cache WHERE catalog = %s", (catalog,))
+                payload = cur.fetchone()
+                if payload:
+                    entry = _remember(catalog, _build_entry(payload[0], stored_at))
+        cur.close()
+        if entry and now - entry['fetched_at'] < REFERENCE_TTL_SECONDS:
+            return entry
+
+        if entry and now - entry['fetched_at'] < REFERENCE_MAX_STALE_SECONDS:
+            with _lock:
+                start = catalog not in _refreshing
+                _refreshing.add(catalog)
+            if start:
+                threading.Thread(
+                    target=_refresh_in_background, args=(dsn, catalog, odata_url, auth), daemon=True
+                ).start()
+            return entry
+
+        try:
+            items = _fetch(catalog, odata_url, auth)
+        except Exception as e:
+            print(f"[1C] Справочник {catalog} не загружен из 1С: {e}")
+            return entry or _build_entry([], 0)
+        _store(conn, catalog, items)
+        print(f"[1C] Справочник {catalog} загружен из 1С: {len(items)} элементов")
+        return _remember(catalog, _build_entry(items, time.time()))
+    finally:
+        release_connection(conn)
@@ -1,8 +1,8 @@
 import json
 import os
 import requests
-from requests.auth import HTTPBasicAuth
 from datetime import datetime
+from odata_1c import CircuitOpenError, get_client
 
 def handler(event: dict, context) -> dict:
     '''API для тестирования интеграции с 1С через OData'''
@@ -37,14 +37,10 @@ def handler(event: dict, context) -> dict:
             })
         }
     
-    auth = HTTPBasicAuth(odata_user, odata_password)
-    
-    import urllib3
-    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-    ssl_verify = False
+    client = get_client(odata_url, odata_user, odata_password)
     doc_user = os.environ.get('ODATA_1C_DOC_USER', odata_user)
     doc_password = os.environ.get('ODATA_1C_DOC_PASSWORD', odata_password)
-    doc_auth = HTTPBasicAuth(doc_user, doc_password)
+    doc_client = get_client(odata_url, doc_user, doc_password)
     
     try:
         query_params = event.get('queryStringParameters', {}) or {}
@@ -52,13 +48,7 @@ def handler(event: dict, context) -> dict:
         
         if method == 'GET':
             if action == 'ping':
-                response = requests.get(
-                    odata_url,
-                    auth=auth,
-                    timeout=10,
-                    headers={'Accept': 'application/json'},
-                    verify=ssl_verify
-                )
+                response = client.get('', timeout=10)
                 
                 try:
                     data = response.json()
@@ -96,12 +86,7 @@ def handler(event: dict, context) -> dict:
             elif action == 'metadata':
                 import xml.etree.ElementTree as ET
                 
-                response = requests.get(
-                    f"{odata_url}/$metadata",
-                    auth=auth,
-                    timeout=10,
-                    verify=ssl_verify
-                )
+                response = client.get("$metadata", timeout=10, headers={'Accept': 'application/xml'})
                 
                 try:
                     root = ET.fromstring(response.text)
@@ -165,13 +150,7 @@ def handler(event: dict, context) -> dict:
                     }
             
             elif action == 'services':
-                response = requests.get(
-                    f"{odata_url}/Catalog_Services",
-                    auth=auth,
-                    headers={'Accept': 'application/json'},
-                    timeout=10,
-                    verify=ssl_verify
-                )
+                response = client.get("Catalog_Services", timeout=10)
                 
                 data = response.json()
                 
@@ -192,12 +171,7 @@ def handler(event: dict, context) -> dict:
             elif action == 'schema':
                 import xml.etree.ElementTree as ET
                 entity = query_params.get('entity', 'Document_ЗаявкаНаРемонт')
-                response = requests.get(
-                    f"{odata_url}/$metadata",
-                    auth=auth,
-                    timeout=15,
-                    verify=ssl_verify
-                )
+                response = client.get("$metadata", timeout=15, headers={'Accept': 'application/xml'})
                 try:
                     root = ET.fromstring(response.text)
                     ns = {
@@ -236,13 +210,7 @@ def handler(event: dict, context) -> dict:
                     }
 
             elif action == 'read_doc':
-                response = requests.get(
-                    f"{odata_url}/Document_ЗаявкаНаРемонт?$top=1&$format=json",
-                    auth=doc_auth,
-                    headers={'Accept': 'application/json'},
-                    timeout=15,
-                    verify=ssl_verify
-                )
+                response = doc_client.get("Document_ЗаявкаНаРемонт?$top=1&$format=json", timeout=15)
                 return {
                     'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -255,13 +223,7 @@ def handler(event: dict, context) -> dict:
                 }
 
             elif action == 'read_org':
-                response = requests.get(
-                    f"{odata_url}/Catalog_Организации?$top=5&$format=json&$select=Ref_Key,Description",
-                    auth=doc_auth,
-                    headers={'Accept': 'application/json'},
-                    timeout=15,
-                    verify=ssl_verify
-                )
+                response = doc_client.get("Catalog_Организации?$top=5&$format=json&$select=Ref_Key,Description", timeout=15)
                 return {
                     'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -276,13 +238,7 @@ def handler(event: dict, context) -> dict:
             elif action == 'sample':
                 entity = query_params.get('entity', 'Catalog_Автомобили')
                 top = int(query_params.get('top', '2'))
-                response = requests.get(
-                    f"{odata_url}/{entity}?$top={top}&$format=json",
-                    auth=doc_auth,
-                    headers={'Accept': 'application/json'},
-                    timeout=15,
-                    verify=ssl_verify
-                )
+                response = doc_client.get(f"{entity}?$top={top}&$format=json", timeout=15)
                 return {
                     'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -301,10 +257,7 @@ def handler(event: dict, context) -> dict:
                 def norm(p): return re.sub(r'\D', '', p or '')
                 digits = norm(phone)
                 tail = digits[-10:] if len(digits) >= 10 else digits
-                resp_ci = requests.get(
-                    f"{odata_url}/Catalog_Контрагенты_КонтактнаяИнформация?$format=json&$top=2000",
-                    auth=doc_auth, headers={'Accept': 'application/json'}, timeout=15, verify=ssl_verify
-                )
+                resp_ci = doc_client.get("Catalog_Контрагенты_КонтактнаяИнформация?$format=json&$top=2000", timeout=15)
                 kontragent_key = None
                 if resp_ci.ok:
                     for item in resp_ci.json().get('value', []):
@@ -316,14 +269,8 @@ def handler(event: dict, context) -> dict:
                 if not kontragent_key:
                     return {'statusCode': 200, 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                             'body': json.dumps({'success': False, 'error': f'Контрагент не найден по телефону {phone}', 'tail': tail}, ensure_ascii=False)}
-                resp_k = requests.get(
-                    f"{odata_url}/Catalog_Контрагенты(guid'{kontragent_key}')?$format=json",
-                    auth=doc_auth, headers={'Accept': 'application/json'}, timeout=15, verify=ssl_verify
-                )
-                resp_cars = requests.get(
-                    f"{odata_url}/Catalog_Автомобили?$format=json&$top=10&$filter=Владелец_Key eq guid'{kontragent_key}'",
-                    auth=doc_auth, headers={'Accept': 'application/json'}, timeout=15, verify=ssl_verify
-                )
+                resp_k = doc_client.get(f"Catalog_Контрагенты(guid'{kontragent_key}')?$format=json", timeout=15)
+                resp_cars = doc_client.get(f"Catalog_Автомобили?$format=json&$top=10&$filter=Владелец_Key eq guid'{kontragent_key}'", timeout=15)
                 return {
                     'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -339,13 +286,7 @@ def handler(event: dict, context) -> dict:
             elif action == 'read_zn':
                 kontragent_key = query_params.get('kontragent_key', '')
                 filter_part = f"&$filter=Контрагент_Key eq guid'{kontragent_key}' and Posted eq true" if kontragent_key else '&$filter=Posted eq true'
-                response = requests.get(
-                    f"{odata_url}/Document_ЗаказНаряд?$top=1&$format=json&$orderby=Date desc{filter_part}",
-                    auth=doc_auth,
-                    headers={'Accept': 'application/json'},
-                    timeout=15,
-                    verify=ssl_verify
-                )
+                response = doc_client.get(f"Document_ЗаказНаряд?$top=1&$format=json&$orderby=Date desc{filter_part}", timeout=15)
                 doc = None
                 doc_key = None
                 if response.ok:
@@ -355,13 +296,7 @@ def handler(event: dict, context) -> dict:
                         doc_key = doc.get('Ref_Key')
                 expand_result = None
                 if doc_key:
-                    resp_expand = requests.get(
-                        f"{odata_url}/Document_ЗаказНаряд(guid'{doc_key}')/Автомобили?$format=json&$expand=Автомобиль",
-                        auth=doc_auth,
-                        headers={'Accept': 'application/json'},
-                        timeout=15,
-                        verify=ssl_verify
-                    )
+                    resp_expand = doc_client.get(f"Document_ЗаказНаряд(guid'{doc_key}')/Автомобили?$format=json&$expand=Автомобиль", timeout=15)
                     expand_result = {
                         'status': resp_expand.status_code,
                         'data': resp_expand.json() if resp_expand.ok else None,
@@ -383,10 +318,7 @@ def handler(event: dict, context) -> dict:
             elif action == 'read_svod_zn':
                 kontragent_key = query_params.get('kontragent_key', '')
                 filter_part = f"&$filter=Контрагент_Key eq guid'{kontragent_key}' and Posted eq true" if kontragent_key else '&$filter=Posted eq true'
-                resp_zn = requests.get(
-                    f"{odata_url}/Document_ЗаказНаряд?$top=1&$format=json&$orderby=Date desc{filter_part}",
-                    auth=doc_auth, headers={'Accept': 'application/json'}, timeout=15, verify=ssl_verify
-                )
+                resp_zn = doc_client.get(f"Document_ЗаказНаряд?$top=1&$format=json&$orderby=Date desc{filter_part}", timeout=15)
                 if not resp_zn.ok or not resp_zn.json().get('value'):
                     return {'statusCode': 200, 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                             'body': json.dumps({'success': False, 'error': 'ЗаказНаряд не найден', 'status': resp_zn.status_code}, ensure_ascii=False)}
@@ -397,10 +329,7 @@ def handler(event: dict, context) -> dict:
                 svod_status = None
                 svod_raw = None
                 if svod_key and svod_key != null_guid:
-                    resp_svod = requests.get(
-                        f"{odata_url}/Document_СводныйРемонтныйЗаказ(guid'{svod_key}')?$format=json",
-                        auth=doc_auth, headers={'Accept': 'application/json'}, timeout=15, verify=ssl_verify
-                    )
+                    resp_svod = doc_client.get(f"Document_СводныйРемонтныйЗаказ(guid'{svod_key}')?$format=json", timeout=15)
                     svod_status = resp_svod.status_code
                     svod_raw = resp_svod.text[:3000]
                     if resp_svod.ok:
@@ -434,13 +363,7 @@ def handler(event: dict, context) -> dict:
                 
                 # Получаем историю звонков по номеру телефона
                 filter_query = f"$filter=substringof('{phone}', НомерТелефона)"
-                response = requests.get(
-                    f"{odata_url}/InformationRegister_сфпИсторияЗвонков?{filter_query}&$orderby=Period desc&$top=50",
-                    auth=auth,
-                    headers={'Accept': 'application/json'},
-                    timeout=30,
-                    verify=ssl_verify
-                )
+                response = client.get(f"InformationRegister_сфпИсторияЗвонков?{filter_query}&$orderby=Period desc&$top=50", timeout=30)
                 
                 data = response.json()
                 
@@ -487,17 +410,7 @@ def handler(event: dict, context) -> dict:
                 "Комментарий": description,
             }
 
-            response = requests.post(
-                f"{odata_url}/Document_ЗаявкаНаРемонт",
-                auth=doc_auth,
-                headers={
-                    'Accept': 'application/json',
-                    'Content-Type': 'application/json'
-                },
-                json=doc_data,
-                timeout=15,
-                verify=ssl_verify
-            )
+            response = doc_client.post("Document_ЗаявкаНаРемонт", doc_data, timeout=15)
 
             return {
                 'statusCode': 200,
@@ -520,6 +433,19 @@ def handler(event: dict, context) -> dict:
             'body': json.dumps({'error': 'Method not allowed'})
         }
     
+    except CircuitOpenError as e:
+        return {
+            'statusCode': 503,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({
+                'success': False,
+                'error': str(e)
+            }, ensure_ascii=False)
+        }
+    
     except requests.exceptions.Timeout:
         return {
             'statusCode': 504,
@@ -1,10 +1,10 @@
 import json
 import os
 import requests
-import psycopg2
 import hashlib
 from urllib.parse import urlencode
 import paramiko
+from db import get_connection, release_connection
 
 def handler(event: dict, context) -> dict:
     '''Диагностика подключений ZEON: проверка API, FTP, БД'''
@@ -212,7 +212,7 @@ def handler(event: dict, context) -> dict:
     
     if db_dsn:
         try:
-            conn = psycopg2.connect(db_dsn)
+            conn = get_connection(db_dsn)
             cursor = conn.cursor()
             cursor.execute('SELECT COUNT(*) FROM information_schema.tables WHERE table_name = %s', ('zeon_recordings_sync',))
             table_exists = cursor.fetchone()[0] > 0
@@ -231,7 +231,7 @@ def handler(event: dict, context) -> dict:
                 }
             
             cursor.close()
-            conn.close()
+            release_connection(conn)
         except Exception as e:
             results['database'] = {
                 'status': 'error',
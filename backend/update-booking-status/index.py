@@ -2,8 +2,8 @@ import json
 import os
 from typing import Dict, Any
 from datetime import datetime
-import psycopg2
 from psycopg2.extras import RealDictCursor
+from db import get_connection, release_connection
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -75,7 +75,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if not dsn:
             raise Exception('DATABASE_URL not configured')
         
-        conn = psycopg2.connect(dsn)
+        conn = get_connection(dsn)
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
         # Update booking status
@@ -93,7 +93,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         if not result:
             cur.close()
-            conn.close()
+            release_connection(conn)
             return {
                 'statusCode': 404,
                 'headers': {
@@ -107,7 +107,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         conn.commit()
         cur.close()
-        conn.close()
+        release_connection(conn)
         
         return {
             'statusCode': 200,
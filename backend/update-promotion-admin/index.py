@@ -1,10 +1,11 @@
 import json
 import os
 import smtplib
-import psycopg2
 from typing import Dict, Any
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from db import get_connection, release_connection
+from catalog_cache import bump_catalog_version
 
 
 SITE_URL = 'https://hybrid24.ru'
@@ -68,7 +69,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
 
     schema = os.environ.get('MAIN_DB_SCHEMA', 'public')
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn = get_connection(os.environ['DATABASE_URL'])
     cursor = conn.cursor()
 
     cursor.execute(
@@ -87,6 +88,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     ''', (title, description, discount, old_price, new_price, valid_until,
           icon, details, is_active, promotion_id))
 
+    bump_catalog_version(cursor, 'promotions')
     conn.commit()
 
     sent_count = 0
@@ -102,7 +104,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             )
 
     cursor.close()
-    conn.close()
+    release_connection(conn)
 
     return {
         'statusCode': 200,
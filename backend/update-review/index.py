@@ -1,7 +1,8 @@
 import json
 import os
-import psycopg2
 from datetime import datetime
+from db import get_connection, release_connection
+from catalog_cache import bump_catalog_version
 
 def handler(event: dict, context) -> dict:
     '''API для обновления отзыва'''
@@ -61,7 +62,7 @@ def handler(event: dict, context) -> dict:
             }
         
         dsn = os.environ.get('DATABASE_URL')
-        conn = psycopg2.connect(dsn)
+        conn = get_connection(dsn)
         cur = conn.cursor()
         
         cur.execute("""
@@ -76,10 +77,11 @@ def handler(event: dict, context) -> dict:
             WHERE id = %s
         """, (customer_name, rating, review_text, service_name, review_date, source, is_visible, review_id))
         
+        bump_catalog_version(cur, 'reviews')
         conn.commit()
         
         cur.close()
-        conn.close()
+        release_connection(conn)
         
         return {
             'statusCode': 200,
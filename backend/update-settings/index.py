@@ -1,6 +1,7 @@
 import json
 import os
-import psycopg2
+from db import get_connection, release_connection
+from catalog_cache import bump_catalog_version
 
 def handler(event: dict, context) -> dict:
     '''Обновление настроек сайта (только для администраторов)'''
@@ -52,7 +53,7 @@ def handler(event: dict, context) -> dict:
         conn = None
         try:
             dsn = os.environ.get('DATABASE_URL')
-            conn = psycopg2.connect(dsn)
+            conn = get_connection(dsn)
             cur = conn.cursor()
             
             cur.execute("""
@@ -69,6 +70,7 @@ def handler(event: dict, context) -> dict:
                 DO UPDATE SET setting_value = EXCLUDED.setting_value, updated_at = CURRENT_TIMESTAMP
             """, (maintenance_end_time,))
             
+            bump_catalog_version(cur, 'settings')
             conn.commit()
             cur.close()
             
@@ -92,7 +94,7 @@ def handler(event: dict, context) -> dict:
             raise e
         finally:
             if conn:
-                conn.close()
+                release_connection(conn)
                 
     except Exception as e:
         return {
@@ -1,8 +1,136 @@
 import json
 import os
-import psycopg2
+import re
+import stat
+import time
 import paramiko
-from datetime import datetime
+from datetime import datetime, timedelta
+from db import get_connection, release_connection
+from sftp_copy import SFTPCopier, CopyDeferred
+
+RECORDING_EXTENSIONS = ('.mp3', '.wav', '.gsm')
+# Asterisk раскладывает записи по датам: 2026/01/15, 2026-01-15, 20260115 или плоско в корне
+DATED_DIR_PATTERN = re.compile(r'^(\d{4}(-?\d{2}){0,2}|\d{2})$')
+MAX_DATED_DEPTH = 3
+# Файл, изменённый недавно, может ещё записываться — берём его в следующем запуске
+SETTLE_SECONDS = 120
+# Время на копирование за запуск, если платформа не сообщила остаток времени функции
+TIME_BUDGET_SECONDS = 100
+# После стольких неудачных попыток водяной знак проходит мимо файла, чтобы он не держал синхронизацию
+MAX_FILE_ATTEMPTS = 5
+
+
+def _load_watermark(cursor, source_path: str) -> tuple:
+    cursor.execute(
+        'SELECT watermark_mtime, watermark_filename FROM zeon_ami_sync_state WHERE source_path = %s',
+        (source_path,)
+    )
+    row = cursor.fetchone()
+    return (row[0], row[1]) if row else (0, '')
+
+
+def _save_watermark(cursor, source_path: str, watermark: tuple) -> None:
+    cursor.execute(
+        '''
+        INSERT INTO zeon_ami_sync_state (source_path, watermark_mtime, watermark_filename, updated_at)
+        VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (source_path) DO UPDATE SET
+            watermark_mtime = EXCLUDED.watermark_mtime,
+            watermark_filename = EXCLUDED.watermark_filename,
+            updated_at = CURRENT_TIMESTAMP
+        ''',
+        (source_path, watermark[0], watermark[1])
+    )
+
+
+def _load_attempts(cursor, source_path: str, filenames: list) -> dict:
+    cursor.execute(
+        'SELECT file_name, attempts FROM zeon_ami_sync_failures WHERE source_path = %s AND file_name = ANY(%s)',
+        (source_path, filenames)
+    )
+    return {row[0]: row[1] for row in cursor.fetchall()}
+
+
+def _record_failure(cursor, source_path: str, filename: str, error: str) -> int:
+    """Учитывает неудачную попытку переноса файла; возвращает число попыток"""
+    cursor.execute(
+        '''
+        INSERT INTO zeon_ami_sync_failures (source_path, file_name, attempts, last_error, updated_at)
+        VALUES (%s, %s, 1, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (source_path, file_name) DO UPDATE SET
+            attempts = zeon_ami_sync_failures.attempts + 1,
+            last_error = EXCLUDED.last_error,
+            updated_at = CURRENT_TIMESTAMP
+        RETURNING attempts
+        ''',
+        (source_path, filename, error)
+    )
+    return cursor.fetchone()[0]
+
+
+def _time_budget(context, params: dict) -> float:
+    """Время на копирование: ?budget=секунды или TIME_BUDGET_SECONDS, но не больше остатка времени функции"""
+    budget = TIME_BUDGET_SECONDS
+    try:
+        if params.get('budget'):
+            budget = min(float(params['budget']), 280)
+    except ValueError:
+        pass
+    get_remaining = getattr(context, 'get_remaining_time_in_millis', None)
+    if callable(get_remaining):
+        budget = min(budget, get_remaining() / 1000 - 10)
+    return budget
+
+
+def _list_recordings(sftp, root: str, watermark: tuple, date_filter: str | None) -> list:
+    """
+    Записи новее водяного знака (mtime, имя файла), старые первыми.
+    Каталоги по датам, целиком лежащие до водяного знака (с запасом в сутки), не открываются;
+    каталог читается потоково (listdir_iter), без загрузки полного списка в память.
+    С date_filter водяной знак не учитывается: берутся файлы за указанный день.
+    """
+    floor_key = ''
+    if watermark[0]:
+        floor_key = (datetime.fromtimestamp(watermark[0]) - timedelta(days=1)).strftime('%Y%m%d')
+    date_key = date_filter.replace('-', '') if date_filter else ''
+    settled_before = time.time() - SETTLE_SECONDS
+    recordings = []
+
+    def walk(path: str, key: str, depth: int) -> None:
+        for file_attr in sftp.listdir_iter(path):
+            name = file_attr.filename
+            if stat.S_ISDIR(file_attr.st_mode or 0):
+                if depth >= MAX_DATED_DEPTH or not DATED_DIR_PATTERN.match(name):
+                    continue
+                child_key = key + name.replace('-', '')
+                if len(child_key) > 8 or child_key < floor_key[:len(child_key)]:
+                    continue
+                if date_key and child_key != date_key[:len(child_key)]:
+                    continue
+                walk(f'{path}/{name}', child_key, depth + 1)
+                continue
+
+            if not name.endswith(RECORDING_EXTENSIONS):
+                continue
+            mtime = int(file_attr.st_mtime or 0)
+            if date_filter:
+                if datetime.fromtimestamp(mtime).strftime('%Y-%m-%d') != date_filter:
+                    continue
+            elif (mtime, name) <= watermark:
+                continue
+            if mtime > settled_before:
+                continue
+            recordings.append({
+                'filename': name,
+                'size': file_attr.st_size,
+                'mtime': mtime,
+                'path': f'{path}/{name}'
+            })
+
+    walk(root.rstrip('/'), '', 0)
+    recordings.sort(key=lambda recording: (recording['mtime'], recording['filename']))
+    return recordings
+
 
 def handler(event: dict, context) -> dict:
     """Синхронизация записей звонков ZEON через AMI с сохранением оригинальных имён файлов"""
@@ -64,7 +192,7 @@ def handler(event: dict, context) -> dict:
         else:
             db_dsn_clean = db_dsn
         
-        conn = psycopg2.connect(db_dsn_clean)
+        conn = get_connection(db_dsn_clean)
         cursor = conn.cursor()
         
         # Подключаемся к серверу Asterisk через SSH
@@ -80,33 +208,27 @@ def handler(event: dict, context) -> dict:
         )
         sftp_source = ssh.open_sftp()
         
-        # Получаем список файлов из папки с записями
+        # Файлы новее водяного знака; уже перенесённые отсекаются одним запросом
+        watermark = (0, '') if date_filter else _load_watermark(cursor, ami_recordings_path)
         recordings_list = []
+        already_synced = set()
+        attempts = {}
         try:
-            files = sftp_source.listdir_attr(ami_recordings_path)
-            for file_attr in files:
-                if file_attr.filename.endswith(('.mp3', '.wav', '.gsm')):
-                    # Фильтр по дате если указан
-                    if date_filter:
-                        file_date = datetime.fromtimestamp(file_attr.st_mtime).strftime('%Y-%m-%d')
-                        if file_date != date_filter:
-                            continue
-                    
-                    recordings_list.append({
-                        'filename': file_attr.filename,
-                        'size': file_attr.st_size,
-                        'mtime': file_attr.st_mtime,
-                        'path': ami_recordings_path + file_attr.filename
-                    })
+            recordings_list = _list_recordings(sftp_source, ami_recordings_path, watermark, date_filter)
+            filenames = [recording['filename'] for recording in recordings_list]
+            cursor.execute(
+                'SELECT file_name FROM zeon_recordings_sync WHERE file_name = ANY(%s)',
+                (filenames,)
+            )
+            already_synced = {row[0] for row in cursor.fetchall()}
+            attempts = _load_attempts(cursor, ami_recordings_path, filenames)
         except Exception as e:
             errors.append(f'Error listing recordings: {str(e)}')
             recordings_list = []
         
-        # Сортируем по дате модификации (старые первыми)
-        recordings_list.sort(key=lambda x: x['mtime'])
-        
-        # Ограничиваем количество
-        recordings_list = recordings_list[:max_per_run]
+        skipped_count = sum(1 for recording in recordings_list if recording['filename'] in already_synced)
+        total_found = len(recordings_list)
+        to_sync = [recording for recording in recordings_list if recording['filename'] not in already_synced][:max_per_run]
         
         # Подключаемся к целевому SFTP (только если не dry_run и не skip_ftp)
         sftp_dest = None
@@ -146,67 +268,99 @@ def handler(event: dict, context) -> dict:
         elif skip_ftp:
             sftp_error = 'SFTP skipped (skip_ftp=true)'
         
-        # Обрабатываем каждую запись
-        for recording in recordings_list:
-            if synced_count >= max_per_run:
-                break
-            
+        def record(recording: dict, file_size: int) -> None:
             filename = recording['filename']
-            file_size = recording['size']
-            file_path = recording['path']
+            # Извлекаем данные из имени файла (если формат стандартный)
+            # Пример: 20250115_143022_79231234567.mp3
+            recording_id = filename  # Используем имя файла как ID
+            call_date_str = datetime.fromtimestamp(recording['mtime']).strftime('%Y-%m-%d %H:%M:%S')
+            
+            # Пытаемся извлечь телефон из имени файла
+            phone_number = ''
+            if '_' in filename:
+                parts = filename.replace('.mp3', '').replace('.wav', '').split('_')
+                if len(parts) >= 3:
+                    phone_number = parts[2]
             
-            # Проверяем, не синхронизирована ли уже эта запись по имени файла
             cursor.execute(
-                'SELECT id FROM zeon_recordings_sync WHERE file_name = %s',
-                (filename,)
+                '''INSERT INTO zeon_recordings_sync 
+                   (recording_id, call_id, phone_number, duration, file_name, file_size, ftp_path, call_date)
+                   VALUES (%s, %s, %s, %s, %s, %s, %s, %s)''',
+                (recording_id, '', phone_number, 0, filename, file_size, 
+                 f'{sftp_path}/{filename}', call_date_str)
             )
-            
-            if cursor.fetchone():
-                skipped_count += 1
-                continue
-            
+            conn.commit()
+        
+        def fail(filename: str, error: Exception) -> None:
+            conn.rollback()
+            errors.append(f'Error processing {filename}: {str(error)}')
+            if dry_run:
+                return
             try:
-                # Извлекаем данные из имени файла (если формат стандартный)
-                # Пример: 20250115_143022_79231234567.mp3
-                recording_id = filename  # Используем имя файла как ID
-                call_date_str = datetime.fromtimestamp(recording['mtime']).strftime('%Y-%m-%d %H:%M:%S')
-                
-                # Пытаемся извлечь телефон из имени файла
-                phone_number = ''
-                if '_' in filename:
-                    parts = filename.replace('.mp3', '').replace('.wav', '').split('_')
-                    if len(parts) >= 3:
-                        phone_number = parts[2]
-                
-                # Копируем файл на целевой SFTP
-                if not dry_run and sftp_dest:
-                    remote_path = f'{sftp_path}/{filename}'
-                    
-                    # Скачиваем во временный буфер и загружаем
-                    with sftp_source.file(file_path, 'rb') as source_file:
-                        sftp_dest.putfo(source_file, remote_path)
-                    
-                    actual_file_size = file_size
-                else:
-                    actual_file_size = file_size if not dry_run else 0
-                
-                # Записываем в БД
-                if not dry_run:
-                    cursor.execute(
-                        '''INSERT INTO zeon_recordings_sync 
-                           (recording_id, call_id, phone_number, duration, file_name, file_size, ftp_path, call_date)
-                           VALUES (%s, %s, %s, %s, %s, %s, %s, %s)''',
-                        (recording_id, '', phone_number, 0, filename, actual_file_size, 
-                         f'{sftp_path}/{filename}', call_date_str)
-                    )
-                    conn.commit()
-                
-                synced_count += 1
-                
+                attempts[filename] = _record_failure(cursor, ami_recordings_path, filename, str(error))
+                conn.commit()
             except Exception as e:
-                error_msg = f'Error processing {filename}: {str(e)}'
-                errors.append(error_msg)
-                continue
+                conn.rollback()
+                errors.append(f'Error counting attempts for {filename}: {str(e)}')
+        
+        # Обрабатываем каждую запись
+        done = set()
+        deferred_count = 0
+        resumed_count = 0
+        if sftp_dest:
+            # Копируем параллельно по нескольким каналам с каждой стороны до конца бюджета
+            deadline = time.monotonic() + _time_budget(context, params)
+            copier = SFTPCopier(ssh, ssh_dest)
+            jobs = [
+                {**recording, 'target': f"{sftp_path}/{recording['filename']}"}
+                for recording in to_sync
+            ]
+            try:
+                for job, offset, error in copier.copy_all(jobs, deadline):
+                    filename = job['filename']
+                    if isinstance(error, CopyDeferred):
+                        deferred_count += 1
+                        continue
+                    try:
+                        if error:
+                            raise error
+                        if offset:
+                            resumed_count += 1
+                        record(job, job['size'])
+                        synced_count += 1
+                        done.add(filename)
+                    except Exception as e:
+                        fail(filename, e)
+            finally:
+                copier.close()
+        elif dry_run or skip_ftp:
+            for recording in to_sync:
+                try:
+                    if not dry_run:
+                        record(recording, recording['size'])
+                    synced_count += 1
+                    done.add(recording['filename'])
+                except Exception as e:
+                    fail(recording['filename'], e)
+        
+        # Водяной знак сдвигается по непрерывному началу списка: файл с ошибкой и всё после него
+        # будут просмотрены снова в следующем запуске. Файл, не перенесённый за MAX_FILE_ATTEMPTS
+        # попыток, пропускается и попадает в abandoned — его можно перенести запуском с ?date=
+        abandoned = []
+        if not dry_run and not date_filter:
+            new_watermark = watermark
+            for recording in recordings_list:
+                filename = recording['filename']
+                if filename not in done and filename not in already_synced:
+                    if attempts.get(filename, 0) < MAX_FILE_ATTEMPTS:
+                        break
+                    abandoned.append(filename)
+                new_watermark = (recording['mtime'], filename)
+            if abandoned:
+                errors.append(f'Skipped after {MAX_FILE_ATTEMPTS} failed attempts: {", ".join(abandoned)}')
+            if new_watermark != watermark:
+                _save_watermark(cursor, ami_recordings_path, new_watermark)
+                conn.commit()
         
         # Закрываем соединения
         if sftp_source:
@@ -219,7 +373,7 @@ def handler(event: dict, context) -> dict:
             ssh_dest.close()
         
         cursor.close()
-        conn.close()
+        release_connection(conn)
         
         return {
             'statusCode': 200,
@@ -228,8 +382,11 @@ def handler(event: dict, context) -> dict:
                 'success': True,
                 'synced': synced_count,
                 'skipped': skipped_count,
-                'total_found': len(recordings_list),
+                'total_found': total_found,
                 'errors': errors,
+                'deferred': deferred_count,
+                'resumed': resumed_count,
+                'abandoned': abandoned,
                 'sftp_status': sftp_error or 'Connected',
                 'method': 'AMI',
                 'dry_run': dry_run
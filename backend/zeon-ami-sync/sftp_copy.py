@@ -0,0 +1,145 @@
+import time
+import queue
+import paramiko
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterator
+
+# Файлы копируются параллельно: на каждой стороне столько SFTP-каналов одного SSH-соединения
+CHANNELS_PER_SIDE = 4
+# Окно SSH-канала по умолчанию (2 МБ) при задержке между хостами ограничивает скорость сильнее канала
+WINDOW_SIZE = 16 * 1024 * 1024
+# Сколько запросов чтения по 32 КБ держим в полёте при prefetch
+PREFETCH_REQUESTS = 128
+COPY_CHUNK_SIZE = 1024 * 1024
+# Новый файл не начинаем, если до дедлайна осталось меньше; начатый прерываем на дедлайне
+MIN_COPY_SECONDS = 10
+PARTIAL_SUFFIX = '.part'
+
+
+class CopyDeferred(Exception):
+    """Файл не скопирован до дедлайна; недописанный .part остаётся для докачки в следующем запуске"""
+
+
+def _replace(sftp, source: str, target: str) -> None:
+    try:
+        sftp.posix_rename(source, target)
+    except IOError:
+        # Сервер без расширения posix-rename: обычный rename не перезаписывает существующий файл
+        try:
+            sftp.remove(target)
+        except IOError:
+            pass
+        sftp.rename(source, target)
+
+
+def _size(sftp, path: str) -> int | None:
+    try:
+        return sftp.stat(path).st_size
+    except IOError:
+        return None
+
+
+def open_channels(ssh: paramiko.SSHClient, count: int = CHANNELS_PER_SIDE) -> list:
+    """SFTP-каналы с увеличенным окном поверх соединения ssh; хотя бы один канал или исключение"""
+    transport = ssh.get_transport()
+    channels = []
+    for _ in range(count):
+        try:
+            channels.append(paramiko.SFTPClient.from_transport(transport, window_size=WINDOW_SIZE))
+        except Exception as e:
+            if not channels:
+                raise
+            print(f'[AMI] Дополнительный SFTP-канал не открыт: {e}')
+            break
+    return channels
+
+
+def copy_file(source, target, source_path: str, target_path: str, size: int, deadline: float) -> int:
+    """
+    Копирует файл между серверами: чтение с prefetch, запись в pipelined-режиме в target_path.part,
+    после сверки размера .part переименовывается. Если .part уже есть — докачивает с его конца.
+    Возвращает смещение, с которого началось копирование: 0 — файл копировался целиком,
+    size — файл уже был на месте.
+    """
+    # Файл уже загружен целиком (например, не прошла запись в БД) — повторно не копируем
+    if _size(target, target_path) == size:
+        return size
+
+    partial_path = target_path + PARTIAL_SUFFIX
+    offset = _size(target, partial_path) or 0
+    if offset > size:
+        offset = 0
+
+    with source.open(source_path, 'rb') as source_file, \
+            target.open(partial_path, 'r+b' if offset else 'wb') as target_file:
+        source_file.seek(offset)
+        target_file.seek(offset)
+        source_file.prefetch(size, PREFETCH_REQUESTS)
+        target_file.set_pipelined(True)
+        position = offset
+        while position < size:
+            if time.monotonic() > deadline:
+                raise CopyDeferred(f'Копирование прервано на {position} из {size} байт: закончилось время запуска')
+            chunk = source_file.read(min(COPY_CHUNK_SIZE, size - position))
+            if not chunk:
+                break
+            target_file.write(chunk)
+            position += len(chunk)
+
+    uploaded = _size(target, partial_path)
+    if uploaded != size:
+        # Недокачанный или испорченный .part не годится для докачки
+        try:
+            target.remove(partial_path)
+        except IOError:
+            pass
+        raise IOError(f'Размер после загрузки {uploaded} байт, ожидалось {size}')
+    _replace(target, partial_path, target_path)
+    return offset
+
+
+class SFTPCopier:
+    """
+    Параллельное копирование файлов с одного SFTP-сервера на другой.
+    Каналы источника и приёмника объединены в пары; каждая пара копирует один файл за раз.
+    """
+
+    def __init__(self, source_ssh: paramiko.SSHClient, target_ssh: paramiko.SSHClient,
+                 channels: int = CHANNELS_PER_SIDE):
+        sources = open_channels(source_ssh, channels)
+        targets = open_channels(target_ssh, len(sources))
+        for extra in sources[len(targets):]:
+            extra.close()
+        self.pairs = list(zip(sources, targets))
+
+    def copy_all(self, jobs: list, deadline: float) -> Iterator[tuple]:
+        """
+        Копирует задания {'path', 'target', 'size'} до deadline (time.monotonic()).
+        Отдаёт (задание, смещение докачки, ошибка) по мере завершения; ошибка None — файл на месте,
+        CopyDeferred — файл оставлен следующему запуску.
+        """
+        free_pairs = queue.Queue()
+        for pair in self.pairs:
+            free_pairs.put(pair)
+
+        def copy(job: dict) -> int:
+            if deadline - time.monotonic() < MIN_COPY_SECONDS:
+                raise CopyDeferred('Не хватает времени запуска')
+            source, target = free_pairs.get()
+            try:
+                return copy_file(source, target, job['path'], job['target'], job['size'], deadline)
+            finally:
+                free_pairs.put((source, target))
+
+        with ThreadPoolExecutor(max_workers=len(self.pairs)) as executor:
+            futures = {executor.submit(copy, job): job for job in jobs}
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as e:
+                    yield futures[future], None, e
+
+    def close(self) -> None:
+        for source, target in self.pairs:
+            source.close()
+            target.close()
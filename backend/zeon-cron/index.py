@@ -1,11 +1,56 @@
 import json
 import os
 import requests
+from concurrent.futures import ThreadPoolExecutor
+
+# Фоновые задачи 1С, которые планировщик запускает вместе с синхронизацией ZEON:
+# переменная окружения с адресом функции, адрес по умолчанию (func2url.json), параметры запроса,
+# тело POST-запроса (None — задача вызывается GET). Задача без адреса пропускается
+ONEC_JOBS = (
+    # Очередь заявок в 1С: по умолчанию разбирает retry-1c-sync, SYNC_1C_OUTBOX_URL — отдельная функция sync-1c-outbox
+    ('SYNC_1C_OUTBOX_URL', 'https://functions.poehali.dev/29203975-9d47-40b3-a5ae-a43247c45935', '', {'outbox': True}),
+    # lookup-client: шаг синхронизации локального индекса телефонов контрагентов
+    ('LOOKUP_CLIENT_URL', 'https://functions.poehali.dev/877ade05-9f3a-48c3-a77f-2e611bb9993e', 'action=sync', None),
+)
+JOB_TIMEOUT_SECONDS = 120
+
+
+def _run_job(url: str, payload: dict | None) -> dict:
+    # Служебные действия функций (например, lookup-client?action=sync) доступны только администратору
+    admin_password = os.environ.get('ADMIN_PASSWORD')
+    headers = {'X-Authorization': admin_password} if admin_password else {}
+    try:
+        if payload is None:
+            response = requests.get(url, headers=headers, timeout=JOB_TIMEOUT_SECONDS)
+        else:
+            response = requests.post(url, json=payload, headers=headers, timeout=JOB_TIMEOUT_SECONDS)
+        try:
+            return {'status': response.status_code, 'result': response.json()}
+        except ValueError:
+            return {'status': response.status_code, 'result': response.text[:300]}
+    except Exception as e:
+        return {'error': str(e)}
+
+
+def _start_jobs(executor: ThreadPoolExecutor) -> dict:
+    """Запускает настроенные задачи 1С параллельно с синхронизацией ZEON"""
+    jobs = {}
+    for env_name, default_url, query, payload in ONEC_JOBS:
+        url = os.environ.get(env_name) or default_url
+        if url:
+            jobs[env_name] = executor.submit(_run_job, f"{url}?{query}" if query else url, payload)
+    return jobs
+
+
+def _finish_jobs(jobs: dict) -> dict:
+    """Дожидается задач до ответа: после ответа функции фоновые потоки могут быть остановлены"""
+    return {name: future.result() for name, future in jobs.items()}
+
 
 def handler(event: dict, context) -> dict:
     '''Планировщик синхронизации ZEON → FTP (запускается каждые 120 секунд)
     
-    Триггер для автоматической синхронизации записей
+    Триггер для автоматической синхронизации записей; вместе с ней запускает фоновые задачи 1С (ONEC_JOBS)
     '''
     
     method = event.get('httpMethod', 'GET')
@@ -40,14 +85,21 @@ def handler(event: dict, context) -> dict:
         }
     
     if action == 'trigger':
+        executor = ThreadPoolExecutor(max_workers=max(len(ONEC_JOBS), 1))
+        jobs = _start_jobs(executor)
         try:
-            # Запускаем синхронизацию с параметрами skip_ftp и date если переданы
+            # Запускаем синхронизацию с параметрами skip_ftp, date и mode если переданы
+            # Без mode синхронизация берёт звонки от сохранённой границы и сама раз в час делает сверку за 7 дней;
+            # mode=reconcile запускает сверку сразу
             skip_ftp = query_params.get('skip_ftp', 'false')
             sync_date = query_params.get('date', '')
+            sync_mode = query_params.get('mode', '')
             
             url = f'{zeon_function_url}?skip_ftp={skip_ftp}'
             if sync_date:
                 url += f'&date={sync_date}'
+            if sync_mode:
+                url += f'&mode={sync_mode}'
             
             response = requests.get(url, timeout=300)
             
@@ -62,7 +114,8 @@ def handler(event: dict, context) -> dict:
                     'body': json.dumps({
                         'success': True,
                         'message': 'Синхронизация запущена',
-                        'result': result
+                        'result': result,
+                        'jobs': _finish_jobs(jobs)
                     }, ensure_ascii=False)
                 }
             else:
@@ -75,8 +128,9 @@ def handler(event: dict, context) -> dict:
                     'body': json.dumps({
                         'success': False,
                         'error': f'Ошибка запуска синхронизации: {response.status_code}',
-                        'details': response.text
-                    })
+                        'details': response.text,
+                        'jobs': _finish_jobs(jobs)
+                    }, ensure_ascii=False)
                 }
         
         except Exception as e:
@@ -88,9 +142,12 @@ def handler(event: dict, context) -> dict:
                 },
                 'body': json.dumps({
                     'success': False,
-                    'error': str(e)
-                })
+                    'error': str(e),
+                    'jobs': _finish_jobs(jobs)
+                }, ensure_ascii=False)
             }
+        finally:
+            executor.shutdown(wait=True)
     
     elif action == 'status':
         return {
@@ -102,7 +159,8 @@ def handler(event: dict, context) -> dict:
             'body': json.dumps({
                 'success': True,
                 'message': 'Планировщик ZEON работает',
-                'zeon_function_url': zeon_function_url
+                'zeon_function_url': zeon_function_url,
+                'jobs': [env_name for env_name, default_url, _, _ in ONEC_JOBS if os.environ.get(env_name) or default_url]
             })
         }
     
@@ -1,12 +1,204 @@
 import json
 import os
+import time
+import queue
 import requests
-import psycopg2
 import hashlib
-from urllib.parse import urlencode
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlencode, quote
 import paramiko
-from datetime import datetime
-from io import BytesIO
+from datetime import datetime, timedelta
+from requests.adapters import HTTPAdapter
+from psycopg2.extras import execute_values
+from db import get_connection, release_connection
+
+# Записи переносятся параллельно по нескольким SFTP-каналам одного SSH-соединения
+SFTP_CHANNELS = 4
+CHUNK_SIZE = 256 * 1024
+# Запуск каждые 120 секунд: укладываемся в интервал, если платформа не сообщила остаток времени
+TIME_BUDGET_SECONDS = 100
+# Новый файл не начинаем, если до конца бюджета осталось меньше; начатый прерываем по окончании бюджета
+MIN_TRANSFER_SECONDS = 20
+# Без загрузки на SFTP (dry_run, skip_ftp) отмечаем не больше стольких записей за запуск, как раньше
+NO_TRANSFER_LIMIT = 10
+# Строки zeon_recordings_sync пишутся пачками: одна транзакция на столько перенесённых файлов
+INSERT_BATCH_SIZE = 25
+# Звонки запрашиваются от сохранённой границы calldate с перекрытием: ZEON может выдать звонок с задержкой
+CALLS_OVERLAP_MINUTES = 15
+# Полное окно: первый запуск без границы и сверка, которая подбирает записи, появившиеся позже перекрытия
+FULL_WINDOW_DAYS = 7
+# Как часто обычный запуск превращается в сверку за FULL_WINDOW_DAYS
+RECONCILE_INTERVAL_SECONDS = 3600
+
+_http = requests.Session()
+_http.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=SFTP_CHANNELS))
+_http.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=SFTP_CHANNELS))
+
+
+def _sign(params: OrderedDict, api_key: str) -> OrderedDict:
+    """MD5-подпись ZEON от URL-encoded строки параметров (RFC3986) + API key; порядок параметров важен"""
+    query_string = urlencode(params, quote_via=quote)
+    params['hash'] = hashlib.md5((query_string + api_key).encode()).hexdigest()
+    return params
+
+
+def _time_budget(context, query_params: dict) -> float:
+    """Время на перенос: ?budget=секунды или TIME_BUDGET_SECONDS, но не больше остатка времени функции"""
+    budget = TIME_BUDGET_SECONDS
+    try:
+        if query_params.get('budget'):
+            budget = min(float(query_params['budget']), 280)
+    except ValueError:
+        pass
+    get_remaining = getattr(context, 'get_remaining_time_in_millis', None)
+    if callable(get_remaining):
+        budget = min(budget, get_remaining() / 1000 - 10)
+    return budget
+
+
+def _replace(sftp, source: str, target: str) -> None:
+    try:
+        sftp.posix_rename(source, target)
+    except IOError:
+        # Сервер без расширения posix-rename: обычный rename не перезаписывает существующий файл
+        try:
+            sftp.remove(target)
+        except IOError:
+            pass
+        sftp.rename(source, target)
+
+
+def _transfer(api_endpoint: str, api_key: str, sftp, link: str, remote_path: str, abort_at: float) -> int:
+    """
+    Потоково переносит запись из ZEON на SFTP: ответ get-mp3 читается кусками по CHUNK_SIZE
+    и сразу пишется в файл .part, который после загрузки переименовывается.
+    Возвращает размер файла.
+    """
+    file_params = _sign(OrderedDict([
+        ('link', link),
+        ('method', 'get-mp3'),
+        ('topic', 'base')
+    ]), api_key)
+    partial_path = f'{remote_path}.part'
+    with _http.post(api_endpoint, data=file_params, timeout=(10, 60), stream=True) as file_response:
+        if file_response.status_code != 200:
+            raise RuntimeError(f'Ошибка скачивания: {file_response.status_code}')
+        size = 0
+        try:
+            with sftp.open(partial_path, 'wb') as remote_file:
+                remote_file.set_pipelined(True)
+                for chunk in file_response.iter_content(CHUNK_SIZE):
+                    if time.monotonic() > abort_at:
+                        raise TimeoutError('Перенос прерван: закончилось время запуска')
+                    remote_file.write(chunk)
+                    size += len(chunk)
+        except Exception:
+            try:
+                sftp.remove(partial_path)
+            except IOError:
+                pass
+            raise
+    _replace(sftp, partial_path, remote_path)
+    return size
+
+
+def _parse_calldate(value: str) -> datetime | None:
+    try:
+        return datetime.strptime(value, '%Y-%m-%d %H:%M:%S') if value else None
+    except ValueError:
+        return None
+
+
+def _load_checkpoint(cursor, mode: str) -> datetime | None:
+    cursor.execute('SELECT checkpoint FROM zeon_calls_sync_state WHERE mode = %s', (mode,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _save_checkpoint(cursor, mode: str, checkpoint: datetime) -> None:
+    cursor.execute(
+        '''
+        INSERT INTO zeon_calls_sync_state (mode, checkpoint, updated_at)
+        VALUES (%s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (mode) DO UPDATE SET checkpoint = EXCLUDED.checkpoint, updated_at = CURRENT_TIMESTAMP
+        ''',
+        (mode, checkpoint)
+    )
+
+
+def _next_high_water(high_water: datetime | None, calls: list, pending: list) -> datetime | None:
+    """
+    Новая граница calldate: самый ранний звонок, запись которого отложена до следующего запуска,
+    иначе самый поздний звонок в ответе. Звонки старше текущего окна перекрытия (их находит сверка)
+    границу назад не сдвигают.
+    """
+    window_start = high_water - timedelta(minutes=CALLS_OVERLAP_MINUTES) if high_water else None
+    pending_dates = [
+        date for date in (candidate['call_date'] for candidate in pending)
+        if date and (window_start is None or date >= window_start)
+    ]
+    if pending_dates:
+        return min(pending_dates)
+    call_dates = [date for date in (_parse_calldate(call.get('calldate', '')) for call in calls) if date]
+    if call_dates and (high_water is None or max(call_dates) > high_water):
+        return max(call_dates)
+    return high_water
+
+
+def _call_file_name(call: dict, original_names: dict) -> str:
+    """Оригинальное имя файла из call_recordings_mapping (AMI listener) или имя по дате и номеру"""
+    call_id = call.get('linkedid', '')
+    call_date_str = call.get('calldate', '')
+    file_name = original_names.get(call_id)
+    if file_name:
+        # Меняем расширение на .mp3 если нужно (ZEON отдает mp3)
+        if file_name.endswith('.wav'):
+            file_name = file_name.replace('.wav', '.mp3')
+        return file_name
+
+    # Fallback: генерируем имя как раньше
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    if call_date_str:
+        try:
+            timestamp = datetime.strptime(call_date_str, '%Y-%m-%d %H:%M:%S').strftime('%Y%m%d_%H%M%S')
+        except ValueError:
+            pass
+    return f"{timestamp}_{call_id}_{call.get('client', '')}.mp3"
+
+
+def _new_calls(cursor, calls: list) -> tuple:
+    """
+    Отбирает звонки с записью, которых ещё нет в zeon_recordings_sync, и их оригинальные имена файлов.
+    Два запроса на весь список вместо двух на каждый звонок.
+    Возвращает (новые звонки, уже синхронизировано, без записи).
+    """
+    with_link = [call for call in calls if call.get('link')]
+    links = list({str(call['link']) for call in with_link})
+    cursor.execute('SELECT recording_id FROM zeon_recordings_sync WHERE recording_id = ANY(%s)', (links,))
+    synced = {row[0] for row in cursor.fetchall()}
+
+    new_calls = []
+    seen = set()
+    for call in with_link:
+        recording_id = str(call['link'])
+        if recording_id in synced or recording_id in seen:
+            continue
+        seen.add(recording_id)
+        new_calls.append(call)
+
+    linkedids = list({call.get('linkedid', '') for call in new_calls} - {''})
+    original_names = {}
+    if linkedids:
+        cursor.execute(
+            'SELECT linkedid, original_filename FROM call_recordings_mapping WHERE linkedid = ANY(%s)',
+            (linkedids,)
+        )
+        original_names = dict(cursor.fetchall())
+    for call in new_calls:
+        call['file_name'] = _call_file_name(call, original_names)
+    return new_calls, len(with_link) - len(new_calls), len(calls) - len(with_link)
+
 
 def handler(event: dict, context) -> dict:
     '''Автоматический перенос записей звонков из ZEON API на FTP-сервер
@@ -30,6 +222,38 @@ def handler(event: dict, context) -> dict:
             'body': ''
         }
     
+    if query_params.get('mode') not in (None, '', 'incremental', 'reconcile'):
+        return {
+            'statusCode': 400,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({
+                'success': False,
+                'error': 'Неизвестный режим. Используйте mode=incremental или mode=reconcile'
+            }, ensure_ascii=False)
+        }
+    
+    # Дату проверяем до подключений к БД и ZEON
+    sync_date = query_params.get('date')
+    target_date = None
+    if sync_date:
+        try:
+            target_date = datetime.strptime(sync_date, '%Y-%m-%d')
+        except ValueError:
+            return {
+                'statusCode': 400,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'body': json.dumps({
+                    'success': False,
+                    'error': 'Неверный формат даты. Используйте YYYY-MM-DD'
+                })
+            }
+    
     # Получаем параметры из секретов
     zeon_api_url = os.environ.get('ZEON_API_URL')
     zeon_api_key = os.environ.get('ZEON_API_KEY')
@@ -70,12 +294,14 @@ def handler(event: dict, context) -> dict:
     synced_count = 0
     skipped_count = 0
     no_recording_count = 0
+    deferred_count = 0
     errors = []
-    max_per_run = 10  # Максимум файлов за один запуск
+    budget_end = time.monotonic() + _time_budget(context, query_params)
+    conn = None
     
     try:
         # Подключаемся к БД
-        conn = psycopg2.connect(db_dsn)
+        conn = get_connection(db_dsn)
         cursor = conn.cursor()
         
         # Создаём таблицу если не существует
@@ -96,8 +322,6 @@ def handler(event: dict, context) -> dict:
         conn.commit()
         
         # Получаем список звонков из ZEON API
-        from datetime import datetime, timedelta
-        
         api_endpoint = zeon_api_url.rstrip('/') + '/zeon/api/v2/start.php'
         
         # Сначала узнаем какие методы доступны
@@ -119,32 +343,29 @@ def handler(event: dict, context) -> dict:
                 available_methods = list_data.get('data', [])
         
         # Получаем звонки за определенный период
-        from datetime import datetime, timedelta
-        
         # Если передана дата, синхронизируем записи за эту дату
-        sync_date = query_params.get('date')
-        if sync_date:
-            try:
-                # Парсим дату в формате YYYY-MM-DD
-                target_date = datetime.strptime(sync_date, '%Y-%m-%d')
-                start_date = target_date.replace(hour=0, minute=0, second=0)
-                end_date = target_date.replace(hour=23, minute=59, second=59)
-            except ValueError:
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({
-                        'success': False,
-                        'error': 'Неверный формат даты. Используйте YYYY-MM-DD'
-                    })
-                }
+        sync_mode = 'date' if sync_date else 'dry_run' if dry_run else query_params.get('mode') or 'incremental'
+        high_water = None
+        if sync_mode in ('incremental', 'reconcile'):
+            high_water = _load_checkpoint(cursor, 'incremental')
+            if sync_mode == 'incremental':
+                # Раз в RECONCILE_INTERVAL_SECONDS вместо окна от границы берём полное окно
+                last_reconcile = _load_checkpoint(cursor, 'reconcile')
+                if high_water is None or last_reconcile is None or \
+                        (datetime.now() - last_reconcile).total_seconds() > RECONCILE_INTERVAL_SECONDS:
+                    sync_mode = 'reconcile'
+        if target_date:
+            start_date = target_date.replace(hour=0, minute=0, second=0)
+            end_date = target_date.replace(hour=23, minute=59, second=59)
+        elif sync_mode == 'incremental':
+            # Только звонки после сохранённой границы, с перекрытием
+            end_date = datetime.now()
+            start_date = max(high_water - timedelta(minutes=CALLS_OVERLAP_MINUTES),
+                             end_date - timedelta(days=FULL_WINDOW_DAYS))
         else:
-            # По умолчанию за последние 1 день (7 дней в production)
+            # Сверка за полное окно; dry_run — за последний день
             end_date = datetime.now()
-            days_back = 1 if dry_run else 7
+            days_back = 1 if dry_run else FULL_WINDOW_DAYS
             start_date = end_date - timedelta(days=days_back)
         
         # ВНИМАНИЕ: Порядок параметров ВАЖЕН для hash!
@@ -266,134 +487,146 @@ def handler(event: dict, context) -> dict:
         elif skip_ftp:
             sftp_error = 'SFTP skipped (skip_ftp=true)'
         
-        # Обрабатываем каждый звонок с записью (с лимитом)
-        for call in recordings.get('data', []):
-            # Останавливаемся если достигли лимита
-            if synced_count >= max_per_run:
-                break
-            
-            link = call.get('link')  # ID файла записи
-            if not link:
-                no_recording_count += 1
-                continue  # Пропускаем звонки без записи
-            
-            recording_id = str(link)
-            call_id = call.get('linkedid', '')
-            phone_number = call.get('client', '')
-            call_date_str = call.get('calldate', '')  # Дата звонка из ZEON
-            
-            # talktime может быть строкой "00:00:05" или числом
-            talktime_raw = call.get('talktime', '0')
-            if isinstance(talktime_raw, str) and ':' in talktime_raw:
-                # Формат HH:MM:SS → секунды
-                parts = talktime_raw.split(':')
-                duration = int(parts[0]) * 3600 + int(parts[1]) * 60 + int(parts[2])
-            else:
-                duration = int(talktime_raw)
-            
-            # Проверяем, не синхронизирована ли уже эта запись
-            cursor.execute(
-                'SELECT id FROM zeon_recordings_sync WHERE recording_id = %s',
-                (recording_id,)
-            )
-            
-            if cursor.fetchone():
-                skipped_count += 1
-                continue
-            
+        # Собираем записи, которых ещё нет в zeon_recordings_sync
+        new_calls, skipped_count, no_recording_count = _new_calls(cursor, recordings.get('data', []))
+        candidates = []
+        for call in new_calls:
+            recording_id = str(call['link'])
             try:
-                # Пытаемся получить оригинальное имя файла из БД по linkedid
-                cursor.execute(
-                    'SELECT original_filename FROM call_recordings_mapping WHERE linkedid = %s',
-                    (call_id,)
-                )
-                mapping_result = cursor.fetchone()
-                
-                if mapping_result:
-                    # Используем оригинальное имя из AMI listener
-                    file_name = mapping_result[0]
-                    # Меняем расширение на .mp3 если нужно (ZEON отдает mp3)
-                    if file_name.endswith('.wav'):
-                        file_name = file_name.replace('.wav', '.mp3')
+                # talktime может быть строкой "00:00:05" или числом
+                talktime_raw = call.get('talktime', '0')
+                if isinstance(talktime_raw, str) and ':' in talktime_raw:
+                    # Формат HH:MM:SS → секунды
+                    parts = talktime_raw.split(':')
+                    duration = int(parts[0]) * 3600 + int(parts[1]) * 60 + int(parts[2])
                 else:
-                    # Fallback: генерируем имя как раньше
-                    if call_date_str:
-                        try:
-                            call_datetime = datetime.strptime(call_date_str, '%Y-%m-%d %H:%M:%S')
-                            timestamp = call_datetime.strftime('%Y%m%d_%H%M%S')
-                        except ValueError:
-                            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                    else:
-                        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                    
-                    file_name = f'{timestamp}_{call_id}_{phone_number}.mp3'
+                    duration = int(talktime_raw)
                 
-                file_size = 0
-                
-                # Скачиваем и загружаем только если не dry_run и SFTP доступен
-                if not dry_run and sftp:
-                    # Скачиваем файл записи через get-mp3
-                    # ВНИМАНИЕ: Порядок параметров ВАЖЕН для hash!
-                    from collections import OrderedDict
-                    file_params = OrderedDict([
-                        ('link', link),
-                        ('method', 'get-mp3'),
-                        ('topic', 'base')
-                    ])
-                    
-                    # MD5 авторизация от URL-encoded строки (RFC3986)
-                    from urllib.parse import quote
-                    query_string = urlencode(file_params, quote_via=quote)
-                    hash_string = query_string + zeon_api_key
-                    hash_value = hashlib.md5(hash_string.encode()).hexdigest()
-                    file_params['hash'] = hash_value
-                    
-                    file_response = requests.post(
-                        api_endpoint,
-                        data=file_params,
-                        timeout=120,
-                        stream=True
-                    )
-                    
-                    if file_response.status_code != 200:
-                        errors.append(f'Ошибка скачивания {recording_id}: {file_response.status_code}')
-                        continue
-                    
-                    # Загружаем на SFTP
-                    file_content = file_response.content
-                    file_size = len(file_content)
-                    
-                    remote_path = f'{sftp_path}/{file_name}'
-                    sftp.putfo(BytesIO(file_content), remote_path)
-                
-                # Сохраняем информацию о синхронизации в БД с датой звонка
-                # Преобразуем call_date_str в datetime объект для БД
-                call_datetime_obj = None
-                if call_date_str:
-                    try:
-                        call_datetime_obj = datetime.strptime(call_date_str, '%Y-%m-%d %H:%M:%S')
-                    except ValueError:
-                        pass
+                # Дата звонка из ZEON для БД
+                call_datetime_obj = _parse_calldate(call.get('calldate', ''))
                 
-                cursor.execute('''
+                candidates.append({
+                    'link': call['link'],
+                    'recording_id': recording_id,
+                    'call_id': call.get('linkedid', ''),
+                    'phone_number': call.get('client', ''),
+                    'duration': duration,
+                    'file_name': call['file_name'],
+                    'call_date': call_datetime_obj
+                })
+            except Exception as e:
+                errors.append(f'Ошибка обработки {recording_id}: {str(e)}')
+        
+        pending_rows = []
+        saved_ids = set()
+        failed_ids = set()
+        
+        def flush() -> int:
+            """Сохраняет накопленные строки синхронизации одной транзакцией; возвращает их число"""
+            if not pending_rows:
+                return 0
+            rows = list(pending_rows)
+            pending_rows.clear()
+            try:
+                execute_values(cursor, '''
                     INSERT INTO zeon_recordings_sync 
                     (recording_id, call_id, phone_number, duration, file_name, file_size, ftp_path, call_date)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                ''', (recording_id, call_id, phone_number, duration, file_name, file_size, f'{sftp_path}/{file_name}', call_datetime_obj))
+                    VALUES %s
+                    ON CONFLICT (recording_id) DO NOTHING
+                ''', rows)
                 conn.commit()
-                
-                synced_count += 1
-                
             except Exception as e:
-                errors.append(f'Ошибка обработки {recording_id}: {str(e)}')
-                continue
+                conn.rollback()
+                errors.append(f'Ошибка сохранения {len(rows)} записей в БД: {str(e)}')
+                return 0
+            saved_ids.update(row[0] for row in rows)
+            return len(rows)
+        
+        def record(candidate: dict, file_size: int) -> int:
+            """Добавляет строку синхронизации с датой звонка; пачка записывается по INSERT_BATCH_SIZE"""
+            pending_rows.append((
+                candidate['recording_id'], candidate['call_id'], candidate['phone_number'], candidate['duration'],
+                candidate['file_name'], file_size, f"{sftp_path}/{candidate['file_name']}", candidate['call_date']
+            ))
+            return flush() if len(pending_rows) >= INSERT_BATCH_SIZE else 0
+        
+        if not dry_run and sftp:
+            # Каждый перенос берёт свободный SFTP-канал; пока переносы идут, главный поток пишет результаты в БД
+            channels = queue.Queue()
+            channels.put(sftp)
+            for _ in range(SFTP_CHANNELS - 1):
+                try:
+                    channels.put(ssh.open_sftp())
+                except Exception as e:
+                    print(f'[ZEON] Дополнительный SFTP-канал не открыт: {e}')
+                    break
+            channel_count = channels.qsize()
+            
+            def transfer(candidate: dict) -> int | None:
+                # Не успеем перенести файл до конца бюджета — оставляем его следующему запуску
+                if time.monotonic() > budget_end - MIN_TRANSFER_SECONDS:
+                    return None
+                channel = channels.get()
+                try:
+                    return _transfer(api_endpoint, zeon_api_key, channel, candidate['link'],
+                                     f"{sftp_path}/{candidate['file_name']}", budget_end)
+                finally:
+                    channels.put(channel)
+            
+            with ThreadPoolExecutor(max_workers=channel_count) as executor:
+                futures = {executor.submit(transfer, candidate): candidate for candidate in candidates}
+                for future in as_completed(futures):
+                    candidate = futures[future]
+                    try:
+                        file_size = future.result()
+                        if file_size is None:
+                            deferred_count += 1
+                            continue
+                        synced_count += record(candidate, file_size)
+                    except TimeoutError:
+                        # Перенос прерван по окончании бюджета — это отложенная запись, а не ошибка
+                        deferred_count += 1
+                    except Exception as e:
+                        failed_ids.add(candidate['recording_id'])
+                        errors.append(f"Ошибка обработки {candidate['recording_id']}: {str(e)}")
+                synced_count += flush()
+            
+            while not channels.empty():
+                channels.get().close()
+        elif dry_run or skip_ftp:
+            for candidate in candidates[:NO_TRANSFER_LIMIT]:
+                record(candidate, 0)
+            synced_count += flush()
+            deferred_count = max(len(candidates) - NO_TRANSFER_LIMIT, 0)
+        else:
+            # SFTP недоступен: ничего не отмечаем, иначе записи будут считаться перенесёнными и потеряются
+            deferred_count = len(candidates)
+        
+        # Граница сдвигается только по результатам обычного запуска или сверки
+        if sync_mode in ('incremental', 'reconcile'):
+            # Границу держат только отложенные записи (не начатые, прерванные по времени, не сохранённые в БД);
+            # запись, перенос которой упал, подберёт сверка, иначе одна битая запись вернёт окно к 7 дням
+            pending = [
+                candidate for candidate in candidates
+                if candidate['recording_id'] not in saved_ids and candidate['recording_id'] not in failed_ids
+            ]
+            new_high_water = _next_high_water(high_water, recordings.get('data', []), pending)
+            try:
+                if new_high_water and new_high_water != high_water:
+                    _save_checkpoint(cursor, 'incremental', new_high_water)
+                # Сверка считается пройденной, когда всё найденное в полном окне перенесено
+                if sync_mode == 'reconcile' and not deferred_count:
+                    _save_checkpoint(cursor, 'reconcile', end_date)
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                errors.append(f'Ошибка сохранения контрольной точки: {str(e)}')
         
         if sftp:
             sftp.close()
         if ssh:
             ssh.close()
         cursor.close()
-        conn.close()
         
         total_calls = len(recordings.get('data', []))
         calls_with_recordings = sum(1 for call in recordings.get('data', []) if call.get('link'))
@@ -402,11 +635,14 @@ def handler(event: dict, context) -> dict:
             'success': True,
             'synced': synced_count,
             'skipped': skipped_count,
+            'deferred': deferred_count,
             'no_recording': no_recording_count,
             'errors': errors,
             'total_calls': total_calls,
             'calls_with_recordings': calls_with_recordings,
-            'message': f'Обработано {synced_count} из {calls_with_recordings} записей. Пропущено: {skipped_count} (уже синхронизированы), {no_recording_count} (без записи)'
+            'mode': sync_mode,
+            'window': {'start': params['start'], 'end': params['end']},
+            'message': f'Обработано {synced_count} из {calls_with_recordings} записей. Пропущено: {skipped_count} (уже синхронизированы), {no_recording_count} (без записи). Отложено до следующего запуска: {deferred_count}'
         }
         
         if sftp_error:
@@ -432,4 +668,7 @@ def handler(event: dict, context) -> dict:
                 'success': False,
                 'error': str(e)
             })
-        }
\ No newline at end of file
+        }
+    finally:
+        # Соединение возвращается в пул и при ранних ответах с ошибкой ZEON
+        release_connection(conn)
\ No newline at end of file
@@ -0,0 +1,17 @@
+-- Версии данных каталога для инвалидации кэша в тёплых контейнерах функций
+CREATE TABLE IF NOT EXISTS catalog_versions (
+    scope VARCHAR(50) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO catalog_versions (scope) VALUES
+    ('brands'),
+    ('services'),
+    ('models'),
+    ('prices'),
+    ('settings')
+ON CONFLICT (scope) DO NOTHING;
+
+COMMENT ON TABLE catalog_versions IS 'Счётчики изменений каталога: запись в таблицу области увеличивает version, и все реплики сбрасывают кэш';
+COMMENT ON COLUMN catalog_versions.scope IS 'Область данных: brands, services, models, prices, settings';
@@ -0,0 +1,6 @@
+-- Версии для отзывов, акций и блога: по ним строятся ETag публичных GET
+INSERT INTO catalog_versions (scope) VALUES
+    ('reviews'),
+    ('promotions'),
+    ('blog')
+ON CONFLICT (scope) DO NOTHING;
@@ -0,0 +1,12 @@
+-- Предсобранный сжатый снимок каталога для первой загрузки SPA
+CREATE TABLE IF NOT EXISTS catalog_snapshots (
+    name VARCHAR(50) PRIMARY KEY,
+    etag VARCHAR(64) NOT NULL,
+    payload_gzip BYTEA NOT NULL,
+    payload_size INTEGER NOT NULL,
+    built_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+COMMENT ON TABLE catalog_snapshots IS 'Снимки каталога (бренды, услуги, модели с тегами, цены, настройки), пересобираются при смене catalog_versions';
+COMMENT ON COLUMN catalog_snapshots.etag IS 'ETag снимка, построенный по версиям областей каталога';
+COMMENT ON COLUMN catalog_snapshots.payload_size IS 'Размер несжатого JSON в байтах';
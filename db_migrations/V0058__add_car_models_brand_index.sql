@@ -0,0 +1,2 @@
+-- Индекс для выборки моделей бренда (models-api GET ?brand_id=, get-brand-details)
+CREATE INDEX IF NOT EXISTS idx_car_models_brand_id ON car_models(brand_id);
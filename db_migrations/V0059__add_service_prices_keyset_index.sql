@@ -0,0 +1,2 @@
+-- Индекс для постраничной выдачи prices-api по ключу (brand_id, service_id, id)
+CREATE INDEX IF NOT EXISTS idx_service_prices_keyset ON service_prices(brand_id, service_id, id);
@@ -0,0 +1,32 @@
+-- Локальное зеркало телефонов контрагентов 1С для поиска клиента по номеру
+CREATE TABLE IF NOT EXISTS kontragent_phones (
+    phone_tail VARCHAR(10) NOT NULL,
+    kontragent_key VARCHAR(36) NOT NULL,
+    presentation TEXT DEFAULT '',
+    synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (phone_tail, kontragent_key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_kontragent_phones_kontragent_key ON kontragent_phones(kontragent_key);
+
+-- Версии объектов Catalog_Контрагенты: контактная информация перечитывается только при смене DataVersion
+CREATE TABLE IF NOT EXISTS kontragent_versions (
+    kontragent_key VARCHAR(36) PRIMARY KEY,
+    data_version VARCHAR(50) NOT NULL,
+    seen_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Состояние фоновой синхронизации: позиция текущего прохода по справочнику
+CREATE TABLE IF NOT EXISTS kontragent_sync_state (
+    name VARCHAR(50) PRIMARY KEY,
+    pass_offset INTEGER NOT NULL DEFAULT 0,
+    pass_started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_full_pass_at TIMESTAMP,
+    last_run_at TIMESTAMP
+);
+
+COMMENT ON TABLE kontragent_phones IS 'Последние 10 цифр телефонов из Catalog_Контрагенты_КонтактнаяИнформация';
+COMMENT ON COLUMN kontragent_phones.phone_tail IS 'Нормализованный хвост номера (последние 10 цифр)';
+COMMENT ON TABLE kontragent_versions IS 'DataVersion контрагентов 1С на момент последней синхронизации';
+COMMENT ON COLUMN kontragent_versions.seen_at IS 'Когда контрагент последний раз встречался при проходе по справочнику';
+COMMENT ON COLUMN kontragent_sync_state.last_full_pass_at IS 'Окончание последнего полного прохода; пока NULL, индекс считается неготовым';
@@ -0,0 +1,12 @@
+-- Кэш справочников 1С (маркетинговые программы, виды ремонта, марки и модели автомобилей)
+CREATE TABLE IF NOT EXISTS onec_reference_cache (
+    catalog VARCHAR(50) PRIMARY KEY,
+    payload JSONB NOT NULL DEFAULT '[]'::jsonb,
+    items_count INTEGER NOT NULL DEFAULT 0,
+    fetched_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    refreshing_since TIMESTAMP
+);
+
+COMMENT ON TABLE onec_reference_cache IS 'Справочники 1С, общие для всех функций; обновляются по TTL в фоне (stale-while-revalidate)';
+COMMENT ON COLUMN onec_reference_cache.payload IS 'Элементы справочника: Ref_Key, Description и поля, нужные функциям';
+COMMENT ON COLUMN onec_reference_cache.refreshing_since IS 'Когда одна из функций взялась обновлять справочник; защищает 1С от одновременных перезагрузок';
@@ -0,0 +1,21 @@
+-- Очередь отправки заявок в 1С (transactional outbox): запись создаётся в одной транзакции с заявкой
+CREATE TABLE IF NOT EXISTS onec_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    booking_id INTEGER NOT NULL REFERENCES bookings(id) ON DELETE CASCADE,
+    payload JSONB NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_at TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    processed_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_onec_outbox_due ON onec_outbox(next_attempt_at) WHERE status IN ('pending', 'processing');
+CREATE INDEX IF NOT EXISTS idx_onec_outbox_booking_id ON onec_outbox(booking_id);
+
+COMMENT ON TABLE onec_outbox IS 'Заявки, ожидающие отправки в 1С; разбирается функцией sync-1c-outbox';
+COMMENT ON COLUMN onec_outbox.status IS 'pending — ждёт отправки, processing — взята обработчиком, done — отправлена, failed — исчерпаны попытки';
+COMMENT ON COLUMN onec_outbox.payload IS 'Данные заявки для документа Document_ЗаявкаНаРемонт';
+COMMENT ON COLUMN onec_outbox.next_attempt_at IS 'Время следующей попытки (экспоненциальная задержка после ошибок)';
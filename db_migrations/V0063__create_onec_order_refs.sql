@@ -0,0 +1,16 @@
+-- Ссылка на документ Document_ЗаявкаНаРемонт в 1С: повторная отправка обновляет документ, не ища его в 1С
+ALTER TABLE bookings ADD COLUMN IF NOT EXISTS onec_ref_key VARCHAR(36);
+
+CREATE TABLE IF NOT EXISTS onec_order_refs (
+    booking_id INTEGER PRIMARY KEY REFERENCES bookings(id) ON DELETE CASCADE,
+    ref_key VARCHAR(36) NOT NULL,
+    source VARCHAR(20) NOT NULL DEFAULT 'created',
+    recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_onec_order_refs_ref_key ON onec_order_refs(ref_key);
+
+COMMENT ON COLUMN bookings.onec_ref_key IS 'Ref_Key документа Заявка на ремонт в 1С';
+COMMENT ON TABLE onec_order_refs IS 'Соответствие заявок сайта документам Document_ЗаявкаНаРемонт в 1С';
+COMMENT ON COLUMN onec_order_refs.source IS 'created — записан при создании документа, backfill — найден разовым проходом по 1С, search — найден поиском в 1С';
+COMMENT ON TABLE kontragent_sync_state IS 'Состояние фоновых проходов по 1С: kontragent_phones — индекс телефонов, order_refs — разовое заполнение onec_order_refs';
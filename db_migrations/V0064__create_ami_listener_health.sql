@@ -0,0 +1,19 @@
+-- Пульс слушателя Asterisk AMI: по нему видно, подключён ли слушатель и были ли пропуски между запусками
+CREATE TABLE IF NOT EXISTS ami_listener_health (
+    listener_id VARCHAR(100) PRIMARY KEY,
+    connected BOOLEAN NOT NULL DEFAULT FALSE,
+    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_heartbeat_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_event_at TIMESTAMP,
+    events_received BIGINT NOT NULL DEFAULT 0,
+    events_matched BIGINT NOT NULL DEFAULT 0,
+    mappings_saved BIGINT NOT NULL DEFAULT 0,
+    reconnects INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    last_gap_seconds INTEGER NOT NULL DEFAULT 0,
+    gap_seconds_total BIGINT NOT NULL DEFAULT 0
+);
+
+COMMENT ON TABLE ami_listener_health IS 'Состояние слушателей AMI: slices — запуски функции ami-listener, daemon:<host> — постоянный процесс';
+COMMENT ON COLUMN ami_listener_health.last_gap_seconds IS 'Сколько секунд никто не слушал AMI перед последним запуском (события MixMonitor за это время потеряны)';
+COMMENT ON COLUMN ami_listener_health.events_received IS 'События, полученные текущим запуском слушателя';
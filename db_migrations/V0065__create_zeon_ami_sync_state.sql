@@ -0,0 +1,12 @@
+-- Водяной знак zeon-ami-sync: до какой записи (mtime, имя файла) каталог АТС уже обработан
+CREATE TABLE IF NOT EXISTS zeon_ami_sync_state (
+    source_path VARCHAR(500) PRIMARY KEY,
+    watermark_mtime BIGINT NOT NULL DEFAULT 0,
+    watermark_filename VARCHAR(500) NOT NULL DEFAULT '',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_zeon_recordings_sync_file_name ON zeon_recordings_sync(file_name);
+
+COMMENT ON TABLE zeon_ami_sync_state IS 'Позиция инкрементального просмотра каталога записей Asterisk для zeon-ami-sync';
+COMMENT ON COLUMN zeon_ami_sync_state.watermark_mtime IS 'mtime последней записи, до которой все файлы перенесены или уже были в zeon_recordings_sync';
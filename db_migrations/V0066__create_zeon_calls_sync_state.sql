@@ -0,0 +1,10 @@
+-- Контрольные точки zeon-to-ftp: до какой даты звонка (calldate) список ZEON уже обработан
+-- и когда последний раз проходила сверка за полное окно
+CREATE TABLE IF NOT EXISTS zeon_calls_sync_state (
+    mode VARCHAR(20) PRIMARY KEY,
+    checkpoint TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+COMMENT ON TABLE zeon_calls_sync_state IS 'Инкрементальная выборка get-calls ZEON: incremental — граница по calldate, reconcile — время последней полной сверки';
+COMMENT ON COLUMN zeon_calls_sync_state.checkpoint IS 'Для incremental — calldate, до которого все записи перенесены; для reconcile — конец окна последней завершённой сверки';
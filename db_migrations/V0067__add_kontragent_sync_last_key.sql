@@ -0,0 +1,6 @@
+-- Проход по Catalog_Контрагенты продолжается с последнего обработанного Ref_Key, а не со смещения:
+-- новые и удалённые в 1С контрагенты не сдвигают позицию и не выпадают из индекса
+ALTER TABLE kontragent_sync_state ADD COLUMN IF NOT EXISTS pass_last_key VARCHAR(36);
+
+COMMENT ON COLUMN kontragent_sync_state.pass_last_key IS 'Последний обработанный Ref_Key текущего прохода; NULL — проход начинается сначала';
+COMMENT ON COLUMN kontragent_sync_state.pass_offset IS 'kontragent_phones — сколько контрагентов обработано в текущем проходе (статистика); order_refs — смещение разового прохода по документам';
@@ -0,0 +1,13 @@
+-- Неудачные попытки переноса записей zeon-ami-sync: файл, который раз за разом не копируется,
+-- после MAX_FILE_ATTEMPTS попыток пропускается водяным знаком и не останавливает синхронизацию
+CREATE TABLE IF NOT EXISTS zeon_ami_sync_failures (
+    source_path VARCHAR(500) NOT NULL,
+    file_name VARCHAR(500) NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (source_path, file_name)
+);
+
+COMMENT ON TABLE zeon_ami_sync_failures IS 'Файлы каталога записей Asterisk, перенос которых завершился ошибкой';
+COMMENT ON COLUMN zeon_ami_sync_failures.attempts IS 'Число неудачных попыток; после MAX_FILE_ATTEMPTS водяной знак проходит мимо файла, перенести его можно запуском с ?date=';
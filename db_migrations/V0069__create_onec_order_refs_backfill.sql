@@ -0,0 +1,22 @@
+-- Состояние разового заполнения onec_order_refs — отдельная таблица вместо служебной строки в kontragent_sync_state.
+-- Проход по Document_ЗаявкаНаРемонт продолжается с последнего Ref_Key, поэтому новые и удалённые документы
+-- не сдвигают позицию; незавершённый проход по смещению начинается заново
+CREATE TABLE IF NOT EXISTS onec_order_refs_backfill (
+    id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    last_key VARCHAR(36),
+    documents_seen INTEGER NOT NULL DEFAULT 0,
+    completed_at TIMESTAMP,
+    last_run_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO onec_order_refs_backfill (id, completed_at)
+SELECT 1, last_full_pass_at FROM kontragent_sync_state WHERE name = 'order_refs' AND last_full_pass_at IS NOT NULL
+ON CONFLICT (id) DO NOTHING;
+
+DELETE FROM kontragent_sync_state WHERE name = 'order_refs';
+
+COMMENT ON TABLE onec_order_refs_backfill IS 'Разовое заполнение onec_order_refs по документам 1С, созданным до появления таблицы (одна строка)';
+COMMENT ON COLUMN onec_order_refs_backfill.last_key IS 'Последний просмотренный Ref_Key документа; NULL — проход начинается сначала';
+COMMENT ON COLUMN onec_order_refs_backfill.completed_at IS 'Окончание прохода; пока NULL, заявки без ссылки ищутся в 1С';
+COMMENT ON TABLE kontragent_sync_state IS 'Состояние синхронизации локального индекса телефонов контрагентов (kontragent_phones)';
+COMMENT ON COLUMN kontragent_sync_state.pass_offset IS 'Сколько контрагентов обработано в текущем проходе (статистика)';